@@ -0,0 +1,101 @@
+from http.server import BaseHTTPRequestHandler
+from typing import Dict, Any, Optional
+from .generate import generate_batch, generate_merge, invalid_seed, log_debug
+import json
+import os
+import traceback
+
+# 单次请求的最多文档数，需保证整批在 vercel.json 的 maxDuration 内完成
+BATCH_MAX_DOCUMENTS = int(os.environ.get('HANDWRITE_BATCH_MAX_DOCUMENTS', '50'))
+
+
+def _json_response(status_code: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+    response_headers = {
+        "Content-Type": "application/json; charset=utf-8",
+        "Access-Control-Allow-Origin": "*"
+    }
+    response_headers.update(headers or {})
+    return {
+        "statusCode": status_code,
+        "body": json.dumps(payload, ensure_ascii=False),
+        "headers": response_headers
+    }
+
+
+def batch_handler(request: Dict[str, Any]) -> Dict[str, Any]:
+    """批量生成API
+
+    POST /api/batch  {"texts": [...], 其余字段同 /api/generate}
+    POST /api/batch  {"template": "拝啓 {{name}}様...", "recipients": [{"name": ...}, ...], "preview": false}
+    所有文档共用同一组设置，按输入顺序返回每篇文档的预览和G代码以及整批的吞吐量。
+    模板模式下固定部分的行只渲染一次；preview 为false时不生成预览。
+    """
+    try:
+        data = request.get('body') or {}
+        if isinstance(data, str):
+            data = json.loads(data)
+        if 'template' in data:
+            documents = data.get('recipients')
+            if not isinstance(data['template'], str) or not data['template']:
+                return _json_response(400, {"status": "error", "error": "empty_template", "message": "模板内容不能为空"})
+            if not isinstance(documents, list) or not documents or not all(isinstance(item, dict) for item in documents):
+                return _json_response(400, {"status": "error", "error": "invalid_recipients",
+                                            "message": "recipients必须是非空的对象列表"})
+        else:
+            documents = data.get('texts')
+            if not isinstance(documents, list) or not documents or not all(isinstance(text, str) for text in documents):
+                return _json_response(400, {"status": "error", "error": "invalid_texts",
+                                            "message": "texts必须是非空的字符串列表"})
+        if len(documents) > BATCH_MAX_DOCUMENTS:
+            return _json_response(413, {"status": "error", "error": "too_many_documents",
+                                        "message": f"单次最多 {BATCH_MAX_DOCUMENTS} 篇文档"})
+        if invalid_seed(data.get('seed')):
+            return _json_response(400, {"status": "error", "error": "invalid_seed", "message": "seed必须是不超过2^53-1的非负整数"})
+
+        if 'template' in data:
+            result = generate_merge(data['template'], documents, data, preview=bool(data.get('preview', True)))
+        else:
+            result = generate_batch(documents, data)
+        documents = []
+        for document in result["documents"]:
+            if document.get("success", False):
+                documents.append({
+                    "index": document["index"],
+                    "status": "success",
+                    "seed": document.get("seed"),
+                    "truncated": document.get("truncated", False),
+                    "previewBase64": document.get("previewBase64", []),
+                    "gcodeContent": document.get("gcodeContent", [])
+                })
+            else:
+                documents.append({"index": document["index"], "status": "error",
+                                  "message": document.get("error", "未知错误")})
+        return _json_response(200, {"status": "success", "documents": documents, "stats": result["stats"]})
+    except (ValueError, json.JSONDecodeError) as e:
+        return _json_response(400, {"status": "error", "error": "invalid_request", "message": "无效的请求格式",
+                                    "trace": str(e)})
+    except Exception as e:
+        log_debug(f"批量生成API错误: {str(e)}")
+        return _json_response(500, {"status": "error", "error": "batch_failed", "message": "批量生成失败",
+                                    "trace": traceback.format_exc()})
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        content_length = int(self.headers['Content-Length'])
+        post_data = self.rfile.read(content_length)
+        response = batch_handler({
+            'body': post_data.decode('utf-8'),
+            'headers': dict(self.headers),
+            'method': 'POST',
+            'path': self.path
+        })
+        self.send_response(response.get('statusCode', 200))
+        for header, value in response.get('headers', {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        if 'body' in response:
+            self.wfile.write(response['body'].encode('utf-8'))
+
+# 导出处理程序
+handler = Handler
@@ -10,12 +10,23 @@ import traceback
 from PIL import Image, ImageDraw, ImageFont, ImageFilter
 import numpy as np
 import random
+import re
 import math
 import functools
-from typing import Any, Dict, List, Tuple, Union
+import hashlib
+import mmap
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-# 调试信息
-DEBUG = True
+# 调试信息（HANDWRITE_DEBUG=0 关闭）
+DEBUG = os.environ.get('HANDWRITE_DEBUG', '1') != '0'
+# 运行环境诊断（目录列表、sys.path），开销较大，仅在排查部署问题时开启
+DEBUG_ENVIRONMENT = os.environ.get('HANDWRITE_DEBUG_ENV', '0') == '1'
 
 def log_debug(message):
     """记录调试信息"""
@@ -23,13 +34,498 @@ def log_debug(message):
         print(f"DEBUG: {message}")
         sys.stdout.flush()
 
-# 记录环境信息
-log_debug(f"当前工作目录: {os.getcwd()}")
-log_debug(f"目录内容: {os.listdir('.')}")
-log_debug(f"Python版本: {sys.version}")
-log_debug(f"Python路径: {sys.path}")
+
+def log_environment():
+    """记录环境信息"""
+    if not (DEBUG and DEBUG_ENVIRONMENT):
+        return
+    log_debug(f"当前工作目录: {os.getcwd()}")
+    log_debug(f"目录内容: {os.listdir('.')}")
+    log_debug(f"Python版本: {sys.version}")
+    log_debug(f"Python路径: {sys.path}")
+
+
+log_environment()
+
+# 字形笔画缓存配置（可通过环境变量调整）
+GLYPH_CACHE_SIZE = int(os.environ.get('HANDWRITE_GLYPH_CACHE_SIZE', '4096'))
+# 磁盘缓存目录，设置为空字符串时禁用磁盘缓存
+GLYPH_CACHE_DIR = os.environ.get('HANDWRITE_GLYPH_CACHE_DIR',
+                                 os.path.join(tempfile.gettempdir(), 'handwrite-glyphs'))
+# 批量提取时单张图集位图容纳的最多字符数（限制图集内存）
+GLYPH_BATCH_TILES = int(os.environ.get('HANDWRITE_GLYPH_BATCH_TILES', '256'))
+# 提取中心线笔画：栅格化的字形先经 Zhang-Suen 细化再追踪，设为0时沿用填充字形的轮廓追踪
+STROKE_CENTERLINE = os.environ.get('HANDWRITE_STROKE_CENTERLINE', '1') != '0'
+# 笔画提取算法版本，提取结果发生变化时递增，使旧的磁盘缓存、图集和响应缓存失效
+# （1为轮廓追踪，2为细化后的中心线）
+STROKE_FORMAT_VERSION = 2 if STROKE_CENTERLINE else 1
+
+
+@functools.lru_cache(maxsize=64)
+def _hash_file(path: str, size: int, mtime: float) -> str:
+    """计算文件的SHA-1（按路径、大小和修改时间缓存）"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def font_file_hash(font_path: Optional[str]) -> str:
+    """返回字体文件的哈希，无字体文件时返回'default'"""
+    if not font_path or not os.path.exists(font_path):
+        return 'default'
+    stat = os.stat(font_path)
+    return _hash_file(font_path, stat.st_size, stat.st_mtime)
+
+
+class LRUCache:
+    """线程安全的LRU缓存，并统计命中/未命中次数
+
+    max_bytes > 0 时另按 sizeof(value) 的总和淘汰，单个超过上限的值不缓存；
+    值的大小差别很大（例如整页G代码）时用它限制内存，而不只是条目数。
+    """
+
+    def __init__(self, max_size: int = 1024, max_bytes: int = 0,
+                 sizeof: Optional[Callable[[Any], int]] = None):
+        self.max_size = max(0, int(max_size))
+        self.max_bytes = max(0, int(max_bytes))
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._sizes: Dict[Any, int] = {}
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        if self.max_size == 0:
+            return
+        size = self.sizeof(value) if self.max_bytes and self.sizeof is not None else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            self.bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size or (self.max_bytes and self.bytes > self.max_bytes):
+                evicted, _ = self._data.popitem(last=False)
+                self.bytes -= self._sizes.pop(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._data), "maxSize": self.max_size, "bytes": self.bytes,
+                "maxBytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+
+class GlyphCache:
+    """字形笔画缓存：进程内LRU层 + 可选的磁盘层（/tmp）
+
+    键为 (字体文件哈希, char_size, 字符)，值为 get_font_strokes 的返回值
+    (contours, bbox)。缓存中的数组为只读，调用方不得修改。
+    """
+
+    def __init__(self, max_size: int = GLYPH_CACHE_SIZE, disk_dir: Optional[str] = GLYPH_CACHE_DIR):
+        self.memory = LRUCache(max_size)
+        self.disk_dir = disk_dir or None
+        self.disk_hits = 0
+
+    @staticmethod
+    def make_key(font_hash: str, char_size: int, char: str) -> Tuple[str, int, str]:
+        return (font_hash, int(char_size), char)
+
+    def _disk_path(self, key: Tuple[str, int, str]) -> str:
+        font_hash, char_size, char = key
+        name = '-'.join(f"{ord(c):x}" for c in char) + '.npz'
+        return os.path.join(self.disk_dir, f"v{STROKE_FORMAT_VERSION}", font_hash[:16], str(char_size), name)
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None or not self.disk_dir:
+            return value
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                points = data['points']
+                offsets = data['offsets']
+                bbox = tuple(int(v) for v in data['bbox'])
+        except Exception as e:
+            log_debug(f"读取字形磁盘缓存失败 {path}: {str(e)}")
+            return None
+        contours = np.split(points, offsets[1:-1]) if len(offsets) > 1 else []
+        value = (self._freeze(contours), bbox)
+        self.disk_hits += 1
+        self.memory.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """写入缓存，返回缓存中保存的（只读）值"""
+        contours, bbox = value
+        value = (self._freeze(contours), tuple(int(v) for v in bbox))
+        self.memory.put(key, value)
+        if self.disk_dir:
+            self._write_disk(key, value)
+        return value
+
+    def _write_disk(self, key, value) -> None:
+        contours, bbox = value
+        path = self._disk_path(key)
+        lengths = [len(c) for c in contours]
+        offsets = np.zeros(len(contours) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if contours:
+            points = np.concatenate(contours).astype(np.int32)
+        else:
+            points = np.zeros((0, 2), dtype=np.int32)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再原子替换，避免并发读到不完整的文件
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, points=points, offsets=offsets, bbox=np.array(bbox, dtype=np.int32))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log_debug(f"写入字形磁盘缓存失败 {path}: {str(e)}")
+
+    @staticmethod
+    def _freeze(contours: List[np.ndarray]) -> List[np.ndarray]:
+        frozen = []
+        for contour in contours:
+            contour = np.asarray(contour)
+            contour.setflags(write=False)
+            frozen.append(contour)
+        return frozen
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.memory.stats()
+        stats["diskHits"] = self.disk_hits
+        stats["diskDir"] = self.disk_dir
+        return stats
+
+
+# 进程级共享的字形缓存，热启动的请求可直接复用
+default_glyph_cache = GlyphCache()
+
+# 预编译笔画图集（由 scripts/build_stroke_atlas.py 生成）
+# 文件布局: 64字节头 + codepoints(uint32) + bboxes(int16 x4) + 字符->轮廓偏移(uint32)
+#           + 轮廓->点偏移(uint32) + 点坐标(int16 x2)，各段按8字节对齐
+ATLAS_MAGIC = b'HWSTRK01'
+ATLAS_HEADER = struct.Struct('<8s40sHHIII')
+ATLAS_HEADER_SIZE = 64
+# 图集目录，为空时在字体文件所在目录查找
+ATLAS_DIR = os.environ.get('HANDWRITE_ATLAS_DIR', '')
+
+
+def stroke_atlas_path(font_path: str, char_size: int, atlas_dir: Optional[str] = None) -> str:
+    """返回字体在指定字号下的图集文件路径"""
+    directory = atlas_dir or ATLAS_DIR or os.path.dirname(font_path)
+    stem = os.path.splitext(os.path.basename(font_path))[0]
+    return os.path.join(directory, f"{stem}.{int(char_size)}.strokes")
+
+
+def _align8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def write_stroke_atlas(path: str, font_hash: str, char_size: int,
+                       glyphs: Dict[str, Tuple[List[np.ndarray], Tuple[int, int, int, int]]]) -> None:
+    """将 {字符: (contours, bbox)} 写入紧凑的二进制图集"""
+    chars = sorted((c for c in glyphs if len(c) == 1), key=ord)
+    codepoints = np.array([ord(c) for c in chars], dtype='<u4')
+    bboxes = np.array([glyphs[c][1] for c in chars], dtype='<i2').reshape(-1, 4)
+    char_offsets = np.zeros(len(chars) + 1, dtype='<u4')
+    contour_lengths = []
+    for idx, c in enumerate(chars):
+        contours = glyphs[c][0]
+        char_offsets[idx + 1] = char_offsets[idx] + len(contours)
+        contour_lengths.extend(len(contour) for contour in contours)
+    contour_offsets = np.zeros(len(contour_lengths) + 1, dtype='<u4')
+    np.cumsum(contour_lengths, out=contour_offsets[1:])
+    all_contours = [np.asarray(contour) for c in chars for contour in glyphs[c][0]]
+    if all_contours:
+        points = np.concatenate(all_contours).astype('<i2')
+    else:
+        points = np.zeros((0, 2), dtype='<i2')
+
+    header = ATLAS_HEADER.pack(ATLAS_MAGIC, font_hash.encode('ascii')[:40].ljust(40, b'0'),
+                               STROKE_FORMAT_VERSION, int(char_size),
+                               len(chars), len(contour_lengths), len(points))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(ATLAS_HEADER_SIZE, b'\0'))
+        for array in (codepoints, bboxes, char_offsets, contour_offsets, points):
+            data = array.tobytes()
+            f.write(data)
+            f.write(b'\0' * (_align8(len(data)) - len(data)))
+    os.replace(tmp_path, path)
+
+
+class StrokeAtlas:
+    """内存映射的预编译笔画图集，按码位零拷贝返回轮廓"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, font_hash, version, char_size, n_chars, n_contours, n_points = \
+            ATLAS_HEADER.unpack_from(self._mmap, 0)
+        if magic != ATLAS_MAGIC:
+            raise ValueError(f"无效的笔画图集文件: {path}")
+        self.font_hash = font_hash.decode('ascii')
+        self.version = version
+        self.char_size = char_size
+
+        offset = ATLAS_HEADER_SIZE
+        sections = []
+        for dtype, shape in (('<u4', (n_chars,)), ('<i2', (n_chars, 4)), ('<u4', (n_chars + 1,)),
+                             ('<u4', (n_contours + 1,)), ('<i2', (n_points, 2))):
+            count = int(np.prod(shape))
+            array = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset).reshape(shape)
+            sections.append(array)
+            offset += _align8(array.nbytes)
+        self.codepoints, self.bboxes, self.char_offsets, self.contour_offsets, self.points = sections
+
+    def __len__(self) -> int:
+        return len(self.codepoints)
+
+    def lookup(self, char: str) -> Optional[Tuple[List[np.ndarray], Tuple[int, int, int, int]]]:
+        """查找字符，未收录时返回None"""
+        if len(char) != 1:
+            return None
+        code = ord(char)
+        idx = int(np.searchsorted(self.codepoints, code))
+        if idx >= len(self.codepoints) or self.codepoints[idx] != code:
+            return None
+        first, last = int(self.char_offsets[idx]), int(self.char_offsets[idx + 1])
+        bounds = self.contour_offsets[first:last + 1].tolist()
+        contours = [self.points[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+        return contours, tuple(int(v) for v in self.bboxes[idx])
+
+
+_stroke_atlases: Dict[Tuple[str, str, int], StrokeAtlas] = {}
+
+
+def _open_stroke_atlas(path: str, font_hash: str, char_size: int) -> Optional[StrokeAtlas]:
+    key = (path, font_hash, char_size)
+    if key in _stroke_atlases:
+        return _stroke_atlases[key]
+    if not os.path.exists(path):
+        return None
+    try:
+        atlas = StrokeAtlas(path)
+    except (OSError, ValueError, struct.error) as e:
+        log_debug(f"加载笔画图集失败 {path}: {str(e)}")
+        return None
+    if (atlas.font_hash != font_hash or atlas.char_size != char_size
+            or atlas.version != STROKE_FORMAT_VERSION):
+        log_debug(f"笔画图集与当前字体或版本不匹配，忽略: {path}")
+        return None
+    log_debug(f"已加载笔画图集: {path} ({len(atlas)} 字符)")
+    _stroke_atlases[key] = atlas
+    return atlas
+
+
+def load_stroke_atlas(font_path: Optional[str], char_size: int) -> Optional[StrokeAtlas]:
+    """加载与字体和字号匹配的图集（每个进程只映射一次），不存在时返回None"""
+    if not font_path or not os.path.exists(font_path):
+        return None
+    return _open_stroke_atlas(stroke_atlas_path(font_path, char_size),
+                              font_file_hash(font_path), int(char_size))
+
+# 8邻域追踪方向（行偏移, 列偏移），顺序决定轮廓点的输出顺序
+TRACE_DIRECTIONS = ((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1))
+
+
+def trace_contours(binary: np.ndarray, min_length: int = 3) -> List[np.ndarray]:
+    """从二值图像中按光栅顺序追踪轮廓，返回 [[x, y], ...] 点列表
+
+    只遍历前景像素：邻接关系由平移后的索引图一次性构建，连通域标记用于
+    跳过像素数不足 min_length 的连通域（追踪不会跨越连通域）。
+    输出与逐像素扫描 + 8邻域贪心追踪的结果完全一致。
+    """
+    binary = np.asarray(binary, dtype=bool)
+    rows, cols = np.nonzero(binary)  # 行优先，即原扫描顺序
+    count = len(rows)
+    if count < min_length:
+        return []
+
+    # 前景像素索引图（四周填充-1），平移后得到每个像素在各方向上的邻居
+    height, width = binary.shape
+    index = np.full((height + 2, width + 2), -1, dtype=np.int64)
+    index[rows + 1, cols + 1] = np.arange(count)
+    neighbours = np.stack([index[1 + di:height + 1 + di, 1 + dj:width + 1 + dj][rows, cols]
+                           for di, dj in TRACE_DIRECTIONS], axis=1)
+
+    # 连通域标记：最小标签传播 + 指针跳跃
+    labels = np.arange(count)
+    padded = np.append(labels, count)
+    while True:
+        padded[:count] = labels
+        updated = np.minimum(labels, padded[neighbours].min(axis=1))
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    sizes = np.bincount(labels, minlength=count)
+
+    visited = (sizes[labels] < min_length).tolist()
+    neighbour_lists = neighbours.tolist()
+    points = np.stack([cols, rows], axis=1)
+    contours = []
+    for start in range(count):
+        if visited[start]:
+            continue
+        path = []
+        current = start
+        dir_idx = 0
+        while True:
+            visited[current] = True
+            path.append(current)
+            candidates = neighbour_lists[current]
+            for _ in range(8):
+                nxt = candidates[dir_idx]
+                if nxt >= 0 and not visited[nxt]:
+                    break
+                dir_idx = (dir_idx + 1) % 8
+            else:
+                break
+            current = nxt
+        if len(path) >= min_length:
+            contours.append(points[path])
+    return contours
+
+
+# 细化用的8邻域（P2..P9，自正上方起顺时针）及其在邻域编码中的位权
+THIN_NEIGHBOURS = ((-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1))
+
+
+def _build_thinning_tables() -> Tuple[np.ndarray, np.ndarray]:
+    """预计算 Zhang-Suen 两个子迭代的删除判定表（按8位邻域编码索引）"""
+    tables = (np.zeros(256, dtype=bool), np.zeros(256, dtype=bool))
+    for code in range(256):
+        p = [(code >> k) & 1 for k in range(8)]  # p[0]=P2 ... p[7]=P9
+        neighbours = sum(p)
+        transitions = sum(p[k] == 0 and p[(k + 1) % 8] == 1 for k in range(8))
+        if not (2 <= neighbours <= 6 and transitions == 1):
+            continue
+        p2, p4, p6, p8 = p[0], p[2], p[4], p[6]
+        tables[0][code] = p2 * p4 * p6 == 0 and p4 * p6 * p8 == 0
+        tables[1][code] = p2 * p4 * p8 == 0 and p2 * p6 * p8 == 0
+    return tables
+
+
+THINNING_TABLES = _build_thinning_tables()
+
+
+def zhang_suen_thin(binary: np.ndarray) -> np.ndarray:
+    """Zhang-Suen 细化，返回单像素宽的中心线骨架
+
+    每个子迭代对整幅图像一次性计算邻域编码（平移数组加权求和），
+    再查表得出可删除的像素，不依赖 OpenCV / scikit-image。
+    """
+    binary = np.asarray(binary, dtype=bool)
+    skeleton = np.zeros_like(binary)
+    rows = np.flatnonzero(binary.any(axis=1))
+    cols = np.flatnonzero(binary.any(axis=0))
+    if len(rows) == 0:
+        return skeleton
+    # 只处理前景的外接矩形区域
+    top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    img = np.pad(binary[top:bottom, left:right], 1).astype(np.uint8)
+    height, width = img.shape[0] - 2, img.shape[1] - 2
+    inner = img[1:-1, 1:-1]
+    code = np.empty((height, width), dtype=np.uint8)
+    changed = True
+    while changed:
+        changed = False
+        for table in THINNING_TABLES:
+            code[...] = 0
+            for bit, (di, dj) in enumerate(THIN_NEIGHBOURS):
+                code |= img[1 + di:height + 1 + di, 1 + dj:width + 1 + dj] << bit
+            removable = table[code] & (inner == 1)
+            if removable.any():
+                inner[removable] = 0
+                changed = True
+    skeleton[top:bottom, left:right] = inner
+    return skeleton
+
+
+def extract_strokes(binary: np.ndarray) -> List[np.ndarray]:
+    """从二值化的字形位图提取笔画（STROKE_CENTERLINE 时先细化为中心线）"""
+    if STROKE_CENTERLINE:
+        binary = zhang_suen_thin(binary)
+    return trace_contours(binary)
+
 
 # 集成 StrokeWriter 类
+# API接受的字体大小范围
+FONT_SIZE_MIN = 6
+FONT_SIZE_MAX = 12
+# 启动时预加载所有字号的字体（HANDWRITE_PRELOAD_FONTS=1）
+PRELOAD_FONTS = os.environ.get('HANDWRITE_PRELOAD_FONTS', '0') == '1'
+
+
+class FontManager:
+    """按 (字体路径, 像素大小) 缓存已加载的字体
+
+    每个组合在进程内只解析一次，所有生成器实例和线程共享。
+    font_path 为None时返回Pillow的默认字体。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fonts: Dict[Tuple[Optional[str], int], Any] = {}
+        self.loads = 0
+
+    def get(self, font_path: Optional[str], size: int):
+        key = (font_path, int(size))
+        font = self._fonts.get(key)
+        if font is None:
+            with self._lock:
+                font = self._fonts.get(key)
+                if font is None:
+                    if font_path is None:
+                        font = ImageFont.load_default()
+                    else:
+                        log_debug(f"加载字体: {font_path} ({size})")
+                        font = ImageFont.truetype(font_path, int(size))
+                    self._fonts[key] = font
+                    self.loads += 1
+        return font
+
+    def preload(self, font_path: Optional[str], font_sizes=range(FONT_SIZE_MIN, FONT_SIZE_MAX + 1)) -> None:
+        """预加载各字号对应的字体（生成器按 font_size * 10 像素加载）"""
+        for font_size in font_sizes:
+            self.get(font_path, font_size * 10)
+
+    def __len__(self) -> int:
+        return len(self._fonts)
+
+
 class StrokeWriter:
     def __init__(self):
         # A4レイアウト設定（mm単位）
@@ -90,7 +586,7 @@ class StrokeWriter:
         img_size = (self.char_size*2, self.char_size*2)
         image = Image.new('L', img_size, 255)
         draw = ImageDraw.Draw(image)
-        font = ImageFont.truetype(font_path, self.char_size)
+        font = get_runtime().fonts.get(font_path, self.char_size)
         
         bbox = draw.textbbox((0,0), char, font=font)
         text_width = bbox[2] - bbox[0]
@@ -112,68 +608,25 @@ class StrokeWriter:
         return contours, (x,y,text_width,text_height)
 
     def skeletonize(self, binary):
-        """简化版的骨架化算法"""
-        skeleton = binary.copy()
-        while True:
-            eroded = self.erode(skeleton)
-            if np.all(eroded == 0):
-                break
-            skeleton = eroded
-        return skeleton
+        """骨架化（Zhang-Suen 细化）"""
+        return zhang_suen_thin(binary)
 
     def erode(self, img):
-        """简化版的腐蚀操作"""
-        kernel = np.ones((3,3), dtype=np.uint8)
+        """3x3 腐蚀操作（边界像素始终为0）"""
+        img = np.asarray(img)
         eroded = np.zeros_like(img)
-        for i in range(1, img.shape[0]-1):
-            for j in range(1, img.shape[1]-1):
-                if img[i,j] and np.all(img[i-1:i+2, j-1:j+2] * kernel):
-                    eroded[i,j] = 1
+        if img.shape[0] < 3 or img.shape[1] < 3:
+            return eroded
+        mask = img[1:-1, 1:-1].astype(bool)
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                mask &= img[1 + di:img.shape[0] - 1 + di, 1 + dj:img.shape[1] - 1 + dj].astype(bool)
+        eroded[1:-1, 1:-1] = mask
         return eroded
 
     def find_contours(self, binary):
-        """简化版的轮廓提取"""
-        contours = []
-        visited = np.zeros_like(binary, dtype=bool)
-        
-        for i in range(binary.shape[0]):
-            for j in range(binary.shape[1]):
-                if binary[i,j] and not visited[i,j]:
-                    contour = self.trace_contour(binary, visited, i, j)
-                    if len(contour) > 2:
-                        contours.append(np.array(contour))
-        
-        return contours
-
-    def trace_contour(self, binary, visited, start_i, start_j):
-        """追踪单个轮廓"""
-        contour = []
-        i, j = start_i, start_j
-        directions = [(0,1), (1,1), (1,0), (1,-1), (0,-1), (-1,-1), (-1,0), (-1,1)]
-        dir_idx = 0
-        
-        while True:
-            if visited[i,j]:
-                break
-            visited[i,j] = True
-            contour.append([j,i])  # 注意坐标顺序
-            
-            # 寻找下一个点
-            found = False
-            for _ in range(8):
-                di, dj = directions[dir_idx]
-                ni, nj = i + di, j + dj
-                if 0 <= ni < binary.shape[0] and 0 <= nj < binary.shape[1]:
-                    if binary[ni,nj] and not visited[ni,nj]:
-                        i, j = ni, nj
-                        found = True
-                        break
-                dir_idx = (dir_idx + 1) % 8
-            
-            if not found:
-                break
-        
-        return contour
+        """轮廓提取"""
+        return trace_contours(binary)
 
     def get_random_spacing(self, char_width=None):
         """生成与字符大小成比例的随机字符间距"""
@@ -221,12 +674,703 @@ class StrokeWriter:
         
         return stroke_commands
 
+# 种子限制在53位以内，保证经JSON传给前端后仍能精确回传
+SEED_MASK = (1 << 53) - 1
+
+
+def derive_seed(*parts) -> int:
+    """由任意多个部分派生出确定的种子"""
+    digest = hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little') & SEED_MASK
+
+
+# 预览图像参数
+PREVIEW_DPI = 72
+PREVIEW_DPI_MIN = 36
+PREVIEW_DPI_MAX = 300
+# 抗锯齿模式下的超采样倍数
+PREVIEW_SUPERSAMPLE = 2
+
+# 纸张尺寸（单位：毫米）
+PAPER_SIZES = {
+    'A4': (210, 297),
+    'A5': (148, 210),
+    'B5': (176, 250)
+}
+
+# 页面渲染的并行进程数（1 表示在当前进程内串行渲染）
+RENDER_WORKERS = int(os.environ.get('HANDWRITE_RENDER_WORKERS', '1'))
+
+# 增量模式下的行排版缓存和页面输出缓存容量（条目数和总字节数）
+LAYOUT_CACHE_SIZE = int(os.environ.get('HANDWRITE_LAYOUT_CACHE_SIZE', '4096'))
+LAYOUT_CACHE_MAX_BYTES = int(os.environ.get('HANDWRITE_LAYOUT_CACHE_MAX_BYTES', str(8 << 20)))
+PAGE_CACHE_SIZE = int(os.environ.get('HANDWRITE_PAGE_CACHE_SIZE', '12'))
+# 一页G代码可达数MB，页面缓存主要按总大小限制
+PAGE_CACHE_MAX_BYTES = int(os.environ.get('HANDWRITE_PAGE_CACHE_MAX_BYTES', str(24 << 20)))
+# 排版结果中每个字形 (字符, x, y) 元组占用的大致字节数
+LAYOUT_GLYPH_BYTES = 160
+
+
+def layout_payload_bytes(result: Tuple[Tuple[Tuple, ...], float]) -> int:
+    """一行排版结果占用的大致字节数"""
+    segments, _ = result
+    return 64 + sum(len(segment) for segment in segments) * LAYOUT_GLYPH_BYTES
+
+
+def page_payload_bytes(page: Dict[str, Any]) -> int:
+    """一页输出占用的大致字节数（预览PNG、G代码与二进制笔画）"""
+    return len(page.get("previewPng") or b'') + len(page["gcodeContent"]) + len(page.get("strokes") or b'')
+
+
+# 进程级共享：键 (排版参数, 种子, 行内容, 起始y) -> (按页分段的字形, 结束y)
+default_layout_cache = LRUCache(LAYOUT_CACHE_SIZE, LAYOUT_CACHE_MAX_BYTES, layout_payload_bytes)
+# 键为页面内容哈希 -> {"page", "previewPng", "gcodeContent", "strokes"}
+default_page_cache = LRUCache(PAGE_CACHE_SIZE, PAGE_CACHE_MAX_BYTES, page_payload_bytes)
+
+
+class StrokePage:
+    """单页笔画模型
+
+    所有笔画点以页面毫米坐标（左上角为原点，Y轴向下）连续存储在一个
+    (N, 2) float64 数组中，offsets[k]:offsets[k+1] 为第k条笔画的点。
+    G代码文本只在最终序列化时生成。
+    """
+
+    def __init__(self):
+        self._pending: List[np.ndarray] = []
+        self._points = np.zeros((0, 2), dtype=np.float64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+
+    def add_stroke(self, points: np.ndarray) -> None:
+        """追加一条笔画，少于2个点的笔画被忽略"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) >= 2:
+            self._pending.append(points)
+
+    def _consolidate(self) -> None:
+        if not self._pending:
+            return
+        lengths = [len(points) for points in self._pending]
+        offsets = np.empty(len(self._offsets) + len(lengths), dtype=np.int64)
+        offsets[:len(self._offsets)] = self._offsets
+        np.cumsum(lengths, out=offsets[len(self._offsets):])
+        offsets[len(self._offsets):] += self._offsets[-1]
+        self._points = np.concatenate([self._points] + self._pending)
+        self._offsets = offsets
+        self._pending = []
+
+    @property
+    def points(self) -> np.ndarray:
+        self._consolidate()
+        return self._points
+
+    @property
+    def offsets(self) -> np.ndarray:
+        self._consolidate()
+        return self._offsets
+
+    def strokes(self):
+        """按顺序迭代每条笔画的点（视图，不复制）"""
+        points, offsets = self.points, self.offsets
+        for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+            yield points[start:end]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def point_count(self) -> int:
+        return len(self.points)
+
+    def endpoints(self) -> Tuple[np.ndarray, np.ndarray]:
+        """每条笔画的起点和终点，均为 (笔画数, 2) 数组"""
+        points, offsets = self.points, self.offsets
+        return points[offsets[:-1]], points[offsets[1:] - 1]
+
+    @classmethod
+    def concatenate(cls, pages: List['StrokePage']) -> 'StrokePage':
+        """按顺序拼接多个笔画模型"""
+        page = cls()
+        pages = [part for part in pages if len(part)]
+        if not pages:
+            return page
+        page._points = np.concatenate([part.points for part in pages])
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for part in pages:
+            offsets.append(part.offsets[1:] + base)
+            base += part.point_count
+        page._offsets = np.concatenate(offsets)
+        return page
+
+    def reordered(self, order: np.ndarray, reverse: np.ndarray) -> 'StrokePage':
+        """按新的顺序和方向返回笔画模型，reverse[k] 为True时第k条（新顺序）反向书写"""
+        points, offsets = self.points, self.offsets
+        starts, ends = offsets[:-1][order], offsets[1:][order]
+        lengths = ends - starts
+        # 每个输出点在原点数组中的下标：正向为 start + i，反向为 end - 1 - i
+        step = np.where(reverse, -1, 1)
+        first = np.where(reverse, ends - 1, starts)
+        new_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_offsets[1:])
+        within = np.arange(new_offsets[-1]) - np.repeat(new_offsets[:-1], lengths)
+        index = np.repeat(first, lengths) + np.repeat(step, lengths) * within
+        page = StrokePage()
+        page._points = points[index]
+        page._offsets = new_offsets
+        return page
+
+
+# 折线简化的容差（毫米），0 表示不简化
+SIMPLIFY_TOLERANCE = float(os.environ.get('HANDWRITE_SIMPLIFY_TOLERANCE', '0.5'))
+
+
+def simplify_mask(points: np.ndarray, offsets: np.ndarray, tolerance: float) -> np.ndarray:
+    """Ramer-Douglas-Peucker 折线简化，一次处理所有折线，返回各点是否保留
+
+    每轮对所有待处理区间同时计算内部点到弦的距离，距离最大且超过容差的点保留
+    并将区间一分为二，直到没有需要拆分的区间。折线的起点和终点总是保留。
+    """
+    keep = np.zeros(len(points), dtype=bool)
+    keep[offsets[:-1]] = True
+    keep[offsets[1:] - 1] = True
+    
+    starts, ends = offsets[:-1].copy(), offsets[1:] - 1
+    while True:
+        interior = ends - starts - 1
+        active = interior > 0
+        starts, ends, interior = starts[active], ends[active], interior[active]
+        if len(starts) == 0:
+            break
+        # 所有区间的内部点下标及其所属区间
+        segment = np.repeat(np.arange(len(starts)), interior)
+        bounds = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(interior, out=bounds[1:])
+        index = np.arange(bounds[-1]) - bounds[:-1][segment] + starts[segment] + 1
+        
+        a = points[starts][segment]
+        chord = points[ends][segment] - a
+        offset = points[index] - a
+        norm = np.hypot(chord[:, 0], chord[:, 1])
+        distance = np.where(
+            norm > 0,
+            np.abs(chord[:, 0] * offset[:, 1] - chord[:, 1] * offset[:, 0]) / np.where(norm > 0, norm, 1),
+            np.hypot(offset[:, 0], offset[:, 1]))
+        
+        # 每个区间距离最大的第一个点
+        farthest = np.maximum.reduceat(distance, bounds[:-1])
+        candidates = np.nonzero(distance == farthest[segment])[0]
+        _, first = np.unique(segment[candidates], return_index=True)
+        split_at = candidates[first]
+        split = farthest > tolerance
+        middle = index[split_at[split]]
+        keep[middle] = True
+        starts, ends = np.concatenate([starts[split], middle]), np.concatenate([middle, ends[split]])
+    return keep
+
+
+def simplify_strokes(page: StrokePage, tolerance: float) -> StrokePage:
+    """对整页所有笔画做折线简化（见 simplify_mask），笔画的起点和终点总是保留"""
+    points, offsets = page.points, page.offsets
+    if tolerance <= 0 or len(page) == 0:
+        return page
+    keep = simplify_mask(points, offsets, tolerance)
+    kept = np.add.reduceat(keep, offsets[:-1])
+    simplified = StrokePage()
+    simplified._points = points[keep]
+    simplified._offsets = np.zeros(len(offsets), dtype=np.int64)
+    np.cumsum(kept, out=simplified._offsets[1:])
+    return simplified
+
+
+def fixed3(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """将浮点数组按 f"{v:.3f}" 的结果拆分为 (是否带负号, 整数部分, 三位小数)
+
+    先按千分之一取整为整数；v*1000 距离 .5 过近时，浮点乘法误差可能改变舍入方向，
+    这些值退回 Python 的格式化结果。负数（包括舍入为0的负数和 -0.0）保留负号。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    scaled = np.abs(values) * 1000
+    fixed = np.rint(scaled).astype(np.int64)
+    negative = np.signbit(values)
+    integer, fraction = fixed // 1000, fixed % 1000
+    for index in np.nonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)[0].tolist():
+        text = f"{values[index]:.3f}"
+        digits, decimals = text.lstrip('-').split('.')
+        negative[index] = text.startswith('-')
+        integer[index], fraction[index] = int(digits), int(decimals)
+    return negative, integer, fraction
+
+
+def fixed3_bytes(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """把 f"{v:.3f}" 的字符写入定宽字节矩阵，返回 (字符, 有效位遮罩)
+
+    每行依次为 [负号][整数各位（高位在前）][.][三位小数]，未使用的位置由遮罩标记。
+    """
+    negative, integer, fraction = fixed3(values)
+    width = len(str(int(integer.max()))) if len(integer) else 1
+    chars = np.empty((len(integer), width + 5), dtype=np.uint8)
+    mask = np.ones(chars.shape, dtype=bool)
+    chars[:, 0] = ord('-')
+    mask[:, 0] = negative
+    for position in range(width):
+        power = 10 ** (width - 1 - position)
+        chars[:, 1 + position] = ord('0') + integer // power % 10
+        # 去掉前导零，个位总是保留
+        mask[:, 1 + position] = (integer >= power) | (power == 1)
+    chars[:, width + 1] = ord('.')
+    chars[:, width + 2] = ord('0') + fraction // 100
+    chars[:, width + 3] = ord('0') + fraction // 10 % 10
+    chars[:, width + 4] = ord('0') + fraction % 10
+    return chars, mask
+
+
+def gcode_body_bytes(x_pos: np.ndarray, y_pos: np.ndarray, offsets: np.ndarray, move_speed: int,
+                     pen_down_z: float, pen_up_z: float, pen_speed: int,
+                     arcs: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    """将中心坐标的笔画点序列化为G代码字节（每行以换行符结尾）
+
+    数字与固定文本按列写入一个字节矩阵，按遮罩取出有效字符即为整段文本，
+    输出与逐点格式化 f"{v:.3f}" 完全一致。arcs 为 (每点的指令 1/2/3, I, J) 时，
+    指令为2/3的点输出为 G2/G3 圆弧，附带相对上一点的圆心 I/J。
+    """
+    x_chars, x_mask = fixed3_bytes(x_pos)
+    y_chars, y_mask = fixed3_bytes(y_pos)
+
+    # 每个点一行：G0（笔画首点）或 G1，首点之后追加落笔行，末点之后追加抬笔行
+    count = len(x_pos)
+    first = np.zeros(count, dtype=bool)
+    first[offsets[:-1]] = True
+    last = np.zeros(count, dtype=bool)
+    last[offsets[1:] - 1] = True
+
+    def literal(text: str, rows: Optional[np.ndarray] = None):
+        # 常量文本：每行相同，rows 为 None 时所有行都输出
+        encoded = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+        shape = (count, len(encoded))
+        mask = np.ones(shape, dtype=bool) if rows is None else np.broadcast_to(rows[:, None], shape)
+        return np.broadcast_to(encoded, shape), mask
+
+    digits = np.ones(count, dtype=np.int64) if arcs is None else arcs[0]
+    command = np.where(first, ord('0'), ord('0') + digits).astype(np.uint8)[:, None]
+    columns = [
+        literal("G"),
+        (command, np.ones(command.shape, dtype=bool)),
+        literal(" X"),
+        (x_chars, x_mask),
+        literal(" Y"),
+        (y_chars, y_mask)
+    ]
+    if arcs is not None:
+        arc_rows = (digits > 1) & ~first
+        i_chars, i_mask = fixed3_bytes(arcs[1])
+        j_chars, j_mask = fixed3_bytes(arcs[2])
+        columns += [
+            literal(" I", arc_rows),
+            (i_chars, i_mask & arc_rows[:, None]),
+            literal(" J", arc_rows),
+            (j_chars, j_mask & arc_rows[:, None])
+        ]
+    columns += [
+        literal(f" F{move_speed}\n"),
+        literal(f"G1 G90 Z{pen_down_z} F{pen_speed}\n", first),
+        literal(f"G1 G90 Z{pen_up_z} F{pen_speed}\n", last)
+    ]
+    chars, mask = zip(*columns)
+    return np.concatenate(chars, axis=1)[np.concatenate(mask, axis=1)]
+
+
+def gcode_header_lines(margin_left: Union[int, float], margin_top: Union[int, float]) -> List[str]:
+    """每页G代码的初始化指令"""
+    return [
+        "G21 ; 设置单位为毫米",
+        "G90 ; 使用绝对坐标",
+        "G92 X0 Y0 Z0 ; 设置当前位置为原点",
+        "G1 Z5 F1000 ; 抬起笔",
+        f"G1 X{margin_left} Y{margin_top} F3000 ; 移动到起始位置"
+    ]
+
+
+# 圆弧拟合容差（毫米），0 表示只输出直线段 G1
+ARC_TOLERANCE = float(os.environ.get('HANDWRITE_ARC_TOLERANCE', '0'))
+# 半径超过该值的圆弧按直线处理
+ARC_MAX_RADIUS = 500.0
+# 圆弧上相邻两点之间的最大圆心角（弧度），折线在一段内急转（拐角）时不拟合为圆弧
+ARC_MAX_SEGMENT_ANGLE = math.pi / 4
+# 一条圆弧最多覆盖的点数，限制每轮候选区间的规模
+ARC_MAX_POINTS = 64
+# 先用这些位置（区间长度的八分之几）的点粗筛候选区间，再逐点检查剩下的
+ARC_PROBES = (1, 2, 3, 5, 6, 7)
+
+
+def fit_arc_spans(x: np.ndarray, y: np.ndarray, offsets: np.ndarray,
+                  tolerance: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """在所有折线（中心坐标，Y轴向上）中贪心地查找圆弧，一次处理整页
+
+    返回 (起点下标, 终点下标, 圆心x, 圆心y, 是否顺时针)，未被圆弧覆盖的部分为直线段。
+    每轮对所有折线的当前点同时尝试全部候选终点，取能用一条圆弧覆盖的最远点
+    （至少覆盖三个点），找不到时当前点前进一个点。短的跨度失败不代表长的跨度也失败
+    （例如像素阶梯的三个点构成直角，更长的一段却贴合圆弧），所以不能在第一次失败时停止。
+
+    圆过首、中、末三点。只检查点在圆上还不够（任意不共线的三点都在某个圆上），
+    还要求折线与圆弧的偏差不超过容差：点到圆的最大距离加上各线段与对应弧段之间的
+    最大距离（弓高 r(1 - cos(θ/2))）。角度须沿同一方向单调变化，
+    且每段的圆心角不超过 ARC_MAX_SEGMENT_ANGLE，拐角不会被拟合为大圆弧。
+    """
+    found = []
+    stops = offsets[1:] - 1
+    current = offsets[:-1].copy()
+    active = np.nonzero(stops - current >= 2)[0]
+    while len(active):
+        # 每条折线当前点的所有候选终点
+        first, last = current[active], np.minimum(stops[active], current[active] + ARC_MAX_POINTS - 1)
+        counts = last - first - 1
+        owner = np.repeat(np.arange(len(active)), counts)
+        bounds = np.zeros(len(active) + 1, dtype=np.int64)
+        np.cumsum(counts, out=bounds[1:])
+        start = first[owner]
+        end = np.arange(bounds[-1]) - bounds[:-1][owner] + start + 2
+        middle = (start + end) // 2
+
+        # 过首、中、末三点的圆
+        x0, y0, x1, y1, x2, y2 = x[start], y[start], x[middle], y[middle], x[end], y[end]
+        d = 2 * (x0 * (y1 - y2) + x1 * (y2 - y0) + x2 * (y0 - y1))
+        valid = np.abs(d) >= 1e-12
+        d = np.where(valid, d, 1)
+        s0, s1, s2 = x0 * x0 + y0 * y0, x1 * x1 + y1 * y1, x2 * x2 + y2 * y2
+        cx = (s0 * (y1 - y2) + s1 * (y2 - y0) + s2 * (y0 - y1)) / d
+        cy = (s0 * (x2 - x1) + s1 * (x0 - x2) + s2 * (x1 - x0)) / d
+        r = np.hypot(x0 - cx, y0 - cy)
+        valid &= r <= ARC_MAX_RADIUS
+        for eighth in ARC_PROBES:
+            probe = start + (end - start) * eighth // 8
+            valid &= np.abs(np.hypot(x[probe] - cx, y[probe] - cy) - r) <= tolerance
+        candidates = np.nonzero(valid)[0]
+        owner, start, end = owner[candidates], start[candidates], end[candidates]
+        cx, cy, r = cx[candidates], cy[candidates], r[candidates]
+
+        # 逐点检查粗筛后剩下的区间
+        lengths = end - start + 1
+        span = np.repeat(np.arange(len(candidates)), lengths)
+        span_bounds = np.zeros(len(candidates) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=span_bounds[1:])
+        index = np.arange(span_bounds[-1]) - span_bounds[:-1][span] + start[span]
+        dx, dy = x[index] - cx[span], y[index] - cy[span]
+        fits = np.zeros(len(candidates), dtype=bool)
+        clockwise = fits
+        if len(candidates):
+            radial = np.maximum.reduceat(np.abs(np.hypot(dx, dy) - r[span]), span_bounds[:-1])
+            # 相邻半径向量之间的转角，去掉跨越两个区间的项
+            steps = np.arctan2(dx[:-1] * dy[1:] - dy[:-1] * dx[1:], dx[:-1] * dx[1:] + dy[:-1] * dy[1:])
+            inner = np.ones(len(steps), dtype=bool)
+            inner[span_bounds[1:-1] - 1] = False
+            steps = steps[inner]
+            step_bounds = span_bounds[:-1] - np.arange(len(candidates))
+            lowest = np.minimum.reduceat(steps, step_bounds)
+            highest = np.maximum.reduceat(steps, step_bounds)
+            largest = np.maximum.reduceat(np.abs(steps), step_bounds)
+            fits = (((lowest > 0) | (highest < 0))
+                    & (np.abs(np.add.reduceat(steps, step_bounds)) < 2 * math.pi)
+                    & (largest <= ARC_MAX_SEGMENT_ANGLE)
+                    & (radial + r * (1 - np.cos(largest / 2)) <= tolerance))
+            clockwise = highest < 0
+
+        # 每条折线取能拟合的最远终点
+        best = np.full(len(active), -1, dtype=np.int64)
+        np.maximum.at(best, owner[fits], np.nonzero(fits)[0])
+        hit = best >= 0
+        chosen = best[hit]
+        found.append((start[chosen], end[chosen], cx[chosen], cy[chosen], clockwise[chosen]))
+        current[active[hit]] = end[chosen]
+        current[active[~hit]] += 1
+        active = active[stops[active] - current[active] >= 2]
+
+    if not found:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0), np.zeros(0), np.zeros(0, dtype=bool)
+    return tuple(np.concatenate(parts) for parts in zip(*found))
+
+
+def fit_arcs(x: np.ndarray, y: np.ndarray, tolerance: float) -> List[Tuple[str, int, float, float]]:
+    """将一条折线（中心坐标，Y轴向上）拆分为直线段和圆弧（见 fit_arc_spans）
+
+    返回 [(指令, 终点下标, 圆心x, 圆心y), ...]，指令为 G1、G2（顺时针）或 G3（逆时针）。
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    starts, ends, cx, cy, clockwise = fit_arc_spans(x, y, np.array([0, len(x)]), tolerance)
+    arcs = {start: (end, a, b, cw) for start, end, a, b, cw in
+            zip(starts.tolist(), ends.tolist(), cx.tolist(), cy.tolist(), clockwise.tolist())}
+    segments = []
+    i = 0
+    while i < len(x) - 1:
+        if i in arcs:
+            end, a, b, cw = arcs[i]
+            segments.append(("G2" if cw else "G3", end, a, b))
+            i = end
+        else:
+            segments.append(("G1", i + 1, 0.0, 0.0))
+            i += 1
+    return segments
+
+
+def arc_path(x: np.ndarray, y: np.ndarray, offsets: np.ndarray, arc_tolerance: float,
+             simplify_tolerance: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """在未简化的笔画上拟合圆弧，圆弧之间的直线部分再做折线简化
+
+    返回 (保留点下标, 新的笔画偏移, 每个保留点的指令 1/2/3, 圆心x, 圆心y)：
+    指令和圆心描述从上一个保留点到该点的一段，1 为直线（G1），2/3 为顺/逆时针圆弧。
+    圆弧内部的点不再输出，圆弧的端点和直线部分的端点总是保留。
+    """
+    starts, ends, arc_cx, arc_cy, clockwise = fit_arc_spans(x, y, offsets, arc_tolerance)
+    # 笔画端点和圆弧端点把笔画切分为若干段，不以圆弧起点开始的段为直线部分
+    cuts = np.unique(np.concatenate([offsets[:-1], offsets[1:] - 1, starts, ends]))
+    piece_starts, piece_ends = cuts[:-1], cuts[1:]
+    lines = ~np.isin(piece_starts, offsets[1:] - 1) & ~np.isin(piece_starts, starts)
+    piece_starts, piece_ends = piece_starts[lines], piece_ends[lines]
+    lengths = piece_ends - piece_starts + 1
+    piece_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=piece_offsets[1:])
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    index = np.arange(piece_offsets[-1]) - piece_offsets[:-1][owner] + piece_starts[owner]
+    keep = np.zeros(len(x), dtype=bool)
+    keep[cuts] = True
+    if simplify_tolerance > 0:
+        keep[index[simplify_mask(np.stack([x[index], y[index]], axis=1), piece_offsets, simplify_tolerance)]] = True
+    else:
+        keep[index] = True
+
+    index = np.nonzero(keep)[0]
+    new_offsets = np.searchsorted(index, offsets)
+    command = np.ones(len(index), dtype=np.int64)
+    cx, cy = np.zeros(len(index)), np.zeros(len(index))
+    at_end = np.searchsorted(index, ends)
+    command[at_end] = np.where(clockwise, 2, 3)
+    cx[at_end], cy[at_end] = arc_cx, arc_cy
+    return index, new_offsets, command, cx, cy
+
+
+# 路径规划参数：2-opt 的窗口大小（按笔画顺序）和最大迭代轮数
+PATH_TWO_OPT_WINDOW = int(os.environ.get('HANDWRITE_PATH_TWO_OPT_WINDOW', '32'))
+PATH_TWO_OPT_ROUNDS = int(os.environ.get('HANDWRITE_PATH_TWO_OPT_ROUNDS', '50'))
+# 默认对每页进行路径规划（HANDWRITE_OPTIMIZE_PATHS=0 关闭，保持字形提取顺序）
+OPTIMIZE_PATHS = os.environ.get('HANDWRITE_OPTIMIZE_PATHS', '1') != '0'
+
+
+def travel_distance(starts: np.ndarray, ends: np.ndarray, origin: Tuple[float, float]) -> float:
+    """抬笔移动的总距离（毫米）：从起始位置到第一条笔画，以及相邻笔画之间"""
+    if len(starts) == 0:
+        return 0.0
+    previous = np.vstack([np.asarray(origin, dtype=np.float64)[None, :], ends[:-1]])
+    return float(np.hypot(*(starts - previous).T).sum())
+
+
+def _greedy_stroke_order(starts: np.ndarray, ends: np.ndarray,
+                         origin: Tuple[float, float]) -> Tuple[np.ndarray, np.ndarray]:
+    """最近邻贪心：每次走向距当前笔位最近的未书写笔画端点，端点为终点时反向书写
+
+    端点放入均匀网格，按当前位置所在格子向外逐圈搜索。
+    """
+    count = len(starts)
+    endpoints = np.concatenate([starts, ends])
+    low = endpoints.min(axis=0)
+    extent = float((endpoints.max(axis=0) - low).max())
+    # 格子数约为端点数的两倍
+    cell = max(extent / (2 * math.sqrt(count)), 1e-6)
+    cells = np.floor((endpoints - low) / cell).astype(np.int64)
+    grid_width, grid_height = (cells.max(axis=0) + 1).tolist()
+
+    grid: Dict[Tuple[int, int], List[int]] = {}
+    for index, (cx, cy) in enumerate(cells.tolist()):
+        grid.setdefault((cx, cy), []).append(index)
+    coords = endpoints.tolist()
+
+    visited = [False] * count
+    order = np.empty(count, dtype=np.int64)
+    reverse = np.zeros(count, dtype=bool)
+    x, y = origin
+    for step in range(count):
+        cx = int(math.floor((x - low[0]) / cell))
+        cy = int(math.floor((y - low[1]) / cell))
+        # 到网格最远边界的圈数，超过后不可能再有候选
+        max_ring = max(abs(cx), abs(cy), abs(grid_width - 1 - cx), abs(grid_height - 1 - cy))
+        best, best_distance = -1, math.inf
+        for ring in range(max_ring + 1):
+            # 更外圈的点距离至少为 (ring - 1) * cell
+            if best >= 0 and best_distance <= (ring - 1) * cell:
+                break
+            for gx in range(cx - ring, cx + ring + 1):
+                if ring and gx not in (cx - ring, cx + ring):
+                    rows = (cy - ring, cy + ring)
+                else:
+                    rows = range(cy - ring, cy + ring + 1)
+                for gy in rows:
+                    members = grid.get((gx, gy))
+                    if not members:
+                        continue
+                    alive = [index for index in members if not visited[index % count]]
+                    if len(alive) != len(members):
+                        grid[(gx, gy)] = alive
+                    for index in alive:
+                        px, py = coords[index]
+                        distance = math.hypot(px - x, py - y)
+                        if distance < best_distance:
+                            best, best_distance = index, distance
+        stroke = best % count
+        visited[stroke] = True
+        order[step] = stroke
+        reverse[step] = best >= count
+        x, y = coords[stroke if best >= count else stroke + count]
+    return order, reverse
+
+
+def _refine_stroke_order(order: np.ndarray, reverse: np.ndarray, starts: np.ndarray, ends: np.ndarray,
+                         origin: Tuple[float, float], window: int = PATH_TWO_OPT_WINDOW,
+                         rounds: int = PATH_TWO_OPT_ROUNDS) -> Tuple[np.ndarray, np.ndarray]:
+    """窗口化 2-opt：翻转一段连续笔画（顺序和每条的方向同时翻转）能缩短抬笔距离时即翻转
+
+    段内的移动距离不变，只需比较两端连接处的距离。每轮对所有起点和窗口内的段长
+    一次性向量化计算收益，再按收益从大到小应用互不相邻的翻转。
+    """
+    order, reverse = order.copy(), reverse.copy()
+    entry = np.where(reverse[:, None], ends[order], starts[order])
+    exit_ = np.where(reverse[:, None], starts[order], ends[order])
+    origin = np.asarray(origin, dtype=np.float64)
+    count = len(order)
+    window = max(1, min(window, count))
+    positions = np.arange(count)
+    for _ in range(rounds):
+        previous = np.vstack([origin[None, :], exit_[:-1]])
+        before = np.hypot(*(previous - entry).T)
+        # 末尾追加一个哑元入口，最后一条笔画之后没有移动
+        following = np.vstack([entry, np.zeros((1, 2))])
+        delta = np.full((count, window), np.inf)
+        for length in range(window):
+            # 起点 i = 0..count-length-1，终点 j = i + length，均为连续切片
+            span = count - length
+            after = np.hypot(*(exit_[length:] - previous[:span]).T)
+            link_before = np.hypot(*(following[length + 1:] - exit_[length:]).T)
+            link_after = np.hypot(*(following[length + 1:] - entry[:span]).T)
+            link_before[-1] = link_after[-1] = 0.0
+            delta[:span, length] = after + link_after - before[:span] - link_before
+        best_length = delta.argmin(axis=1)
+        best = delta[positions, best_length]
+        candidates = np.nonzero(best < -1e-9)[0]
+        if len(candidates) == 0:
+            break
+        
+        # 相邻或重叠的翻转会改变彼此的连接距离，每轮只应用互相隔开的翻转
+        blocked = np.zeros(count + 1, dtype=bool)
+        for i in candidates[np.argsort(best[candidates])].tolist():
+            end = i + int(best_length[i]) + 1
+            if blocked[max(i - 1, 0):end + 1].any():
+                continue
+            blocked[i:end] = True
+            entry[i:end], exit_[i:end] = exit_[i:end][::-1].copy(), entry[i:end][::-1].copy()
+            order[i:end] = order[i:end][::-1].copy()
+            reverse[i:end] = ~reverse[i:end][::-1]
+    return order, reverse
+
+
+def plan_stroke_path(page: StrokePage, origin: Tuple[float, float]) -> Tuple[StrokePage, float, float]:
+    """重新安排笔画的顺序和方向以减少抬笔移动，返回 (新笔画模型, 优化前距离, 优化后距离)"""
+    starts, ends = page.endpoints()
+    before = travel_distance(starts, ends, origin)
+    if len(page) < 2:
+        return page, before, before
+    order, reverse = _greedy_stroke_order(starts, ends, origin)
+    order, reverse = _refine_stroke_order(order, reverse, starts, ends, origin)
+    planned = page.reordered(order, reverse)
+    after = travel_distance(*planned.endpoints(), origin)
+    if after >= before:
+        return page, before, before
+    return planned, before, after
+
+
 # 简化版的手写生成器，直接内嵌在API中，避免导入问题
+FONT_FILENAME = 'しょかきさらり行体.ttf'
+
+
+def find_font_path() -> Optional[str]:
+    """在部署目录中查找字体文件，找不到时返回None（使用默认字体）"""
+    font_paths = [
+        os.path.join(os.getcwd(), 'public', 'fonts', FONT_FILENAME),
+        os.path.join(os.getcwd(), 'fonts', FONT_FILENAME),
+        os.path.join(os.getcwd(), FONT_FILENAME),
+        os.path.join('/var/task/public/fonts', FONT_FILENAME),
+        os.path.join('/var/task/fonts', FONT_FILENAME),
+        os.path.join('/var/task', FONT_FILENAME)
+    ]
+    for path in font_paths:
+        if os.path.exists(path):
+            log_debug(f"找到字体文件: {path}")
+            return path
+    log_debug("未找到字体文件，使用默认字体")
+    return None
+
+
+class Runtime:
+    """进程级单例：首次使用时解析字体路径，持有共享的字体管理器
+
+    热启动的无服务器调用直接复用，请求只需处理排版和渲染。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._font_path: Optional[str] = None
+        self._font_path_resolved = False
+        self.fonts = FontManager()
+
+    @property
+    def font_path(self) -> Optional[str]:
+        if not self._font_path_resolved:
+            with self._lock:
+                if not self._font_path_resolved:
+                    self._font_path = find_font_path()
+                    self._font_path_resolved = True
+        return self._font_path
+
+    def preload(self) -> None:
+        """预加载内置字体的全部字号，使首个请求不再解析字体文件"""
+        self.fonts.preload(self.font_path)
+
+
+@functools.lru_cache(maxsize=None)
+def get_runtime() -> Runtime:
+    return Runtime()
+
+
+if PRELOAD_FONTS:
+    get_runtime().preload()
+
+
+class GenerationCancelled(BaseException):
+    """生成在检查点被取消（见 HandwritingGenerator.check_cancelled）
+
+    与 asyncio.CancelledError 一样继承 BaseException，不会被处理流程中的
+    except Exception 当作生成错误吞掉，而是一直传到发起取消的调用方。
+    """
+
+
 class HandwritingGenerator:
     def __init__(self, font_path: str = None, font_size: int = 8, margin_top: int = 35, margin_bottom: int = 25, 
-                margin_left: int = 30, margin_right: int = 30, paper_size: str = 'A4'):
+                margin_left: int = 30, margin_right: int = 30, paper_size: str = 'A4',
+                glyph_cache: Optional[GlyphCache] = None, preview_dpi: int = PREVIEW_DPI,
+                preview_antialias: bool = False, workers: int = RENDER_WORKERS,
+                seed: Optional[int] = None, layout_cache: Optional[LRUCache] = None,
+                page_cache: Optional[LRUCache] = None, optimize_paths: bool = OPTIMIZE_PATHS,
+                simplify_tolerance: float = SIMPLIFY_TOLERANCE, arc_tolerance: float = ARC_TOLERANCE,
+                cancel_event: Optional[threading.Event] = None):
         self.font_path = font_path
-        self.font_size = min(max(font_size, 6), 12)  # 限制字体大小在6-12之间
+        self.workers = max(1, int(workers))
+        # 抖动种子；为None时由文本和设置的哈希派生
+        self.seed = None if seed is None else int(seed)
+        self.glyph_cache = glyph_cache if glyph_cache is not None else default_glyph_cache
+        # 增量模式的缓存，为None时每次都完整排版和渲染
+        self.layout_cache = layout_cache
+        self.page_cache = page_cache
+        # 被设置后，生成在下一个检查点（行、页之间）抛出 GenerationCancelled
+        self.cancel_event = cancel_event
+        self.font_size = min(max(font_size, FONT_SIZE_MIN), FONT_SIZE_MAX)  # 限制字体大小在6-12之间
         self.margin_top = margin_top
         self.margin_bottom = margin_bottom
         self.margin_left = margin_left
@@ -234,17 +1378,9 @@ class HandwritingGenerator:
         self.paper_size = paper_size
         
         # 设置纸张尺寸（单位：毫米）
-        if paper_size == 'A4':
-            self.paper_width = 210
-            self.paper_height = 297
-        elif paper_size == 'A5':
-            self.paper_width = 148
-            self.paper_height = 210
-        elif paper_size == 'B5':
-            self.paper_width = 176
-            self.paper_height = 250
-        else:
+        if paper_size not in PAPER_SIZES:
             raise ValueError(f"不支持的纸张规格: {paper_size}")
+        self.paper_width, self.paper_height = PAPER_SIZES[paper_size]
         
         # 计算页面中心坐标
         self.center_x = self.paper_width / 2
@@ -270,18 +1406,35 @@ class HandwritingGenerator:
         self.vertical_wobble_min = -2
         self.vertical_wobble_max = 2
         
+        # 预览参数
+        self.preview_dpi = min(max(int(preview_dpi), PREVIEW_DPI_MIN), PREVIEW_DPI_MAX)
+        self.preview_antialias = bool(preview_antialias)
+        
+        # 路径规划：重排笔画顺序和方向以减少抬笔移动
+        self.optimize_paths = bool(optimize_paths)
+        # 折线简化容差（毫米）
+        self.simplify_tolerance = max(float(simplify_tolerance), 0.0)
+        # 圆弧拟合容差（毫米），大于0时输出 G2/G3 圆弧
+        self.arc_tolerance = max(float(arc_tolerance), 0.0)
+        
         # 加载字体
         try:
             if self.font_path and os.path.exists(self.font_path):
                 log_debug(f"尝试加载字体: {self.font_path}")
-                self.font = ImageFont.truetype(self.font_path, int(self.char_size))
+                self.font = get_runtime().fonts.get(self.font_path, self.char_size)
+                self.font_hash = font_file_hash(self.font_path)
+                self.atlas = load_stroke_atlas(self.font_path, self.char_size)
                 log_debug("字体加载成功")
             else:
                 log_debug("使用默认字体")
-                self.font = ImageFont.load_default()
+                self.font = get_runtime().fonts.get(None, 0)
+                self.font_hash = 'default'
+                self.atlas = None
         except Exception as e:
             log_debug(f"字体加载失败: {str(e)}")
-            self.font = ImageFont.load_default()
+            self.font = get_runtime().fonts.get(None, 0)
+            self.font_hash = 'default'
+            self.atlas = None
             log_debug("已加载默认字体")
         
         # 初始化当前位置
@@ -292,9 +1445,10 @@ class HandwritingGenerator:
         # 初始化页面计数
         self.page_count = 1
         
-        # 初始化G代码
-        self.gcode = []
-        self.init_gcode()
+        # 初始化当前页的笔画模型
+        self.page = StrokePage()
+        # 排版未完成时下一页的起点（见 layout_pages）
+        self.layout_cursor = None
         
         # 打印布局调试信息
         log_debug(f"=== Layout Debug ===")
@@ -302,135 +1456,47 @@ class HandwritingGenerator:
                  f"T={self.margin_top}mm, B={self.margin_bottom}mm")
         log_debug(f"Writing area: {self.writing_width}x{self.writing_height}mm")
 
-    def init_gcode(self) -> None:
-        """初始化G代码"""
-        self.gcode = [
-            "G21 ; 设置单位为毫米",
-            "G90 ; 使用绝对坐标",
-            "G92 X0 Y0 Z0 ; 设置当前位置为原点",
-            "G1 Z5 F1000 ; 抬起笔",
-            f"G1 X{self.margin_left} Y{self.margin_top} F3000 ; 移动到起始位置"
-        ]
+    def gcode_header(self) -> List[str]:
+        """每页G代码的初始化指令"""
+        return gcode_header_lines(self.margin_left, self.margin_top)
+
+    def new_page(self) -> None:
+        """开始新的一页"""
+        self.page = StrokePage()
+        self.x = self.margin_left
+        self.y = self.margin_top
     
-    def process_text(self, text: str, max_pages: int = 3) -> Dict[str, Any]:
+    def process_text(self, text: str, max_pages: int = 3, binary: bool = False) -> Dict[str, Any]:
+        """处理文本；binary=True 时以 previewPng 返回原始PNG字节而不做base64编码"""
         try:
             log_debug("开始处理文本")
-            preview_base64 = []
+            previews = []
             gcode_content = []
+            stats = []
             
-            # エラー処理を追加
-            if not text:
-                raise ValueError("テキストが空です")
-                
-            # 处理文本
-            lines = text.split('\n')
-            for line in lines:
-                if len(preview_base64) >= max_pages:
-                    log_debug(f"达到最大页数限制: {max_pages}")
-                    break
-                
-                if not line.strip():  # 空行
-                    self.y += self.line_height
-                    if self.y + self.line_height > self.margin_top + self.writing_height:
-                        try:
-                            preview_img = self.create_preview(max_pages)
-                            buffered = BytesIO()
-                            preview_img.save(buffered, format="PNG", optimize=True, quality=75)
-                            img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                            preview_base64.append(img_str)
-                            log_debug(f"预览图像编码完成，长度: {len(img_str)}")
-                        except Exception as e:
-                            log_debug(f"生成预览图像时出错: {str(e)}")
-                            raise
-                        
-                        gcode_content.append('\n'.join(self.gcode))
-                        self.page_count += 1
-                        self.x = self.margin_left
-                        self.y = self.margin_top
-                        self.init_gcode()
-                    continue
-                
-                # 处理一行文字
-                for char in line:
-                    if len(preview_base64) >= max_pages:
-                        break
-                    
-                    if self.x + self.font_size > self.margin_left + self.writing_width:
-                        self.x = self.margin_left
-                        self.y += self.line_height
-                        
-                        if self.y + self.line_height > self.margin_top + self.writing_height:
-                            try:
-                                preview_img = self.create_preview(max_pages)
-                                buffered = BytesIO()
-                                preview_img.save(buffered, format="PNG", optimize=True, quality=75)
-                                img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                                preview_base64.append(img_str)
-                                log_debug(f"预览图像编码完成，长度: {len(img_str)}")
-                            except Exception as e:
-                                log_debug(f"生成预览图像时出错: {str(e)}")
-                                raise
-                            
-                            gcode_content.append('\n'.join(self.gcode))
-                            self.page_count += 1
-                            self.x = self.margin_left
-                            self.y = self.margin_top
-                            self.init_gcode()
-                    
-                    try:
-                        contours, _ = self.get_font_strokes(char)
-                        for contour in contours:
-                            vertical_offset = self.get_vertical_wobble()
-                            gcode_commands = self.generate_gcode(contour, self.x, self.y, vertical_offset)
-                            self.gcode.extend(gcode_commands)
-                    except Exception as e:
-                        log_debug(f"处理字符 '{char}' 时出错: {str(e)}")
-                        continue
-                    
-                    self.x += self.get_random_spacing()
-                
-                if len(preview_base64) >= max_pages:
-                    break
-                
-                self.x = self.margin_left
-                self.y += self.line_height
-                
-                if self.y + self.line_height > self.margin_top + self.writing_height:
-                    try:
-                        preview_img = self.create_preview(max_pages)
-                        buffered = BytesIO()
-                        preview_img.save(buffered, format="PNG", optimize=True, quality=75)
-                        img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                        preview_base64.append(img_str)
-                        log_debug(f"预览图像编码完成，长度: {len(img_str)}")
-                    except Exception as e:
-                        log_debug(f"生成预览图像时出错: {str(e)}")
-                        raise
-                    
-                    gcode_content.append('\n'.join(self.gcode))
-                    self.page_count += 1
-                    self.x = self.margin_left
-                    self.y = self.margin_top
-                    self.init_gcode()
-            
-            if len(preview_base64) < max_pages and self.gcode and self.gcode[-1] != "G1 Z5 F1000 ; 抬起笔":
-                try:
-                    preview_img = self.create_preview(max_pages)
-                    buffered = BytesIO()
-                    preview_img.save(buffered, format="PNG", optimize=True, quality=75)
-                    img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-                    preview_base64.append(img_str)
-                    log_debug(f"预览图像编码完成，长度: {len(img_str)}")
-                except Exception as e:
-                    log_debug(f"生成预览图像时出错: {str(e)}")
-                    raise
-                
-                gcode_content.append('\n'.join(self.gcode))
+            for page in self.iter_pages(text, max_pages):
+                previews.append(page["previewPng"])
+                gcode_content.append(page["gcodeContent"])
+                stats.append(page.get("stats", {}))
             
+            # 超出页数限制而未排完的文本
+            truncated = self.layout_cursor is not None
+            if binary:
+                return {
+                    "success": True,
+                    "seed": self.seed_for(text),
+                    "truncated": truncated,
+                    "previewPng": previews,
+                    "gcodeContent": gcode_content,
+                    "stats": stats
+                }
             return {
                 "success": True,
-                "previewBase64": preview_base64,
-                "gcodeContent": gcode_content
+                "seed": self.seed_for(text),
+                "truncated": truncated,
+                "previewBase64": [base64.b64encode(png).decode('utf-8') for png in previews],
+                "gcodeContent": gcode_content,
+                "stats": stats
             }
         except Exception as e:
             log_debug(f"处理文本时出错: {str(e)}")
@@ -441,74 +1507,443 @@ class HandwritingGenerator:
                 "trace": traceback.format_exc()
             }
 
-    def get_font_strokes(self, char: str) -> Tuple[List[np.ndarray], Tuple[int, int, int, int]]:
-        """获取字体笔画"""
-        img_size = (self.char_size*2, self.char_size*2)
-        image = Image.new('L', img_size, 255)
-        draw = ImageDraw.Draw(image)
+    def settings(self) -> Dict[str, Any]:
+        """可在进程间传递的构造参数"""
+        return {
+            "font_path": self.font_path,
+            "font_size": self.font_size,
+            "margin_top": self.margin_top,
+            "margin_bottom": self.margin_bottom,
+            "margin_left": self.margin_left,
+            "margin_right": self.margin_right,
+            "paper_size": self.paper_size,
+            "preview_dpi": self.preview_dpi,
+            "preview_antialias": self.preview_antialias,
+            "optimize_paths": self.optimize_paths,
+            "simplify_tolerance": self.simplify_tolerance,
+            "arc_tolerance": self.arc_tolerance
+        }
+
+    def iter_pages(self, text: str, max_pages: int = 3, cursor: Optional[Dict[str, Any]] = None):
+        """逐页生成，产出 {"page", "previewPng", "gcodeContent", "strokes"}
+
+        先一次性完成排版（决定每个字符所在的页和位置），再逐页渲染；
+        workers > 1 时页面在进程池中并行渲染，输出与进程数无关。
+        cursor 见 layout_pages。
+        """
+        layouts = self.layout_pages(text, max_pages, cursor)
+        if self.page_cache is None:
+            keys = [None] * len(layouts)
+            cached = [None] * len(layouts)
+        else:
+            keys = [self.page_cache_key(layout) for layout in layouts]
+            cached = [self.page_cache.get(key) for key in keys]
         
-        # 绘制文字
-        bbox = draw.textbbox((0,0), char, font=self.font)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
-        x = (img_size[0] - text_width) // 2
-        y = (img_size[1] - text_height) // 2
+        # 只渲染内容有变化的页面
+        pending = [layout for layout, page in zip(layouts, cached) if page is None]
+        executor = get_render_executor(self.workers) if min(self.workers, len(pending)) > 1 else None
+        if executor is None:
+            rendered = (self.render_page(layout) for layout in pending)
+        else:
+            rendered = executor.map(_render_page_worker, repeat(self.settings()), pending)
         
-        draw.text((x,y), char, font=self.font, fill=0)
+        for key, page in zip(keys, cached):
+            self.check_cancelled()
+            if page is None:
+                page = next(rendered)
+                if self.page_cache is not None:
+                    self.page_cache.put(key, page)
+            else:
+                log_debug(f"复用未变化的第 {page['page']} 页")
+            yield page
+
+    def check_cancelled(self) -> None:
+        """取消检查点：请求已被取消时抛出 GenerationCancelled
+
+        位于排版的行之间、页面之间以及单页渲染的各阶段之间。
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            log_debug("生成已取消")
+            raise GenerationCancelled()
+
+    def page_cache_key(self, layout: Dict[str, Any]) -> str:
+        """页面输出由设置、字体、页种子和字形位置完全决定"""
+        settings = dict(self.settings(), font_path=self.font_hash)
+        normalized = [sorted(settings.items()), STROKE_FORMAT_VERSION,
+                      layout["page"], layout["seed"], layout["glyphs"]]
+        return hashlib.sha256(json.dumps(normalized, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def seed_for(self, text: str) -> int:
+        """本次请求使用的抖动种子：显式指定的seed，或文本与设置的哈希"""
+        if self.seed is not None:
+            return self.seed
+        settings = dict(self.settings(), font_path=self.font_hash)
+        return derive_seed(text, *(settings[name] for name in sorted(settings)))
+
+    def line_spacings(self, seed: int, line: str) -> np.ndarray:
+        """一次性生成一行中每个字符后的随机间距"""
+        char_width = self.font_size / 10  # 默认大小
+        min_spacing = char_width * self.spacing_ratio_min * 10  # 10倍缩放
+        max_spacing = char_width * self.spacing_ratio_max * 10
+        rng = np.random.default_rng(derive_seed(seed, 'line', line))
+        return rng.uniform(min_spacing, max_spacing, size=len(line))
+
+    def page_wobbles(self, page_seed: int, count: int) -> np.ndarray:
+        """一次性生成一页中每条笔画的垂直抖动"""
+        rng = np.random.default_rng(page_seed)
+        return rng.uniform(self.vertical_wobble_min, self.vertical_wobble_max, size=count) / 10
+
+    def layout_pages(self, text: str, max_pages: int = 3,
+                     cursor: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """排版：返回每页的 {"page", "seed", "glyphs": [(字符, x, y), ...]}
+
+        字符间距按行批量生成（由种子和行内容决定），每页的抖动种子由
+        请求种子和页码派生，相同的文本与设置总是得到相同的结果。
+        每行的排版只取决于行内容和起始y，启用 layout_cache 时未变化的行直接复用。
+
+        cursor 为上一次排版结束时的 self.layout_cursor，从该页继续排版；
+        文本全部排完时 self.layout_cursor 为None。
+        """
+        # エラー処理を追加
+        if not text:
+            raise ValueError("テキストが空です")
+        
+        cursor = cursor or {}
+        self._layout_seed = self.seed_for(text)
+        self.page_count = cursor.get("page", 1)
+        self.new_page()
+        self.layout_cursor = None
+        layouts = [self._page_layout()]
+        y = cursor.get("lineY", self.margin_top)
+        skip = cursor.get("segment", 0)
+        offset = cursor.get("lineOffset", 0)
+        
+        # 处理文本
+        lines = text.split('\n')
+        for index in range(cursor.get("line", 0), len(lines)):
+            self.check_cancelled()
+            line = lines[index]
+            line_y = y
+            segments, y = self.layout_line(line, y)
+            layouts[-1]["glyphs"].extend(segments[skip])
+            for segment_index in range(skip + 1, len(segments)):
+                if not any(segments[segment_index:]) and not any(rest.strip() for rest in lines[index + 1:]):
+                    # 文本恰好在页末结束，之后只剩空的分段和空行：不再开新页，也不留游标
+                    segment_index = None
+                    break
+                if len(layouts) >= max_pages:
+                    break
+                layouts.append(self._next_page_layout())
+                layouts[-1]["glyphs"].extend(segments[segment_index])
+            else:
+                skip = 0
+                offset += len(line) + 1
+                continue
+            if segment_index is None:
+                break
+            log_debug(f"达到最大页数限制: {max_pages}")
+            # 记录下一页的起点：所在行、行起始y、行内分段和页码
+            self.layout_cursor = {
+                "line": index,
+                "lineY": line_y,
+                "segment": segment_index,
+                "page": self.page_count + 1,
+                "lineOffset": offset,
+                "offset": offset + sum(len(segment) for segment in segments[:segment_index])
+            }
+            break
+        
+        self.x = self.margin_left
+        self.y = y
+        return layouts
+
+    def layout_line(self, line: str, y: float) -> Tuple[Tuple[Tuple, ...], float]:
+        """排版一行：返回按页分段的字形和结束时的y
+
+        第一段属于当前页，之后每一段都开始新的一页。
+        """
+        if self.layout_cache is None:
+            return self._layout_line(line, y)
+        key = (self.font_size, self.margin_left, self.margin_top, self.writing_width,
+               self.writing_height, self._layout_seed, line, y)
+        result = self.layout_cache.get(key)
+        if result is None:
+            result = self._layout_line(line, y)
+            self.layout_cache.put(key, result)
+        return result
+
+    def _layout_line(self, line: str, y: float) -> Tuple[Tuple[Tuple, ...], float]:
+        bottom = self.margin_top + self.writing_height
+        segments = [[]]
+        
+        if line.strip():
+            # 处理一行文字
+            x = self.margin_left
+            spacings = self.line_spacings(self._layout_seed, line).tolist()
+            for char, spacing in zip(line, spacings):
+                if x + self.font_size > self.margin_left + self.writing_width:
+                    x = self.margin_left
+                    y += self.line_height
+                    
+                    if y + self.line_height > bottom:
+                        segments.append([])
+                        y = self.margin_top
+                
+                segments[-1].append((char, x, y))
+                x += spacing
+        
+        # 换行（空行只前进一行）
+        y += self.line_height
+        if y + self.line_height > bottom:
+            segments.append([])
+            y = self.margin_top
+        return tuple(tuple(segment) for segment in segments), y
+
+    def _page_layout(self) -> Dict[str, Any]:
+        # 每页的抖动由独立的种子决定，使页面可以单独渲染
+        page_seed = derive_seed(self._layout_seed, 'page', self.page_count)
+        return {"page": self.page_count, "seed": page_seed, "glyphs": []}
+
+    def _next_page_layout(self) -> Dict[str, Any]:
+        self.page_count += 1
+        self.new_page()
+        return self._page_layout()
+
+    def render_page(self, layout: Dict[str, Any]) -> Dict[str, Any]:
+        """渲染一页的笔画、预览PNG和G代码"""
+        glyphs = self.get_font_strokes_batch(char for char, _, _ in layout["glyphs"])
+        placed = []
+        stroke_count = 0
+        for char, x, y in layout["glyphs"]:
+            if char not in glyphs:
+                continue
+            contours, _ = glyphs[char]
+            placed.append((contours, x, y))
+            stroke_count += len(contours)
+        
+        page = StrokePage()
+        wobbles = iter(self.page_wobbles(layout["seed"], stroke_count).tolist())
+        for contours, x, y in placed:
+            for contour in contours:
+                page.add_stroke(self.contour_to_page(contour, x, y, next(wobbles)))
+        
+        stats = {"glyphs": len(placed), "strokes": len(page)}
+        self.check_cancelled()
+        # 圆弧模式下保留未简化的笔画，圆弧拟合和折线简化在序列化G代码时进行（见 gcode_body）
+        if self.simplify_tolerance > 0 and self.arc_tolerance <= 0:
+            points_before = page.point_count
+            page = simplify_strokes(page, self.simplify_tolerance)
+            stats["pointsBefore"] = points_before
+            stats["pointsRemoved"] = points_before - page.point_count
+            log_debug(f"第 {layout['page']} 页折线简化: {points_before} -> {page.point_count} 点")
+        if self.optimize_paths:
+            self.check_cancelled()
+            page, before, after = plan_stroke_path(page, self.pen_start())
+            stats["travelBefore"] = round(before, 3)
+            stats["travelAfter"] = round(after, 3)
+            log_debug(f"第 {layout['page']} 页抬笔移动: {before:.1f}mm -> {after:.1f}mm")
+        self.page = page
+        self.check_cancelled()
+        
+        return {
+            "page": layout["page"],
+            "previewPng": self.preview_png(),
+            "gcodeContent": self.serialize_gcode(page),
+            "strokes": self.serialize_strokes(page),
+            "stats": stats
+        }
+
+    def preview_png(self) -> bytes:
+        """当前页面的预览PNG"""
+        try:
+            preview_img = self.create_preview()
+            buffered = BytesIO()
+            preview_img.save(buffered, format="PNG", optimize=True, quality=75)
+            png = buffered.getvalue()
+            log_debug(f"预览图像编码完成，长度: {len(png)}")
+            return png
+        except Exception as e:
+            log_debug(f"生成预览图像时出错: {str(e)}")
+            raise
+
+    def render_row(self, glyphs: Tuple[Tuple[str, float, float], ...], seed: int) -> StrokePage:
+        """渲染同一行的字形，抖动、简化和路径规划都只在行内进行，结果只取决于行内容和种子"""
+        strokes = self.get_font_strokes_batch(char for char, _, _ in glyphs)
+        placed = [(strokes[char][0], x, y) for char, x, y in glyphs if char in strokes]
+        wobbles = iter(self.page_wobbles(seed, sum(len(contours) for contours, _, _ in placed)).tolist())
+        row = StrokePage()
+        for contours, x, y in placed:
+            for contour in contours:
+                row.add_stroke(self.contour_to_page(contour, x, y, next(wobbles)))
+        if self.simplify_tolerance > 0 and self.arc_tolerance <= 0:
+            row = simplify_strokes(row, self.simplify_tolerance)
+        if self.optimize_paths:
+            # 从行的左端（页面坐标）开始规划，与前后行无关，片段可独立缓存
+            row, _, _ = plan_stroke_path(row, (self.margin_left, glyphs[0][2]))
+        return row
+
+    def render_page_rows(self, layout: Dict[str, Any], fragment_cache: 'LRUCache',
+                         preview: bool = True) -> Dict[str, Any]:
+        """按行渲染一页，每行的笔画和G代码片段缓存在 fragment_cache 中
+
+        页面为各行片段按顺序拼接，内容未变化的行（例如模板的固定部分）直接复用，
+        只有预览需要整页重新绘制；preview=False 时不生成预览（previewPng 为None）。
+        """
+        rows = []
+        for glyph in layout["glyphs"]:
+            if rows and rows[-1][-1][2] == glyph[2]:
+                rows[-1].append(glyph)
+            else:
+                rows.append([glyph])
+        
+        fragments = []
+        reused = 0
+        for row in rows:
+            row = tuple(row)
+            seed = derive_seed(layout["seed"], 'row', *(value for glyph in row for value in glyph))
+            key = (self.fragment_key, seed)
+            fragment = fragment_cache.get(key)
+            if fragment is None:
+                stroke_page = self.render_row(row, seed)
+                fragment = (stroke_page, self.gcode_body(stroke_page), len(row))
+                fragment_cache.put(key, fragment)
+            else:
+                reused += 1
+            fragments.append(fragment)
+        
+        self.page = StrokePage.concatenate([stroke_page for stroke_page, _, _ in fragments])
+        header = '\n'.join(self.gcode_header())
+        body = ''.join(gcode for _, gcode, _ in fragments)
+        return {
+            "page": layout["page"],
+            "previewPng": self.preview_png() if preview else None,
+            "gcodeContent": header + '\n' + body[:-1] if body else header,
+            "stats": {"glyphs": sum(count for _, _, count in fragments), "strokes": len(self.page),
+                      "rows": len(rows), "rowsReused": reused}
+        }
+
+    @property
+    def fragment_key(self) -> str:
+        """行片段缓存键中与设置和字体相关的部分"""
+        settings = dict(self.settings(), font_path=self.font_hash)
+        return json.dumps([sorted(settings.items()), STROKE_FORMAT_VERSION])
+
+    def pen_start(self) -> Tuple[float, float]:
+        """G代码头部移动到的笔位（页面毫米坐标）"""
+        return self.center_x + self.margin_left, self.center_y - self.margin_top
+
+    def get_font_strokes(self, char: str) -> Tuple[List[np.ndarray], Tuple[int, int, int, int]]:
+        """获取字体笔画（依次查找预编译图集、字形缓存，最后实时提取）"""
+        if self.atlas is not None:
+            glyph = self.atlas.lookup(char)
+            if glyph is not None:
+                return glyph
+        key = GlyphCache.make_key(self.font_hash, self.char_size, char)
+        cached = self.glyph_cache.get(key)
+        if cached is not None:
+            return cached
+        return self.glyph_cache.put(key, self._extract_font_strokes(char))
+
+    def get_font_strokes_batch(self, chars) -> Dict[str, Tuple[List[np.ndarray], Tuple[int, int, int, int]]]:
+        """批量获取一组字符的笔画，返回 {字符: (轮廓, 位置)}
+
+        重复字符只处理一次；未命中图集和字形缓存的字符一次性栅格化到同一张位图中提取。
+        """
+        glyphs = {}
+        missing = []
+        for char in dict.fromkeys(chars):
+            glyph = self.atlas.lookup(char) if self.atlas is not None else None
+            if glyph is None:
+                glyph = self.glyph_cache.get(GlyphCache.make_key(self.font_hash, self.char_size, char))
+            if glyph is None:
+                missing.append(char)
+            else:
+                glyphs[char] = glyph
+        
+        for start in range(0, len(missing), GLYPH_BATCH_TILES):
+            extracted = self._extract_font_strokes_batch(missing[start:start + GLYPH_BATCH_TILES])
+            for char, glyph in extracted.items():
+                key = GlyphCache.make_key(self.font_hash, self.char_size, char)
+                glyphs[char] = self.glyph_cache.put(key, glyph)
+        return glyphs
+
+    def _extract_font_strokes_batch(self, chars: List[str]) -> Dict[str, Tuple[List[np.ndarray], Tuple[int, int, int, int]]]:
+        """将多个字符栅格化到同一张图集位图中，只转换一次NumPy数组，再按格提取笔画
+
+        每格与单独提取时的画布大小相同，字符在格内的位置也相同，结果与逐字提取一致；
+        字形超出格子的字符（会被单独提取时的画布裁剪）退回逐字提取。
+        """
+        if not chars:
+            return {}
+        tile = self.char_size * 2
+        cols = math.ceil(math.sqrt(len(chars)))
+        rows = math.ceil(len(chars) / cols)
+        image = Image.new('L', (cols * tile, rows * tile), 255)
+        draw = ImageDraw.Draw(image)
+        
+        placed = []
+        results = {}
+        for index, char in enumerate(chars):
+            try:
+                bbox = draw.textbbox((0, 0), char, font=self.font)
+            except Exception as e:
+                log_debug(f"处理字符 '{char}' 时出错: {str(e)}")
+                continue
+            text_width = bbox[2] - bbox[0]
+            text_height = bbox[3] - bbox[1]
+            x = (tile - text_width) // 2
+            y = (tile - text_height) // 2
+            if x + bbox[0] < 0 or y + bbox[1] < 0 or x + bbox[2] > tile or y + bbox[3] > tile:
+                results[char] = self._extract_font_strokes(char)
+                continue
+            row, col = divmod(index, cols)
+            draw.text((col * tile + x, row * tile + y), char, font=self.font, fill=0)
+            placed.append((char, row, col, (x, y, text_width, text_height)))
+        
+        # 整张图集只转换一次，二值化和笔画提取在各字符格子的视图上进行
+        pixels = np.asarray(image)
+        for char, row, col, box in placed:
+            cell = pixels[row * tile:(row + 1) * tile, col * tile:(col + 1) * tile]
+            results[char] = (extract_strokes(cell < 128), box)
+        return results
+
+    def _extract_font_strokes(self, char: str) -> Tuple[List[np.ndarray], Tuple[int, int, int, int]]:
+        """栅格化字符并提取笔画"""
+        img_size = (self.char_size*2, self.char_size*2)
+        image = Image.new('L', img_size, 255)
+        draw = ImageDraw.Draw(image)
+        
+        # 绘制文字
+        bbox = draw.textbbox((0,0), char, font=self.font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+        x = (img_size[0] - text_width) // 2
+        y = (img_size[1] - text_height) // 2
+        
+        draw.text((x,y), char, font=self.font, fill=0)
         
         # 使用Pillow和numpy处理图像
         img_array = np.array(image)
         # 二值化
         binary = img_array < 128
         
-        # 简化版的轮廓提取
-        contours = []
-        visited = np.zeros_like(binary, dtype=bool)
-        
-        for i in range(binary.shape[0]):
-            for j in range(binary.shape[1]):
-                if binary[i,j] and not visited[i,j]:
-                    contour = self._trace_contour(binary, visited, i, j)
-                    if len(contour) > 2:
-                        contours.append(np.array(contour))
+        # 笔画提取
+        contours = extract_strokes(binary)
         
         return contours, (x, y, text_width, text_height)
 
-    def _trace_contour(self, binary: np.ndarray, visited: np.ndarray, start_i: int, start_j: int) -> List[List[int]]:
-        """追踪单个轮廓"""
-        contour = []
-        i, j = start_i, start_j
-        directions = [(0,1), (1,1), (1,0), (1,-1), (0,-1), (-1,-1), (-1,0), (-1,1)]
-        dir_idx = 0
-        
-        while True:
-            if visited[i,j]:
-                break
-            visited[i,j] = True
-            contour.append([j,i])  # 注意坐标顺序
-            
-            # 寻找下一个点
-            found = False
-            for _ in range(8):
-                di, dj = directions[dir_idx]
-                ni, nj = i + di, j + dj
-                if 0 <= ni < binary.shape[0] and 0 <= nj < binary.shape[1]:
-                    if binary[ni,nj] and not visited[ni,nj]:
-                        i, j = ni, nj
-                        found = True
-                        break
-                dir_idx = (dir_idx + 1) % 8
-            
-            if not found:
-                break
-        
-        return contour
+    def create_preview(self, max_pages: int = 3, dpi: Optional[int] = None,
+                       antialias: Optional[bool] = None) -> Image.Image:
+        """创建预览图像
 
-    def create_preview(self, max_pages: int = 3) -> Image.Image:
-        """创建预览图像，限制最大页数"""
+        所有点的像素坐标一次性计算；蓝色运动路径与黑色笔画在一次遍历中分别
+        绘制到两个遮罩上，再合成到页面。抗锯齿模式下以超采样绘制遮罩并缩小，
+        代替锐化滤镜。
+        """
         try:
-            # 提高DPI以提高清晰度
-            dpi = 72  # 提高到72 DPI
+            dpi = self.preview_dpi if dpi is None else dpi
+            antialias = self.preview_antialias if antialias is None else antialias
+            factor = PREVIEW_SUPERSAMPLE if antialias else 1
             width_px = int(self.paper_width * dpi / 25.4)
             height_px = int(self.paper_height * dpi / 25.4)
             
@@ -530,95 +1965,37 @@ class HandwritingGenerator:
             draw.rectangle([0, 0, margin_left_px, height_px], fill=(240, 240, 240))
             draw.rectangle([width_px - margin_right_px, 0, width_px, height_px], fill=(240, 240, 240))
             
-            # 计算缩放比例和偏移
-            scale = dpi / 25.4  # 毫米到像素的转换比例
-            offset_x = self.center_x * scale
-            offset_y = self.center_y * scale
-            
-            # 绘制机器人运动路径（蓝色）
-            points = []
-            pen_down = False
-            
-            for line in self.gcode:
-                if line.startswith('G1') or line.startswith('G0'):
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        x_val = None
-                        y_val = None
-                        z_val = None
-                        for part in parts[1:]:
-                            if part.startswith('X'):
-                                x_val = float(part[1:])
-                            elif part.startswith('Y'):
-                                y_val = float(part[1:])
-                            elif part.startswith('Z'):
-                                z_val = float(part[1:])
-                                pen_down = z_val < 2.5
-                        
-                        if x_val is not None and y_val is not None:
-                            # 转换坐标到像素，考虑中心偏移
-                            x_px = int(x_val * scale + offset_x)
-                            y_px = int(-y_val * scale + offset_y)  # Y轴反转
-                            
-                            # 确保坐标在图像范围内
-                            x_px = max(0, min(x_px, width_px - 1))
-                            y_px = max(0, min(y_px, height_px - 1))
-                            
-                            if pen_down:
-                                points.append((x_px, y_px))
-                            else:
-                                if len(points) > 1:
-                                    # 使用蓝色绘制机器人运动路径
-                                    draw.line(points, fill=(0, 0, 255), width=1, joint="curve")
-                                points = [(x_px, y_px)]
+            if len(self.page) > 0:
+                # 页面毫米坐标 -> 中心坐标 -> 像素坐标（全部点一次计算）
+                scale = dpi / 25.4 * factor  # 毫米到像素的转换比例
+                mask_size = (width_px * factor, height_px * factor)
+                x_val, y_val = self.convert_to_center_coordinates(self.page.points[:, 0], self.page.points[:, 1])
+                x_px = np.clip(np.trunc(x_val * scale + self.center_x * scale), 0, mask_size[0] - 1)
+                y_px = np.clip(np.trunc(-y_val * scale + self.center_y * scale), 0, mask_size[1] - 1)  # Y轴反转
+                flat = np.column_stack((x_px, y_px)).astype(np.int64).ravel().tolist()
+                offsets = (self.page.offsets * 2).tolist()
             
-            # 绘制最后一条线
-            if len(points) > 1:
-                draw.line(points, fill=(0, 0, 255), width=1, joint="curve")
+                path_mask = Image.new('L', mask_size, 0)
+                ink_mask = Image.new('L', mask_size, 0)
+                path_draw = ImageDraw.Draw(path_mask)
+                ink_draw = ImageDraw.Draw(ink_mask)
             
-            # 绘制实际书写内容（黑色）
-            points = []
-            pen_down = False
+                # 机器人运动路径（包含抬笔移动）为一条折线
+                path_draw.line(flat, fill=255, width=factor, joint="curve")
+                # 实际书写内容，仅落笔的笔画
+                for start, end in zip(offsets[:-1], offsets[1:]):
+                    ink_draw.line(flat[start:end], fill=255, width=2 * factor, joint="curve")
             
-            for line in self.gcode:
-                if line.startswith('G1') or line.startswith('G0'):
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        x_val = None
-                        y_val = None
-                        z_val = None
-                        for part in parts[1:]:
-                            if part.startswith('X'):
-                                x_val = float(part[1:])
-                            elif part.startswith('Y'):
-                                y_val = float(part[1:])
-                            elif part.startswith('Z'):
-                                z_val = float(part[1:])
-                                pen_down = z_val < 2.5
-                        
-                        if x_val is not None and y_val is not None:
-                            # 转换坐标到像素，考虑中心偏移
-                            x_px = int(x_val * scale + offset_x)
-                            y_px = int(-y_val * scale + offset_y)  # Y轴反转
-                            
-                            # 确保坐标在图像范围内
-                            x_px = max(0, min(x_px, width_px - 1))
-                            y_px = max(0, min(y_px, height_px - 1))
-                            
-                            if pen_down:
-                                points.append((x_px, y_px))
-                            else:
-                                if len(points) > 1:
-                                    # 使用黑色绘制实际书写内容
-                                    draw.line(points, fill='black', width=2, joint="curve")
-                                points = [(x_px, y_px)]
+                if factor > 1:
+                    path_mask = path_mask.resize((width_px, height_px), Image.BOX)
+                    ink_mask = ink_mask.resize((width_px, height_px), Image.BOX)
             
-            # 绘制最后一条线
-            if len(points) > 1:
-                draw.line(points, fill='black', width=2, joint="curve")
+                image.paste((0, 0, 255), mask=path_mask)
+                image.paste((0, 0, 0), mask=ink_mask)
             
-            # 应用锐化滤镜提高清晰度
-            image = image.filter(ImageFilter.SHARPEN)
+            if not antialias:
+                # 应用锐化滤镜提高清晰度
+                image = image.filter(ImageFilter.SHARPEN)
             
             log_debug("预览图像生成完成")
             return image
@@ -633,61 +2010,748 @@ class HandwritingGenerator:
         center_relative_y = self.center_y - y  # Y轴向上为正
         return center_relative_x, center_relative_y
 
-    def generate_gcode(self, contour, start_x, start_y, vertical_offset=0, scale=1.0):
-        """从轮廓生成G代码（以中心为原点）"""
-        points = np.array(contour)
+    def contour_to_page(self, contour, start_x, start_y, vertical_offset=0) -> np.ndarray:
+        """将字形轮廓点转换为页面毫米坐标"""
+        points = np.asarray(contour).reshape(-1, 2)
+        page_points = np.empty(points.shape, dtype=np.float64)
+        # contour已经是正确的大小，直接平移
+        page_points[:, 0] = start_x + points[:, 0]
+        page_points[:, 1] = start_y + points[:, 1] + vertical_offset
+        return page_points
+
+    def stroke_gcode(self, points: np.ndarray) -> List[str]:
+        """将一条页面坐标笔画序列化为G代码（以中心为原点）"""
         if len(points) < 2:
             return []
+        if self.arc_tolerance > 0:
+            page = StrokePage()
+            page.add_stroke(points)
+            return self.gcode_body(page).splitlines()
         
-        stroke_commands = []
+        x_pos, y_pos = self.convert_to_center_coordinates(points[:, 0], points[:, 1])
+        x_pos, y_pos = x_pos.tolist(), y_pos.tolist()
         
         # 移动到起始点（笔抬起状态）
-        x, y = points[0]
-        # 移除scale/10的缩放，因为contour已经是正确的大小
-        abs_x = start_x + x
-        abs_y = start_y + y + vertical_offset
-        x_pos, y_pos = self.convert_to_center_coordinates(abs_x, abs_y)
-        stroke_commands.append(f"G0 X{x_pos:.3f} Y{y_pos:.3f} F{self.move_speed}")
+        stroke_commands = [f"G0 X{x_pos[0]:.3f} Y{y_pos[0]:.3f} F{self.move_speed}"]
         
         # 落笔
         stroke_commands.append(f"G1 G90 Z{self.pen_down_z} F{self.pen_speed}")
         
         # 绘制笔画
-        for point in points[1:]:
-            x, y = point
-            abs_x = start_x + x
-            abs_y = start_y + y + vertical_offset
-            x_pos, y_pos = self.convert_to_center_coordinates(abs_x, abs_y)
-            stroke_commands.append(f"G1 X{x_pos:.3f} Y{y_pos:.3f} F{self.move_speed}")
+        for x, y in zip(x_pos[1:], y_pos[1:]):
+            stroke_commands.append(f"G1 X{x:.3f} Y{y:.3f} F{self.move_speed}")
         
         # 抬笔
         stroke_commands.append(f"G1 G90 Z{self.pen_up_z} F{self.pen_speed}")
         
         return stroke_commands
 
-    def get_random_spacing(self, char_width=None):
-        """生成与字符大小成比例的随机字符间距"""
-        if char_width is None:
-            char_width = self.font_size/10  # 默认大小
-        
-        # 基于字符宽度计算间距
-        min_spacing = char_width * self.spacing_ratio_min * 10  # 10倍缩放
-        max_spacing = char_width * self.spacing_ratio_max * 10
-        
-        return random.uniform(min_spacing, max_spacing)
+    def generate_gcode(self, contour, start_x, start_y, vertical_offset=0, scale=1.0):
+        """从轮廓生成G代码（以中心为原点）"""
+        return self.stroke_gcode(self.contour_to_page(contour, start_x, start_y, vertical_offset))
 
-    def get_vertical_wobble(self):
-        """生成随机垂直抖动"""
-        return random.uniform(self.vertical_wobble_min, self.vertical_wobble_max) / 10
+    def serialize_gcode(self, page: Optional[StrokePage] = None) -> str:
+        """将一页笔画序列化为完整的G代码文本"""
+        page = self.page if page is None else page
+        header = '\n'.join(self.gcode_header())
+        if len(page) == 0:
+            return header
+        # 去掉最后一行的换行符
+        return header + '\n' + self.gcode_body(page)[:-1]
+
+    def gcode_body(self, page: StrokePage) -> str:
+        """笔画部分的G代码，每行以换行符结尾，可直接拼接
+
+        整页的点一次转换为中心坐标后由 gcode_body_bytes 批量格式化。
+        圆弧模式下页面为未简化的笔画（见 render_page）：先在原始点上拟合圆弧，
+        偏差上限为简化容差与圆弧容差之和（与先简化再拟合的误差上限相同），
+        圆弧之间的直线部分再做折线简化。
+        """
+        if len(page) == 0:
+            return ''
+        points = page.points
+        x_pos, y_pos = self.convert_to_center_coordinates(points[:, 0], points[:, 1])
+        if self.arc_tolerance > 0:
+            index, offsets, command, cx, cy = arc_path(
+                x_pos, y_pos, page.offsets, self.simplify_tolerance + self.arc_tolerance, self.simplify_tolerance)
+            x_pos, y_pos = x_pos[index], y_pos[index]
+            # 圆心 I/J 相对于圆弧起点，即上一个保留点
+            previous = np.maximum(np.arange(len(index)) - 1, 0)
+            body = gcode_body_bytes(x_pos, y_pos, offsets, self.move_speed, self.pen_down_z, self.pen_up_z,
+                                    self.pen_speed, (command, cx - x_pos[previous], cy - y_pos[previous]))
+            return body.tobytes().decode('ascii')
+        body = gcode_body_bytes(x_pos, y_pos, page.offsets, self.move_speed,
+                                self.pen_down_z, self.pen_up_z, self.pen_speed)
+        return body.tobytes().decode('ascii')
+
+    def serialize_strokes(self, page: Optional[StrokePage] = None) -> bytes:
+        """将一页笔画序列化为二进制笔画格式（见 encode_strokes），体积远小于G代码文本
+
+        笔画格式只有直线段：圆弧模式下页面未简化，先按简化容差简化再编码。
+        """
+        page = self.page if page is None else page
+        if self.arc_tolerance > 0:
+            page = simplify_strokes(page, self.simplify_tolerance)
+        return encode_strokes(self, page)
+
+
+# 进程池在进程内共享，热启动的请求可直接复用已预热的工作进程
+# 每个进程数对应一个进程池，创建后不再关闭：其他请求可能正在向其提交任务
+_render_executors: Dict[int, ProcessPoolExecutor] = {}
+_render_executor_lock = threading.Lock()
+# 工作进程内按构造参数缓存的生成器
+_worker_generators: Dict[Tuple, HandwritingGenerator] = {}
+
+
+def get_render_executor(workers: int) -> Optional[ProcessPoolExecutor]:
+    """返回指定进程数的共享页面渲染进程池，环境不支持多进程时返回None
+
+    工作进程按需启动，调用方按配置的进程数（而不是本次的页数）取池，使同一配置只对应一个池。
+    """
+    with _render_executor_lock:
+        executor = _render_executors.get(workers)
+        if executor is not None:
+            return executor
+        try:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        except (OSError, NotImplementedError) as e:
+            # 例如无 /dev/shm 的无服务器环境
+            log_debug(f"无法创建渲染进程池，改为串行渲染: {str(e)}")
+            return None
+        _render_executors[workers] = executor
+        return executor
+
+
+def _render_page_worker(settings: Dict[str, Any], layout: Dict[str, Any]) -> Dict[str, Any]:
+    """在工作进程中渲染一页"""
+    key = tuple(sorted(settings.items()))
+    generator = _worker_generators.get(key)
+    if generator is None:
+        generator = HandwritingGenerator(workers=1, **settings)
+        _worker_generators[key] = generator
+    return generator.render_page(layout)
+
+# 二进制响应容器: 魔数 + uint32清单长度 + JSON清单 + 数据区
+# 清单中每个数据段以 {"offset", "length", "type"} 描述，偏移相对于数据区起点
+BUNDLE_MEDIA_TYPE = 'application/vnd.handwrite.bundle'
+BUNDLE_MAGIC = b'HWB1'
+
+
+def encode_bundle(manifest: Dict[str, Any], parts: List[Tuple[str, bytes]]) -> bytes:
+    """将 [(类型, 数据)] 与清单打包为容器，段描述写入 manifest["parts"]"""
+    entries = []
+    offset = 0
+    for content_type, data in parts:
+        entries.append({"offset": offset, "length": len(data), "type": content_type})
+        offset += len(data)
+    manifest = dict(manifest, parts=entries)
+    header = json.dumps(manifest, ensure_ascii=False).encode('utf-8')
+    return b''.join([BUNDLE_MAGIC, struct.pack('<I', len(header)), header] + [data for _, data in parts])
+
+
+def decode_bundle(data: bytes) -> Tuple[Dict[str, Any], List[memoryview]]:
+    """解析容器，返回清单和各数据段（零拷贝视图）"""
+    if data[:4] != BUNDLE_MAGIC:
+        raise ValueError("无效的数据容器")
+    (header_len,) = struct.unpack_from('<I', data, 4)
+    manifest = json.loads(bytes(data[8:8 + header_len]).decode('utf-8'))
+    payload = memoryview(data)[8 + header_len:]
+    parts = [payload[p["offset"]:p["offset"] + p["length"]] for p in manifest["parts"]]
+    return manifest, parts
+
+
+def pages_bundle(previews: List[bytes], gcode_content: List[str], seed: Optional[int] = None,
+                 truncated: bool = False) -> bytes:
+    """将各页PNG和G代码打包为二进制容器"""
+    parts = []
+    pages = []
+    for idx, (png, gcode) in enumerate(zip(previews, gcode_content)):
+        pages.append({"page": idx + 1, "preview": len(parts), "gcode": len(parts) + 1})
+        parts.append(("image/png", png))
+        parts.append(("text/plain; charset=utf-8", gcode.encode('utf-8')))
+    return encode_bundle({"status": "success", "seed": seed, "truncated": truncated, "pages": pages}, parts)
+
+
+# 二进制笔画格式: 头部 + varint 序列
+# 头部依次为 魔数、版本、保留字节、坐标单位（微米）、纸张宽高、左/上边距、抬笔/落笔Z值（float64，毫米）、
+# 移动/抬落笔速度、笔画数、点数（uint32）。
+# 之后每条笔画为一个落笔段：varint 点数，随后每个点的 (dx, dy)，以坐标单位计、ZigZag 编码的 varint；
+# 首点相对于上一笔画的末点（第一条笔画相对于页面中心），即抬笔移动的距离。
+# 多页数据为各页依次拼接（/api/generate 以 Accept: application/vnd.handwrite.strokes 返回）。
+STROKES_MEDIA_TYPE = 'application/vnd.handwrite.strokes'
+STROKES_MAGIC = b'HWS1'
+STROKES_VERSION = 1
+STROKES_HEADER = struct.Struct('<4sBBH6d4I')
+# 坐标单位（微米）
+STROKES_UNIT_UM = 10
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """将非负整数数组编码为 LEB128 varint 字节串"""
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        lengths += values >= np.uint64(1 << shift)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    out = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    for k in range(int(lengths.max()) if len(lengths) else 0):
+        rows = np.flatnonzero(lengths > k)
+        chunk = (values[rows] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        # 除最后一个字节外设置延续位
+        chunk |= np.where(lengths[rows] > k + 1, np.uint64(0x80), np.uint64(0))
+        out[starts[rows] + k] = chunk.astype(np.uint8)
+    return out.tobytes()
+
+
+def decode_varints(data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """解码字节数组中所有完整的 varint，返回 (数值, 每个数值结束后的字节位置)"""
+    ends = np.flatnonzero(data < 0x80) + 1
+    starts = np.concatenate([[0], ends[:-1]])
+    lengths = ends - starts
+    values = np.zeros(len(ends), dtype=np.uint64)
+    for k in range(int(lengths.max()) if len(lengths) else 0):
+        rows = np.flatnonzero(lengths > k)
+        values[rows] |= (data[starts[rows] + k].astype(np.uint64) & np.uint64(0x7f)) << np.uint64(7 * k)
+    return values, ends
+
+
+def encode_strokes(generator: HandwritingGenerator, page: StrokePage) -> bytes:
+    """将一页笔画编码为二进制笔画格式（坐标量化到 STROKES_UNIT_UM）"""
+    points, offsets = page.points, page.offsets
+    x_pos, y_pos = generator.convert_to_center_coordinates(points[:, 0], points[:, 1])
+    header = STROKES_HEADER.pack(
+        STROKES_MAGIC, STROKES_VERSION, 0, STROKES_UNIT_UM,
+        generator.paper_width, generator.paper_height, generator.margin_left, generator.margin_top,
+        generator.pen_up_z, generator.pen_down_z, generator.move_speed, generator.pen_speed,
+        len(offsets) - 1, len(points)
+    )
+    if len(points) == 0:
+        return header
+
+    scale = 1000 / STROKES_UNIT_UM
+    fixed = np.rint(np.stack([x_pos, y_pos], axis=1) * scale).astype(np.int64)
+    deltas = np.diff(fixed, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+
+    # 序列：每条笔画的点数后紧跟其各点的 dx, dy
+    counts = np.diff(offsets)
+    sequence = np.empty(len(counts) + 2 * len(points), dtype=np.uint64)
+    count_positions = 2 * offsets[:-1] + np.arange(len(counts))
+    is_count = np.zeros(len(sequence), dtype=bool)
+    is_count[count_positions] = True
+    sequence[count_positions] = counts
+    sequence[~is_count] = zigzag.ravel()
+    return header + encode_varints(sequence)
+
+
+class StrokeStreamDecoder:
+    """二进制笔画格式的流式解码器
+
+    数据可按任意大小分块 feed，每次返回已完整接收的笔画对应的G代码文本；
+    各次返回值依次拼接即为整页G代码，与以量化后坐标调用 serialize_gcode 的结果一致。
+    多页数据依次解码，各页的G代码之间以换行分隔。
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.header: Optional[Dict[str, Any]] = None
+        self.pages = 0
+        self.strokes = 0
+        self.points = 0
+        # 上一笔画末点（坐标单位）
+        self.position = np.zeros(2, dtype=np.int64)
+
+    def _read_header(self) -> str:
+        (magic, version, _, unit, paper_width, paper_height, margin_left, margin_top,
+         pen_up_z, pen_down_z, move_speed, pen_speed, strokes, points) = STROKES_HEADER.unpack_from(self.buffer)
+        if magic != STROKES_MAGIC or version != STROKES_VERSION:
+            raise ValueError("无效的笔画数据")
+        del self.buffer[:STROKES_HEADER.size]
+        self.header = {
+            "unit": unit, "paperWidth": paper_width, "paperHeight": paper_height,
+            # 边距按整数写入时保持原有的G代码文本
+            "marginLeft": int(margin_left) if margin_left.is_integer() else margin_left,
+            "marginTop": int(margin_top) if margin_top.is_integer() else margin_top,
+            "penUpZ": pen_up_z, "penDownZ": pen_down_z, "moveSpeed": move_speed, "penSpeed": pen_speed,
+            "strokes": strokes, "points": points
+        }
+        self.strokes = self.points = 0
+        self.position = np.zeros(2, dtype=np.int64)
+        return '\n'.join(gcode_header_lines(self.header["marginLeft"], self.header["marginTop"]))
+
+    def _read_strokes(self) -> str:
+        """解码当前页已完整接收的笔画"""
+        header = self.header
+        remaining = header["strokes"] - self.strokes
+        # 本页剩余数据的字节数上限（每个 varint 最多10字节），之后的字节属于下一页
+        limit = 10 * (remaining + 2 * (header["points"] - self.points))
+        values, ends = decode_varints(np.frombuffer(bytes(self.buffer[:limit]), dtype=np.uint8))
+        # 找出已完整接收的笔画
+        index = 0
+        counts = []
+        while (len(counts) < remaining and index < len(values)
+               and index + 1 + 2 * int(values[index]) <= len(values)):
+            counts.append(int(values[index]))
+            index += 1 + 2 * counts[-1]
+        if not counts:
+            return ''
+
+        values = values[:index]
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        is_count = np.zeros(index, dtype=bool)
+        is_count[2 * offsets[:-1] + np.arange(len(counts))] = True
+        zigzag = values[~is_count].astype(np.int64).reshape(-1, 2)
+        deltas = (zigzag >> 1) ^ -(zigzag & 1)
+        fixed = np.cumsum(deltas, axis=0) + self.position
+        self.position = fixed[-1]
+        self.strokes += len(counts)
+        self.points += int(offsets[-1])
+        del self.buffer[:int(ends[index - 1])]
+
+        coordinates = fixed * header["unit"] / 1000
+        body = gcode_body_bytes(coordinates[:, 0], coordinates[:, 1], offsets, header["moveSpeed"],
+                                header["penDownZ"], header["penUpZ"], header["penSpeed"])
+        return '\n' + body[:-1].tobytes().decode('ascii')
+
+    def feed(self, data: bytes) -> str:
+        self.buffer.extend(data)
+        output = []
+        while True:
+            if self.header is None:
+                if len(self.buffer) < STROKES_HEADER.size:
+                    break
+                output.append(('\n' if self.pages else '') + self._read_header())
+            output.append(self._read_strokes())
+            if self.strokes < self.header["strokes"]:
+                break
+            # 本页完整，之后的数据属于下一页
+            self.header = None
+            self.pages += 1
+        return ''.join(output)
+
+    def close(self) -> None:
+        """确认数据完整"""
+        if self.pages == 0 or self.header is not None or self.buffer:
+            raise ValueError("笔画数据不完整")
+
+
+def iter_strokes_gcode(chunks: Iterable[bytes]) -> Iterator[str]:
+    """将分块读取的二进制笔画数据逐块展开为G代码文本"""
+    decoder = StrokeStreamDecoder()
+    for chunk in chunks:
+        text = decoder.feed(chunk)
+        if text:
+            yield text
+    decoder.close()
+
+
+def strokes_to_gcode(data: bytes) -> str:
+    """将完整的二进制笔画数据展开为G代码（多页时各页以换行分隔）"""
+    return ''.join(iter_strokes_gcode([data]))
+
+
+# 响应缓存配置（可通过环境变量调整）
+RESPONSE_CACHE_SIZE = int(os.environ.get('HANDWRITE_RESPONSE_CACHE_SIZE', '8'))
+# 内存层的总大小上限（字节）：整页G代码可达数MB，只按条目数限制时可能占用数百MB
+RESPONSE_CACHE_MEMORY_BYTES = int(os.environ.get('HANDWRITE_RESPONSE_CACHE_MEMORY_BYTES', str(32 << 20)))
+# 磁盘缓存目录，设置为空字符串时禁用磁盘缓存
+RESPONSE_CACHE_DIR = os.environ.get('HANDWRITE_RESPONSE_CACHE_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'handwrite-responses'))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('HANDWRITE_RESPONSE_CACHE_MAX_BYTES', str(256 << 20)))
+
+
+def response_cache_key(generator: HandwritingGenerator, text: str, max_pages: int = 3) -> str:
+    """规范化请求的内容哈希（包含生效的设置、字体和抖动种子）"""
+    settings = dict(generator.settings(), font_path=generator.font_hash)
+    normalized = {
+        "text": text,
+        "maxPages": max_pages,
+        "seed": generator.seed_for(text),
+        "settings": settings,
+        "version": STROKE_FORMAT_VERSION
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def pages_payload_bytes(value: Dict[str, Any]) -> int:
+    """缓存的生成结果占用的大致字节数（预览PNG与G代码）"""
+    return sum(len(png) for png in value["previewPng"]) + sum(len(gcode) for gcode in value["gcodeContent"])
+
+
+class ResponseCache:
+    """生成结果缓存：进程内LRU层 + 可选的磁盘层（/tmp），两层都按总大小淘汰
+
+    值为 {"seed", "previewPng": [bytes], "gcodeContent": [str]}，
+    磁盘上以二进制容器格式保存。
+    """
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, disk_dir: Optional[str] = RESPONSE_CACHE_DIR,
+                 max_disk_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 max_memory_bytes: int = RESPONSE_CACHE_MEMORY_BYTES):
+        self.memory = LRUCache(max_size, max_memory_bytes, pages_payload_bytes)
+        self.disk_dir = disk_dir or None
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.bundle")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is None and self.disk_dir:
+            value = self._read_disk(key)
+            if value is not None:
+                self.disk_hits += 1
+                self.memory.put(key, value)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        value = {
+            "seed": result.get("seed"),
+            "truncated": bool(result.get("truncated", False)),
+            "previewPng": list(result["previewPng"]),
+            "gcodeContent": list(result["gcodeContent"])
+        }
+        self.memory.put(key, value)
+        if self.disk_dir:
+            self._write_disk(key, value)
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # 用修改时间记录最近访问，供淘汰使用
+            manifest, parts = decode_bundle(data)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            log_debug(f"读取响应磁盘缓存失败 {path}: {str(e)}")
+            return None
+        return {
+            "seed": manifest.get("seed"),
+            "truncated": manifest.get("truncated", False),
+            "previewPng": [bytes(parts[page["preview"]]) for page in manifest["pages"]],
+            "gcodeContent": [bytes(parts[page["gcode"]]).decode('utf-8') for page in manifest["pages"]]
+        }
+
+    def _write_disk(self, key: str, value: Dict[str, Any]) -> None:
+        path = self._disk_path(key)
+        data = pages_bundle(value["previewPng"], value["gcodeContent"], seed=value["seed"],
+                            truncated=value["truncated"])
+        if len(data) > self.max_disk_bytes:
+            return
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._evict_disk()
+        except OSError as e:
+            log_debug(f"写入响应磁盘缓存失败 {path}: {str(e)}")
+
+    def _evict_disk(self) -> None:
+        """按最近访问时间淘汰，直到磁盘缓存总大小不超过上限"""
+        with self._lock:
+            entries = []
+            total = 0
+            for entry in os.scandir(self.disk_dir):
+                if entry.name.endswith('.bundle'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "diskHits": self.disk_hits,
+            "memory": self.memory.stats(),
+            "diskDir": self.disk_dir
+        }
+
+
+# 进程级共享的响应缓存
+default_response_cache = ResponseCache()
+
+
+def _get_header(request: Dict[str, Any], name: str) -> str:
+    """不区分大小写地读取请求头"""
+    for header, value in (request.get('headers') or {}).items():
+        if header.lower() == name.lower():
+            return value
+    return ''
+
+
+def generator_from_request(data: Dict[str, Any], **kwargs) -> HandwritingGenerator:
+    """根据请求参数创建生成器，kwargs 覆盖或补充构造参数"""
+    return HandwritingGenerator(
+        font_path=get_runtime().font_path,
+        font_size=data.get('fontSize', 8),
+        margin_top=data.get('marginTop', 35),
+        margin_bottom=data.get('marginBottom', 25),
+        margin_left=data.get('marginLeft', 30),
+        margin_right=data.get('marginRight', 30),
+        paper_size=data.get('paperSize', 'A4'),
+        preview_dpi=data.get('previewDpi', PREVIEW_DPI),
+        preview_antialias=data.get('previewAntialias', False),
+        optimize_paths=data.get('optimizePaths', OPTIMIZE_PATHS),
+        simplify_tolerance=data.get('simplifyTolerance', SIMPLIFY_TOLERANCE),
+        arc_tolerance=data.get('arcTolerance', ARC_TOLERANCE),
+        seed=data.get('seed'),
+        **kwargs
+    )
+
+
+def invalid_seed(seed: Any) -> bool:
+    """seed 必须为空或不超过 SEED_MASK 的非负整数（更大的值在前端会丢失精度，回传后抖动不同）"""
+    return seed is not None and (isinstance(seed, bool) or not isinstance(seed, int)
+                                 or not 0 <= seed <= SEED_MASK)
+
+
+def generate_batch(texts: List[str], data: Optional[Dict[str, Any]] = None, max_pages: int = 3,
+                   binary: bool = False, workers: Optional[int] = None) -> Dict[str, Any]:
+    """批量生成多篇文档，所有文档共用同一组设置
+
+    整批只创建一个生成器，共享字体、图集和字形缓存；所有文档用到的字符在开始前
+    一次性批量提取。先完成全部文档的排版，再把所有页面一起渲染，workers > 1 时
+    跨文档在进程池中并行（单页文档也能并行）。
+
+    每篇文档的结果与单独调用 process_text 相同，按输入顺序返回；
+    stats 中给出整批的吞吐量。
+    """
+    started = time.perf_counter()
+    generator = generator_from_request(data or {}, **({} if workers is None else {"workers": workers}))
+    charset = set(''.join(texts))
+    charset.discard('\n')
+    generator.get_font_strokes_batch(sorted(charset))
+    
+    # 排版全部文档
+    documents = []
+    layouts = []
+    for index, text in enumerate(texts):
+        try:
+            document_layouts = generator.layout_pages(text, max_pages)
+        except Exception as e:
+            documents.append({"index": index, "success": False, "error": str(e)})
+            continue
+        documents.append({
+            "index": index,
+            "success": True,
+            "seed": generator.seed_for(text),
+            "truncated": generator.layout_cursor is not None,
+            "pages": len(document_layouts)
+        })
+        layouts.extend((index, layout) for layout in document_layouts)
+    
+    # 渲染全部页面
+    executor = get_render_executor(generator.workers) if min(generator.workers, len(layouts)) > 1 else None
+    if executor is not None:
+        settings = generator.settings()
+        futures = [executor.submit(_render_page_worker, settings, layout) for _, layout in layouts]
+    pages = {}
+    for position, (index, layout) in enumerate(layouts):
+        try:
+            page = futures[position].result() if executor is not None else generator.render_page(layout)
+        except Exception as e:
+            log_debug(f"批量生成第 {index} 篇文档时出错: {str(e)}")
+            documents[index] = {"index": index, "success": False, "error": str(e),
+                                "trace": traceback.format_exc()}
+            continue
+        pages.setdefault(index, []).append(page)
+    
+    for document in documents:
+        if not document["success"]:
+            continue
+        document_pages = pages.pop(document["index"])
+        document.pop("pages")
+        previews = [page["previewPng"] for page in document_pages]
+        if binary:
+            document["previewPng"] = previews
+        else:
+            document["previewBase64"] = [base64.b64encode(png).decode('utf-8') for png in previews]
+        document["gcodeContent"] = [page["gcodeContent"] for page in document_pages]
+        document["stats"] = [page.get("stats", {}) for page in document_pages]
+    
+    return {"documents": documents, "stats": batch_stats(documents, time.perf_counter() - started)}
+
+
+# 邮件合并模板的占位符，形如 {{name}}
+TEMPLATE_PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+# 每个模板缓存的行片段数
+TEMPLATE_FRAGMENT_CACHE_SIZE = int(os.environ.get('HANDWRITE_TEMPLATE_FRAGMENT_CACHE_SIZE', '1024'))
+
+
+class MailMergeTemplate:
+    """邮件合并模板：固定部分只排版和渲染一次，每位收件人只重新处理占位符所在的行
+
+    模板的所有文档使用同一个抖动种子（请求中的seed，或由模板文本派生），
+    因此未受占位符影响的行在每份文档中的排版和笔画都相同，直接从缓存取用。
+    占位符使行数发生变化时，其后的行会重新排版。
+    输出按行规划笔画路径（见 render_page_rows），与对填充后文本调用 process_text 的结果不同。
+    """
+
+    def __init__(self, text: str, data: Optional[Dict[str, Any]] = None,
+                 fragment_cache_size: int = TEMPLATE_FRAGMENT_CACHE_SIZE):
+        if not text:
+            raise ValueError("模板内容不能为空")
+        self.text = text
+        self.placeholders = sorted(set(TEMPLATE_PLACEHOLDER.findall(text)))
+        layout_cache = LRUCache(LAYOUT_CACHE_SIZE, LAYOUT_CACHE_MAX_BYTES, layout_payload_bytes)
+        self.generator = generator_from_request(data or {}, layout_cache=layout_cache)
+        if self.generator.seed is None:
+            self.generator.seed = self.generator.seed_for(text)
+        self.fragments = LRUCache(fragment_cache_size)
+        # 预先提取模板固定部分的字形
+        charset = set(TEMPLATE_PLACEHOLDER.sub('', text))
+        charset.discard('\n')
+        self.generator.get_font_strokes_batch(sorted(charset))
+
+    def fill(self, values: Dict[str, Any]) -> str:
+        """用收件人数据替换占位符"""
+        missing = [name for name in self.placeholders if name not in values]
+        if missing:
+            raise ValueError(f"缺少占位符的值: {', '.join(missing)}")
+        return TEMPLATE_PLACEHOLDER.sub(lambda match: str(values[match.group(1)]), self.text)
+
+    def render(self, values: Dict[str, Any], max_pages: int = 3, binary: bool = False,
+               preview: bool = True) -> Dict[str, Any]:
+        """生成一份文档，结果格式同 process_text；preview=False 时不生成预览，预览列表为空"""
+        try:
+            text = self.fill(values)
+            generator = self.generator
+            pages = [generator.render_page_rows(layout, self.fragments, preview)
+                     for layout in generator.layout_pages(text, max_pages)]
+            previews = [page["previewPng"] for page in pages if page["previewPng"] is not None]
+            result = {
+                "success": True,
+                "seed": generator.seed,
+                "truncated": generator.layout_cursor is not None,
+                "gcodeContent": [page["gcodeContent"] for page in pages],
+                "stats": [page["stats"] for page in pages]
+            }
+            if binary:
+                result["previewPng"] = previews
+            else:
+                result["previewBase64"] = [base64.b64encode(png).decode('utf-8') for png in previews]
+            return result
+        except Exception as e:
+            log_debug(f"模板生成时出错: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "trace": traceback.format_exc()
+            }
+
+
+def generate_merge(template: str, recipients: List[Dict[str, Any]], data: Optional[Dict[str, Any]] = None,
+                   max_pages: int = 3, binary: bool = False, preview: bool = True) -> Dict[str, Any]:
+    """以模板为每位收件人生成一份文档，返回格式同 generate_batch"""
+    started = time.perf_counter()
+    merge = MailMergeTemplate(template, data)
+    documents = [dict(merge.render(values, max_pages, binary, preview), index=index)
+                 for index, values in enumerate(recipients)]
+    stats = batch_stats(documents, time.perf_counter() - started)
+    stats["rowsReused"] = sum(page.get("rowsReused", 0) for document in documents
+                              for page in document.get("stats", []))
+    stats["rows"] = sum(page.get("rows", 0) for document in documents for page in document.get("stats", []))
+    return {"documents": documents, "stats": stats}
+
+
+def batch_stats(documents: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+    """整批的页数、字数和吞吐量"""
+    pages = sum(len(document.get("gcodeContent", [])) for document in documents)
+    glyphs = sum(page.get("glyphs", 0) for document in documents for page in document.get("stats", []))
+    log_debug(f"批量生成 {len(documents)} 篇文档，{pages} 页，{glyphs} 字，耗时 {elapsed:.2f}s")
+    return {
+        "documents": len(documents),
+        "pages": pages,
+        "glyphs": glyphs,
+        "seconds": round(elapsed, 3),
+        "documentsPerSecond": round(len(documents) / elapsed, 3) if elapsed > 0 else None,
+        "glyphsPerSecond": round(glyphs / elapsed, 1) if elapsed > 0 else None
+    }
+
+
+def stream_pages(generator: HandwritingGenerator, text: str, max_pages: int = 3,
+                 cache: Optional[ResponseCache] = None, cache_key: Optional[str] = None):
+    """以NDJSON逐页输出生成结果，每条记录为一行UTF-8编码的JSON
+
+    指定缓存时，命中则直接输出缓存的页面，否则在全部页面完成后写入缓存。
+    """
+    pages = 0
+    try:
+        cached = cache.get(cache_key) if cache is not None else None
+        if cached is not None:
+            source = ({"page": idx + 1, "previewPng": png, "gcodeContent": gcode}
+                      for idx, (png, gcode) in enumerate(zip(cached["previewPng"], cached["gcodeContent"])))
+        else:
+            source = generator.iter_pages(text, max_pages)
+        previews = []
+        gcode_content = []
+        for page in source:
+            pages += 1
+            previews.append(page["previewPng"])
+            gcode_content.append(page["gcodeContent"])
+            record = {
+                "type": "page",
+                "page": page["page"],
+                "previewBase64": base64.b64encode(page["previewPng"]).decode('utf-8'),
+                "gcodeContent": page["gcodeContent"]
+            }
+            if "stats" in page:
+                record["stats"] = page["stats"]
+            yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        truncated = cached["truncated"] if cached is not None else generator.layout_cursor is not None
+        if cache is not None and cached is None:
+            cache.put(cache_key, {"seed": generator.seed_for(text), "truncated": truncated,
+                                  "previewPng": previews, "gcodeContent": gcode_content})
+        record = {"type": "done", "status": "success", "seed": generator.seed_for(text),
+                  "pages": pages, "truncated": truncated}
+    except Exception as e:
+        # 响应头已发送，错误作为最后一条记录输出
+        log_debug(f"流式处理文本时出错: {str(e)}")
+        log_debug(traceback.format_exc())
+        record = {
+            "type": "error",
+            "status": "error",
+            "error": "text_processing_failed",
+            "message": str(e),
+            "trace": traceback.format_exc()
+        }
+    yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
 
 # Vercel Serverless Function 处理函数
+# request 中可选的 cancelEvent（threading.Event）被设置后，生成在下一个检查点抛出 GenerationCancelled
 def handler(request):
+    """处理 POST /api/generate
+
+    同一规范化请求的结果总是相同，因此虽然是POST，仍把它当作幂等的读取：
+    If-None-Match 命中时返回304而不是 RFC 9110 对非GET/HEAD请求规定的412，
+    使客户端可以用上次的ETag重新验证。ETag按表示区分（JSON、二进制容器、二进制笔画、NDJSON流），
+    所有表示都带 Vary: Accept。
+    """
     try:
         log_debug("===== 开始处理请求 =====")
-        log_debug(f"当前工作目录: {os.getcwd()}")
-        log_debug(f"目录内容: {os.listdir('.')}")
-        log_debug(f"Python版本: {sys.version}")
-        log_debug(f"Python路径: {sys.path}")
+        log_environment()
         
         # 获取请求体
         try:
@@ -713,7 +2777,8 @@ def handler(request):
                     }
             else:
                 data = body
-            log_debug(f"请求数据: {data}")
+            # 只记录请求摘要，避免完整输出长文本
+            log_debug(f"请求参数: {sorted(data)}, 文本长度: {len(data.get('text') or '')}")
         except Exception as e:
             log_debug(f"请求体解析错误: {str(e)}")
             error_response = {
@@ -749,36 +2814,33 @@ def handler(request):
                 }
             }
         
+        seed = data.get('seed')
+        if invalid_seed(seed):
+            log_debug(f"错误: 无效的seed: {seed!r}")
+            error_response = {
+                "status": "error",
+                "error": "invalid_seed",
+                "message": "seed必须是不超过2^53-1的非负整数"
+            }
+            return {
+                "statusCode": 400,
+                "body": json.dumps(error_response, ensure_ascii=False),
+                "headers": {
+                    "Content-Type": "application/json; charset=utf-8",
+                    "Access-Control-Allow-Origin": "*"
+                }
+            }
+        
+        # 增量模式：复用未变化行的排版和未变化页的输出（需配合固定的seed）
+        incremental = bool(data.get('incremental', False))
+        
         # 创建生成器实例
         try:
-            font_paths = [
-                os.path.join(os.getcwd(), 'public', 'fonts', 'しょかきさらり行体.ttf'),
-                os.path.join(os.getcwd(), 'fonts', 'しょかきさらり行体.ttf'),
-                os.path.join(os.getcwd(), 'しょかきさらり行体.ttf'),
-                '/var/task/public/fonts/しょかきさらり行体.ttf',
-                '/var/task/fonts/しょかきさらり行体.ttf',
-                '/var/task/しょかきさらり行体.ttf'
-            ]
-            
-            font_path = None
-            for path in font_paths:
-                if os.path.exists(path):
-                    font_path = path
-                    log_debug(f"找到字体文件: {path}")
-                    break
-            
-            if not font_path:
-                log_debug("未找到字体文件，使用默认字体")
-                font_path = None
-            
-            generator = HandwritingGenerator(
-                font_path=font_path,
-                font_size=data.get('fontSize', 8),
-                margin_top=data.get('marginTop', 35),
-                margin_bottom=data.get('marginBottom', 25),
-                margin_left=data.get('marginLeft', 30),
-                margin_right=data.get('marginRight', 30),
-                paper_size=data.get('paperSize', 'A4')
+            generator = generator_from_request(
+                data,
+                layout_cache=default_layout_cache if incremental else None,
+                page_cache=default_page_cache if incremental else None,
+                cancel_event=request.get('cancelEvent')
             )
         except Exception as e:
             log_debug(f"生成器初始化错误: {str(e)}")
@@ -797,9 +2859,90 @@ def handler(request):
                 }
             }
         
+        # 响应格式由 index.py 根据 Accept 头协商
+        stream = bool(data.get('stream', False))
+        response_format = request.get('responseFormat')
+        binary = response_format == 'bundle'
+        
+        # 相同的规范化请求总是得到相同的结果，以内容哈希作为缓存键；
+        # ETag 另含响应的表示，不同表示之间不能互相重新验证
+        cache_key = response_cache_key(generator, text)
+        representation = 'ndjson' if stream else (response_format if response_format in ('bundle', 'strokes')
+                                                  else 'json')
+        etag = f'"{cache_key[:32]}-{representation}"'
+        if_none_match = _get_header(request, 'If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or
+                              etag in [tag.strip() for tag in if_none_match.split(',')]):
+            log_debug("ETag匹配，返回304")
+            return {
+                "statusCode": 304,
+                "headers": {
+                    "ETag": etag,
+                    "Vary": "Accept",
+                    "Access-Control-Allow-Origin": "*"
+                }
+            }
+        
+        # 流式模式：每页完成后立即输出一条NDJSON记录
+        if stream:
+            return {
+                "statusCode": 200,
+                "stream": stream_pages(generator, text, cache=default_response_cache, cache_key=cache_key),
+                "headers": {
+                    "Content-Type": "application/x-ndjson; charset=utf-8",
+                    "Cache-Control": "no-cache",
+                    "ETag": etag,
+                    "Vary": "Accept",
+                    "Access-Control-Allow-Origin": "*"
+                }
+            }
+        
+        # 二进制笔画格式：各页笔画数据依次拼接，供绘图机代理展开为G代码（不经过响应缓存）
+        if representation == 'strokes':
+            try:
+                pages = list(generator.iter_pages(text))
+                body = b''.join(page["strokes"] for page in pages)
+                log_debug(f"响应数据: {len(pages)} 页, 笔画数据 {len(body)} 字节")
+                return {
+                    "statusCode": 200,
+                    "body": body,
+                    "headers": {
+                        "Content-Type": STROKES_MEDIA_TYPE,
+                        "ETag": etag,
+                        "X-Seed": str(generator.seed_for(text)),
+                        "X-Truncated": "true" if generator.layout_cursor is not None else "false",
+                        "Vary": "Accept",
+                        "Access-Control-Allow-Origin": "*"
+                    }
+                }
+            except Exception as e:
+                log_debug(f"文本处理错误: {str(e)}")
+                error_response = {
+                    "status": "error",
+                    "error": "text_processing_failed",
+                    "message": "文本处理失败",
+                    "trace": traceback.format_exc()
+                }
+                return {
+                    "statusCode": 500,
+                    "body": json.dumps(error_response, ensure_ascii=False),
+                    "headers": {
+                        "Content-Type": "application/json; charset=utf-8",
+                        "Access-Control-Allow-Origin": "*"
+                    }
+                }
+        
         # 处理文本
         try:
-            result = generator.process_text(text)
+            result = default_response_cache.get(cache_key)
+            cache_status = "HIT" if result is not None else "MISS"
+            if result is None:
+                result = generator.process_text(text, binary=True)
+                if result.get("success", False):
+                    default_response_cache.put(cache_key, result)
+            else:
+                result = dict(result, success=True)
+            log_debug(f"响应缓存{cache_status}: {default_response_cache.stats()}")
             if not result.get("success", False):
                 error_response = {
                     "status": "error",
@@ -816,22 +2959,46 @@ def handler(request):
                     }
                 }
             
+            gcode_content = result.get("gcodeContent", [])
+            
+            if binary:
+                body = pages_bundle(result.get("previewPng", []), gcode_content, seed=result.get("seed"),
+                                    truncated=result.get("truncated", False))
+                log_debug(f"响应数据: {len(gcode_content)} 页, 容器大小 {len(body)} 字节")
+                return {
+                    "statusCode": 200,
+                    "body": body,
+                    "headers": {
+                        "Content-Type": BUNDLE_MEDIA_TYPE,
+                        "ETag": etag,
+                        "X-Cache": cache_status,
+                        "Vary": "Accept",
+                        "Access-Control-Allow-Origin": "*"
+                    }
+                }
+            
             # 构建响应
             response_data = {
                 "status": "success",
-                "previewBase64": result.get("previewBase64", []),
-                "gcodeContent": result.get("gcodeContent", [])
+                "seed": result.get("seed"),
+                "truncated": result.get("truncated", False),
+                "previewBase64": [base64.b64encode(png).decode('utf-8') for png in result.get("previewPng", [])],
+                "gcodeContent": gcode_content
             }
+            body = json.dumps(response_data, ensure_ascii=False)
             
-            # 记录响应数据
-            log_debug(f"响应数据: {json.dumps(response_data, ensure_ascii=False)}")
+            # 只记录响应摘要，避免完整输出预览和G代码
+            log_debug(f"响应数据: {len(gcode_content)} 页, JSON大小 {len(body)} 字符")
             
             # 返回响应
             return {
                 "statusCode": 200,
-                "body": json.dumps(response_data, ensure_ascii=False),
+                "body": body,
                 "headers": {
                     "Content-Type": "application/json; charset=utf-8",
+                    "ETag": etag,
+                    "X-Cache": cache_status,
+                    "Vary": "Accept",
                     "Access-Control-Allow-Origin": "*"
                 }
             }
@@ -1,7 +1,38 @@
 from http.server import BaseHTTPRequestHandler
-from .generate import handler as generate_handler
+from .generate import handler as generate_handler, BUNDLE_MEDIA_TYPE, STROKES_MEDIA_TYPE
 import json
 
+
+def negotiate_format(accept):
+    """根据Accept头选择响应格式：'json'、'bundle'（二进制容器）或 'strokes'（二进制笔画）
+
+    二进制格式须被显式接受，且优先级不低于JSON（含 */*）；两种二进制格式同级时取容器。
+    """
+    if not accept:
+        return 'json'
+    quality = {}
+    for item in accept.split(','):
+        fields = item.strip().split(';')
+        media_type = fields[0].strip().lower()
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        quality[media_type] = max(q, quality.get(media_type, 0.0))
+    bundle_q = quality.get(BUNDLE_MEDIA_TYPE, 0.0)
+    strokes_q = quality.get(STROKES_MEDIA_TYPE, 0.0)
+    json_q = max(quality.get('application/json', 0.0), quality.get('*/*', 0.0))
+    if bundle_q > 0 and bundle_q >= max(json_q, strokes_q):
+        return 'bundle'
+    if strokes_q > 0 and strokes_q >= json_q:
+        return 'strokes'
+    return 'json'
+
+
 class Handler(BaseHTTPRequestHandler):
     def do_POST(self):
         # 获取请求内容长度
@@ -14,7 +45,8 @@ class Handler(BaseHTTPRequestHandler):
             'body': post_data.decode('utf-8'),
             'headers': dict(self.headers),
             'method': 'POST',
-            'path': self.path
+            'path': self.path,
+            'responseFormat': negotiate_format(self.headers.get('Accept', ''))
         }
         
         # 如果请求体是JSON格式，解析它
@@ -27,6 +59,11 @@ class Handler(BaseHTTPRequestHandler):
         # 调用实际的处理函数
         response = generate_handler(request)
         
+        # 流式响应使用分块传输编码
+        if 'stream' in response:
+            self.send_chunked(response)
+            return
+        
         # 设置响应状态码
         self.send_response(response.get('statusCode', 200))
         
@@ -37,7 +74,28 @@ class Handler(BaseHTTPRequestHandler):
         
         # 发送响应体
         if 'body' in response:
-            self.wfile.write(response['body'].encode('utf-8'))
+            body = response['body']
+            self.wfile.write(body if isinstance(body, bytes) else body.encode('utf-8'))
+
+    def send_chunked(self, response):
+        """以 Transfer-Encoding: chunked 逐块发送响应体"""
+        # 分块传输需要HTTP/1.1，发送完成后关闭连接
+        self.protocol_version = 'HTTP/1.1'
+        self.close_connection = True
+        self.send_response(response.get('statusCode', 200))
+        for header, value in response.get('headers', {}).items():
+            self.send_header(header, value)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        
+        for chunk in response['stream']:
+            if not chunk:
+                continue
+            self.wfile.write(f"{len(chunk):X}\r\n".encode('ascii') + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
 
 # 导出处理程序
 handler = Handler
@@ -0,0 +1,117 @@
+from http.server import BaseHTTPRequestHandler
+from typing import Dict, Any, Optional
+from .generate import (
+    default_layout_cache,
+    default_page_cache,
+    generator_from_request,
+    invalid_seed,
+    log_debug
+)
+import base64
+import json
+import traceback
+
+# 请求中参与生成的字段
+JOB_FIELDS = ('text', 'fontSize', 'marginTop', 'marginBottom', 'marginLeft', 'marginRight',
+              'paperSize', 'previewDpi', 'previewAntialias', 'optimizePaths',
+              'simplifyTolerance', 'arcTolerance', 'seed')
+
+
+def render_job_page(data: Dict[str, Any], page: int) -> Optional[Dict[str, Any]]:
+    """生成文档的第 page 页，文档不足 page 页时返回None
+
+    不保存任何任务状态：种子固定后排版是确定的，每次调用重新排版到第 page 页
+    （只排版不渲染，开销很小），再只渲染这一页。因此同一文档的各页请求可以
+    落在不同的无服务器实例上。热实例中行排版和页面输出由进程级缓存复用。
+    """
+    request = {name: data[name] for name in JOB_FIELDS if name in data}
+    generator = generator_from_request(request, layout_cache=default_layout_cache,
+                                       page_cache=default_page_cache)
+    text = request["text"]
+    cursor = None
+    if page > 1:
+        generator.layout_pages(text, page - 1)
+        cursor = generator.layout_cursor
+        if cursor is None:
+            return None
+    result = next(generator.iter_pages(text, 1, cursor=cursor))
+    next_cursor = generator.layout_cursor
+    return {
+        "status": "success",
+        "page": result["page"],
+        "seed": generator.seed_for(text),
+        "previewBase64": base64.b64encode(result["previewPng"]).decode('utf-8'),
+        "gcodeContent": result["gcodeContent"],
+        "hasMore": next_cursor is not None,
+        "progress": next_cursor["offset"] / len(text) if next_cursor is not None else 1.0
+    }
+
+
+def _json_response(status_code: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+    response_headers = {
+        "Content-Type": "application/json; charset=utf-8",
+        "Access-Control-Allow-Origin": "*"
+    }
+    response_headers.update(headers or {})
+    return {
+        "statusCode": status_code,
+        "body": json.dumps(payload, ensure_ascii=False),
+        "headers": response_headers
+    }
+
+
+def job_handler(request: Dict[str, Any]) -> Dict[str, Any]:
+    """分页生成API
+
+    POST /api/jobs  {text, ..., seed, page}  生成第 page 页（默认1），返回该页和 hasMore
+
+    超出单次请求页数上限的文档由客户端逐页请求，每次调用只渲染一页，不受函数超时限制。
+    客户端应回传首次响应中的 seed，使各页的抖动与流式响应已收到的页面一致。
+    """
+    try:
+        data = request.get('body') or {}
+        if isinstance(data, str):
+            data = json.loads(data)
+        if not data.get('text'):
+            return _json_response(400, {"status": "error", "error": "empty_text", "message": "文本内容不能为空"})
+        if invalid_seed(data.get('seed')):
+            return _json_response(400, {"status": "error", "error": "invalid_seed",
+                                        "message": "seed必须是不超过2^53-1的非负整数"})
+        page = data.get('page', 1)
+        if isinstance(page, bool) or not isinstance(page, int) or page < 1:
+            return _json_response(400, {"status": "error", "error": "invalid_page", "message": "page必须是正整数"})
+
+        result = render_job_page(data, page)
+        if result is None:
+            return _json_response(404, {"status": "done", "error": "page_not_found", "message": "页码超出文档页数"})
+        return _json_response(200, result)
+    except (ValueError, json.JSONDecodeError) as e:
+        return _json_response(400, {"status": "error", "error": "invalid_request", "message": "无效的请求格式",
+                                    "trace": str(e)})
+    except Exception as e:
+        log_debug(f"分页生成API错误: {str(e)}")
+        return _json_response(500, {"status": "error", "error": "job_failed", "message": "页面生成失败",
+                                    "trace": traceback.format_exc()})
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        content_length = int(self.headers['Content-Length'])
+        post_data = self.rfile.read(content_length)
+        self.send(job_handler({
+            'body': post_data.decode('utf-8'),
+            'headers': dict(self.headers),
+            'method': 'POST',
+            'path': self.path
+        }))
+
+    def send(self, response):
+        self.send_response(response.get('statusCode', 200))
+        for header, value in response.get('headers', {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        if 'body' in response:
+            self.wfile.write(response['body'].encode('utf-8'))
+
+# 导出处理程序
+handler = Handler
@@ -0,0 +1,87 @@
+"""测量生成接口的冷启动与热启动耗时
+
+用法:
+    python scripts/bench_cold_start.py [--runs 5] [--warm 5] [--text TEXT]
+
+每次运行启动一个新的Python进程（相当于一次冷启动的无服务器实例），
+分别记录模块导入、首个请求和之后热请求的耗时，输出各阶段的中位数。
+子进程禁用响应缓存和字形磁盘缓存，避免前一次运行写入 /tmp 的缓存使后续的冷启动变成热缓存；
+预编译的笔画图集属于部署内容，照常使用。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_child(text, warm):
+    """在当前（新启动的）进程中测量并以JSON输出各阶段耗时"""
+    import io
+    from contextlib import redirect_stdout
+
+    sys.path.insert(0, os.path.join(ROOT, 'api', 'python'))
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        import generate
+    imported = time.perf_counter()
+
+    timings = {"import": imported - started, "first": None, "warm": []}
+    with redirect_stdout(io.StringIO()):
+        for i in range(warm + 1):
+            # 每次使用不同的文本，避免命中响应缓存
+            request = {'body': {'text': f"{text}{i}"}, 'headers': {}}
+            t = time.perf_counter()
+            response = generate.handler(request)
+            elapsed = time.perf_counter() - t
+            if response['statusCode'] != 200:
+                raise RuntimeError(response.get('body'))
+            if i == 0:
+                timings["first"] = elapsed
+            else:
+                timings["warm"].append(elapsed)
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='冷启动次数')
+    parser.add_argument('--warm', type=int, default=5, help='每次冷启动后的热请求次数')
+    parser.add_argument('--text', default='こんにちは、お元気ですか。', help='请求文本')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.text, args.warm)
+        return
+
+    env = dict(os.environ, HANDWRITE_DEBUG='0', HANDWRITE_RESPONSE_CACHE_DIR='', HANDWRITE_GLYPH_CACHE_DIR='')
+    results = []
+    for run in range(args.runs):
+        t = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', '--warm', str(args.warm), '--text', args.text],
+            cwd=ROOT, env=env, check=True, capture_output=True, text=True
+        ).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        timings["process"] = time.perf_counter() - t
+        results.append(timings)
+        print(f"run {run + 1}: import {timings['import'] * 1000:.1f}ms, "
+              f"first {timings['first'] * 1000:.1f}ms, "
+              f"warm {statistics.median(timings['warm']) * 1000 if timings['warm'] else 0:.1f}ms")
+
+    print("median:")
+    print(f"  进程总耗时  {statistics.median(r['process'] for r in results) * 1000:.1f}ms")
+    print(f"  模块导入    {statistics.median(r['import'] for r in results) * 1000:.1f}ms")
+    print(f"  首个请求    {statistics.median(r['first'] for r in results) * 1000:.1f}ms")
+    warm = [t for r in results for t in r['warm']]
+    if warm:
+        print(f"  热请求      {statistics.median(warm) * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""测量生产服务器在不同并发下的吞吐量（请求/秒）和延迟
+
+用法:
+    python scripts/bench_server.py [--url http://127.0.0.1:8000] [--concurrency 1,2,4,8] [--requests 40]
+
+未指定 --url 时在空闲端口启动 scripts/serve.py（关闭响应缓存），测量结束后以 SIGTERM 退出，
+同时检验优雅退出。每个请求使用不同的文本，避免命中响应缓存。
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, threads, queue):
+    port = free_port()
+    env = dict(os.environ, HANDWRITE_DEBUG='0', HANDWRITE_RESPONSE_CACHE_DIR='', HANDWRITE_RESPONSE_CACHE_SIZE='0')
+    command = [sys.executable, os.path.join(ROOT, 'scripts', 'serve.py'), '--host', '127.0.0.1', '--port', str(port)]
+    if workers:
+        command += ['--workers', str(workers)]
+    if threads:
+        command += ['--threads', str(threads)]
+    if queue is not None:
+        command += ['--queue', str(queue)]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, text=True)
+    # 等待工作进程预热完成
+    print(process.stdout.readline().strip())
+    return process, f"http://127.0.0.1:{port}"
+
+
+def post(url, body):
+    target = urlparse(url)
+    connection = http.client.HTTPConnection(target.hostname, target.port, timeout=300)
+    try:
+        connection.request('POST', '/api/generate', body=json.dumps(body),
+                           headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def run_level(url, concurrency, requests, text, counter):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                if counter["issued"] >= counter["limit"]:
+                    return
+                counter["issued"] += 1
+                n = counter["next"]
+                counter["next"] += 1
+            t = time.perf_counter()
+            try:
+                status = post(url, {'text': f"{text}{n}"})
+            except OSError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - t
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    counter["issued"] = 0
+    counter["limit"] = requests
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    ok = statuses.get(200, 0)
+    latencies.sort()
+    print(f"concurrency {concurrency:3d}: {ok / elapsed:7.2f} req/s, "
+          f"p50 {statistics.median(latencies) * 1000:7.1f}ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.1f}ms, status {statuses}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='已运行的服务器地址')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='逗号分隔的并发客户端数')
+    parser.add_argument('--requests', type=int, default=40, help='每个并发级别的请求数')
+    parser.add_argument('--text', default='こんにちは、お元気ですか。', help='请求文本')
+    parser.add_argument('--workers', type=int, help='启动服务器时的生成进程数')
+    parser.add_argument('--threads', type=int, help='启动服务器时的连接线程数')
+    parser.add_argument('--queue', type=int, help='启动服务器时的排队上限')
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(args.workers, args.threads, args.queue)
+    counter = {"next": 0}
+    try:
+        for concurrency in [int(value) for value in args.concurrency.split(',')]:
+            run_level(url, concurrency, args.requests, args.text, counter)
+    finally:
+        if process is not None:
+            process.send_signal(signal.SIGTERM)
+            for line in process.stdout:
+                print(line.strip())
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""为内置字体预编译笔画图集
+
+用法:
+    python scripts/build_stroke_atlas.py [--font PATH] [--sizes 6-12] [--charset ascii,jis0208]
+
+对字符集中的每个字符运行 HandwritingGenerator 的笔画提取流程，
+每个字号输出一个 <字体名>.<char_size>.strokes 文件，运行时由生成器内存映射读取。
+
+部署时由 vercel.json 中 Python 函数的 installCommand 调用，图集随 public/fonts 打包进函数
+（中心线笔画：字号8约4.0 MB，7个字号共约31 MB，压缩后约11 MB）。已存在且与字体哈希、字号和
+STROKE_FORMAT_VERSION 一致的图集会被跳过，多个函数入口重复执行构建时不再重新提取。
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'api', 'python'))
+
+with redirect_stdout(io.StringIO()):
+    import generate  # noqa: E402
+
+DEFAULT_FONT = os.path.join(ROOT, 'public', 'fonts', 'しょかきさらり行体.ttf')
+
+
+def ascii_charset():
+    """可打印ASCII字符"""
+    return [chr(c) for c in range(0x20, 0x7f)]
+
+
+def jis0208_charset():
+    """JIS X 0208 字符（假名、汉字及符号），按EUC-JP双字节编码枚举"""
+    chars = []
+    for row in range(0xA1, 0xFF):
+        for cell in range(0xA1, 0xFF):
+            try:
+                chars.append(bytes((row, cell)).decode('euc_jp'))
+            except UnicodeDecodeError:
+                continue
+    return chars
+
+
+CHARSETS = {
+    'ascii': ascii_charset,
+    'jis0208': jis0208_charset,
+}
+
+
+def parse_sizes(value):
+    if '-' in value:
+        low, high = value.split('-', 1)
+        return list(range(int(low), int(high) + 1))
+    return [int(v) for v in value.split(',')]
+
+
+def atlas_up_to_date(path, font_hash, char_size):
+    """图集文件存在且与字体、字号和笔画格式版本一致"""
+    if not os.path.exists(path):
+        return False
+    try:
+        atlas = generate.StrokeAtlas(path)
+    except (OSError, ValueError, generate.struct.error):
+        return False
+    return (atlas.font_hash == font_hash and atlas.char_size == char_size
+            and atlas.version == generate.STROKE_FORMAT_VERSION)
+
+
+def build_atlas(font_path, font_size, chars, out_dir=None):
+    generator = generate.HandwritingGenerator(
+        font_path=font_path, font_size=font_size,
+        glyph_cache=generate.GlyphCache(max_size=0, disk_dir=None))
+    glyphs = generator.get_font_strokes_batch(chars)
+    path = generate.stroke_atlas_path(font_path, generator.char_size, out_dir)
+    generate.write_stroke_atlas(path, generator.font_hash, generator.char_size, glyphs)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='预编译字体笔画图集')
+    parser.add_argument('--font', default=DEFAULT_FONT, help='字体文件路径')
+    parser.add_argument('--sizes', default='6-12', help='字号范围，如 6-12 或 8,10')
+    parser.add_argument('--charset', default='ascii,jis0208',
+                        help=f"字符集，逗号分隔: {', '.join(CHARSETS)}")
+    parser.add_argument('--out-dir', default=None, help='输出目录（默认与字体文件相同）')
+    parser.add_argument('--force', action='store_true', help='重新生成已是最新的图集')
+    args = parser.parse_args(argv)
+
+    generate.DEBUG = False
+    chars = []
+    for name in args.charset.split(','):
+        chars.extend(CHARSETS[name.strip()]())
+    chars = list(dict.fromkeys(chars))
+
+    font_hash = generate.font_file_hash(args.font)
+    for size in parse_sizes(args.sizes):
+        char_size = size * 10
+        path = generate.stroke_atlas_path(args.font, char_size, args.out_dir)
+        if not args.force and atlas_up_to_date(path, font_hash, char_size):
+            print(f"字号 {size}: 已是最新 -> {path}")
+            continue
+        start = time.time()
+        path = build_atlas(args.font, size, chars, args.out_dir)
+        print(f"字号 {size}: {len(chars)} 字符 -> {path} "
+              f"({os.path.getsize(path) / 1024:.0f} KB, {time.time() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
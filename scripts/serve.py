@@ -0,0 +1,412 @@
+"""自托管部署的生产HTTP服务器
+
+用法:
+    python scripts/serve.py [--host 0.0.0.0] [--port 8000] [--workers N] [--threads N] [--queue N]
+
+与 Vercel 函数使用相同的处理程序和路由（/api/generate、/api/jobs、/api/batch），另提供 /healthz。
+连接由有界线程池处理，线程数和排队的连接数都有上限，超出时立即返回503；
+生成在进程池中执行，工作进程启动时预加载字体和图集，之后在请求之间保持字体和字形缓存。
+收到 SIGTERM/SIGINT 后停止接受新连接，等待进行中的请求完成再退出；
+超过 --shutdown-timeout 仍未完成时强制结束工作进程。
+
+流式请求（stream: true）的每一块在工作进程中生成后经队列立即交给父进程，以分块传输发送；
+客户端断开时通知工作进程取消，生成在下一个检查点停止。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import re
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import HTTPServer
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# 字体按工作目录查找
+os.chdir(ROOT)
+# 生产环境默认关闭逐请求的调试输出
+os.environ.setdefault('HANDWRITE_DEBUG', '0')
+
+from api.python import batch, generate, index, jobs  # noqa: E402
+
+# 服务器配置（可通过环境变量或命令行参数调整）
+SERVER_HOST = os.environ.get('HANDWRITE_SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('HANDWRITE_SERVER_PORT', '8000'))
+# 生成进程数
+SERVER_WORKERS = int(os.environ.get('HANDWRITE_SERVER_WORKERS', str(os.cpu_count() or 1)))
+# 同时处理的连接数，默认为进程数的两倍，使请求读写与生成重叠
+SERVER_THREADS = int(os.environ.get('HANDWRITE_SERVER_THREADS', '0'))
+# 等待空闲线程的连接数上限
+SERVER_QUEUE = int(os.environ.get('HANDWRITE_SERVER_QUEUE', '64'))
+# 请求体大小上限（字节）
+SERVER_MAX_BODY = int(os.environ.get('HANDWRITE_SERVER_MAX_BODY', str(8 << 20)))
+# 拒绝请求前读取请求的超时（秒）
+REJECT_READ_TIMEOUT = float(os.environ.get('HANDWRITE_SERVER_REJECT_READ_TIMEOUT', '0.5'))
+# 优雅退出时等待进行中请求的最长时间（秒）
+SERVER_SHUTDOWN_TIMEOUT = float(os.environ.get('HANDWRITE_SERVER_SHUTDOWN_TIMEOUT', '60'))
+# 工作进程启动时生成一次的预热文本，为空时只加载字体
+SERVER_WARMUP_TEXT = os.environ.get('HANDWRITE_SERVER_WARMUP_TEXT', 'あいうえお abc')
+
+ROUTES = {
+    '/api/generate': generate.handler,
+    '/api/jobs': jobs.job_handler,
+    '/api/batch': batch.batch_handler
+}
+
+
+def warm_worker(warmup_text: str) -> None:
+    """工作进程初始化：加载字体、图集和字形，使首个请求不再承担冷启动开销
+
+    工作进程忽略 SIGINT/SIGTERM：终端 Ctrl-C 或 docker stop 会把信号发给整个进程组，
+    退出只由父进程控制，drain() 等待期间进行中的生成不会被中断。
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    generate.get_runtime().preload()
+    generator = generate.generator_from_request({})
+    if warmup_text:
+        generator.process_text(warmup_text)
+
+
+def run_handler(path: str, request: dict, channel=None) -> dict:
+    """在工作进程中调用路由对应的处理程序
+
+    指定 channel 时，流式响应依次放入 ('head', 响应)、若干 ('chunk', 数据) 和 ('end', None)，
+    每块生成后立即可由父进程发送；request['cancelEvent'] 被设置（客户端已断开）时停止生成。
+    未指定 channel 时流式响应在进程内生成完毕后以 chunks 返回。
+    """
+    response = ROUTES[path](request)
+    if 'stream' not in response:
+        return response
+    response = dict(response)
+    stream = response.pop('stream')
+    if channel is None:
+        response['chunks'] = list(stream)
+        return response
+    cancel = request['cancelEvent']
+    channel.put(('head', response))
+    try:
+        for chunk in stream:
+            if cancel.is_set():
+                break
+            channel.put(('chunk', chunk))
+    except generate.GenerationCancelled:
+        pass
+    finally:
+        stream.close()
+        channel.put(('end', None))
+    return {'streamed': True}
+
+
+class RequestHandler(index.Handler):
+    """解析请求并转交工作进程，响应的发送方式与各 Vercel 处理程序一致"""
+
+    server: 'GenerationServer'
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path not in ROUTES:
+            self.send_json(404, {"status": "error", "error": "not_found", "message": "路径不存在"})
+            return
+        content_length = int(self.headers.get('Content-Length') or 0)
+        if content_length > SERVER_MAX_BODY:
+            self.send_json(413, {"status": "error", "error": "body_too_large", "message": "请求体过大"})
+            return
+        body = self.rfile.read(content_length).decode('utf-8')
+        request = {
+            'body': body,
+            'headers': dict(self.headers),
+            'method': 'POST',
+            'path': url.path,
+            'responseFormat': index.negotiate_format(self.headers.get('Accept', ''))
+        }
+        if url.path == '/api/generate' and 'application/json' in self.headers.get('Content-Type', ''):
+            try:
+                request['body'] = json.loads(body)
+            except ValueError:
+                pass
+        if isinstance(request['body'], dict) and request['body'].get('stream'):
+            self.dispatch_stream(url.path, request)
+            return
+        self.dispatch(url.path, request)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/healthz':
+            self.send_json(200, self.server.stats())
+            return
+        self.send_json(404, {"status": "error", "error": "not_found", "message": "路径不存在"})
+
+    def dispatch(self, path: str, request: dict) -> None:
+        try:
+            response = self.server.pool.submit(run_handler, path, request).result()
+        except Exception as e:
+            generate.log_debug(f"工作进程处理失败: {str(e)}")
+            self.send_json(500, {"status": "error", "error": "worker_failed", "message": "服务器内部错误"})
+            return
+        if 'chunks' in response:
+            response['stream'] = iter(response.pop('chunks'))
+            self.send_chunked(response)
+            return
+        self.send_body(response)
+
+    def dispatch_stream(self, path: str, request: dict) -> None:
+        """流式请求：工作进程经每个请求独立的队列逐块交回数据，收到即发送"""
+        manager = self.server.manager
+        channel = manager.Queue()
+        cancel = manager.Event()
+        request['cancelEvent'] = cancel
+        try:
+            future = self.server.pool.submit(run_handler, path, request, channel)
+            kind, response = self.receive(channel, future)
+        except Exception as e:
+            cancel.set()
+            generate.log_debug(f"工作进程处理失败: {str(e)}")
+            self.send_json(500, {"status": "error", "error": "worker_failed", "message": "服务器内部错误"})
+            return
+        if kind == 'response':
+            self.send_body(response)
+            return
+        response['stream'] = self.relay(channel, future, cancel)
+        try:
+            self.send_chunked(response)
+        except (ConnectionError, OSError) as e:
+            # 客户端已断开：relay 关闭时已通知工作进程取消
+            generate.log_debug(f"流式响应中断: {str(e)}")
+            self.close_connection = True
+
+    @staticmethod
+    def receive(channel, future, gone=None) -> tuple:
+        """取出工作进程放入队列的下一条消息；处理程序返回了非流式响应时为 ('response', 响应)
+
+        等待期间 gone() 为真（客户端已断开）时返回 ('gone', None)。
+        """
+        while True:
+            try:
+                return channel.get(timeout=0.5)
+            except queue.Empty:
+                if gone is not None and gone():
+                    return 'gone', None
+                if future.done():
+                    response = future.result()
+                    if 'streamed' not in response:
+                        return 'response', response
+                    # 工作进程已结束，队列中剩余的消息一定已到达
+                    try:
+                        return channel.get_nowait()
+                    except queue.Empty:
+                        return 'end', None
+
+    def relay(self, channel, future, cancel):
+        """逐块产出流式响应；写入失败或提前关闭时设置取消标志"""
+        try:
+            while True:
+                kind, chunk = self.receive(channel, future, self.client_gone)
+                if kind == 'gone':
+                    generate.log_debug("客户端已断开，取消流式生成")
+                if kind != 'chunk':
+                    return
+                yield chunk
+        finally:
+            cancel.set()
+
+    def client_gone(self) -> bool:
+        """请求已读完，连接可读且读到EOF即表示客户端已断开"""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            return bool(readable) and not self.connection.recv(1, socket.MSG_PEEK)
+        except OSError:
+            return True
+
+    def send_body(self, response: dict) -> None:
+        self.send_response(response.get('statusCode', 200))
+        for header, value in response.get('headers', {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        if 'body' in response:
+            body = response['body']
+            self.wfile.write(body if isinstance(body, bytes) else body.encode('utf-8'))
+
+    def send_json(self, status_code: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        generate.log_debug(f"{self.address_string()} {format % args}")
+
+
+class GenerationServer(HTTPServer):
+    """连接在有界线程池中处理，生成在进程池中执行
+
+    正在处理和排队的连接总数达到 threads + queue 时，新连接直接收到503。
+    """
+
+    def __init__(self, address, workers: int = SERVER_WORKERS, threads: int = SERVER_THREADS,
+                 queue: int = SERVER_QUEUE, warmup_text: str = SERVER_WARMUP_TEXT):
+        self.request_queue_size = max(queue, 5)
+        super().__init__(address, RequestHandler)
+        workers = max(1, workers)
+        self.threads = threads if threads > 0 else 2 * workers
+        self.capacity = self.threads + max(queue, 0)
+        # 不使用 fork：父进程中已有线程
+        context = multiprocessing.get_context('spawn')
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                        initializer=warm_worker, initargs=(warmup_text,))
+        # 流式请求的数据队列和取消标志，可在工作进程与父进程之间传递
+        self.manager = context.Manager()
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='handwrite-http')
+        self.rejector = ThreadPoolExecutor(max_workers=1, thread_name_prefix='handwrite-reject')
+        self.workers = workers
+        self._lock = threading.Condition()
+        self.pending = 0
+        self.served = 0
+        self.rejected = 0
+        self.started = time.time()
+
+    def warm_up(self) -> None:
+        """等待所有工作进程完成初始化"""
+        futures = [self.pool.submit(os.getpid) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                accepted = False
+            else:
+                self.pending += 1
+                accepted = True
+        if not accepted:
+            self.rejector.submit(self.reject, request)
+            return
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._lock:
+                self.pending -= 1
+                self.served += 1
+                self._lock.notify_all()
+
+    def reject(self, request) -> None:
+        """队列已满：读完请求（不解析）后返回503
+
+        在单独的线程中执行，不阻塞接受连接；先读完请求体，
+        否则关闭时未读数据会使客户端收到RST而读不到503。
+        """
+        body = json.dumps({"status": "error", "error": "overloaded", "message": "服务器繁忙，请稍后重试"},
+                          ensure_ascii=False).encode('utf-8')
+        head = ("HTTP/1.0 503 Service Unavailable\r\n"
+                "Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Retry-After: 1\r\n"
+                "Connection: close\r\n\r\n").encode('ascii')
+        try:
+            request.settimeout(REJECT_READ_TIMEOUT)
+            received = b''
+            while b'\r\n\r\n' not in received and len(received) < 65536:
+                chunk = request.recv(65536)
+                if not chunk:
+                    break
+                received += chunk
+            headers, _, rest = received.partition(b'\r\n\r\n')
+            match = re.search(rb'(?im)^content-length:\s*(\d+)', headers)
+            remaining = min(int(match.group(1)) if match else 0, SERVER_MAX_BODY) - len(rest)
+            while remaining > 0:
+                chunk = request.recv(min(remaining, 65536))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+            request.sendall(head + body)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "status": "ok",
+                "workers": self.workers,
+                "threads": self.threads,
+                "capacity": self.capacity,
+                "pending": self.pending,
+                "served": self.served,
+                "rejected": self.rejected,
+                "uptime": round(time.time() - self.started, 1)
+            }
+
+    def drain(self, timeout: float = SERVER_SHUTDOWN_TIMEOUT) -> bool:
+        """等待进行中的请求完成后关闭线程池和进程池，超时返回False
+
+        进程池的关闭也计入同一超时：工作进程忽略 SIGTERM（见 warm_worker），
+        到期仍在运行的工作进程被强制结束，进行中的请求收到500或连接中断。
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            while self.pending and time.time() < deadline:
+                self._lock.wait(deadline - time.time())
+            drained = self.pending == 0
+        # ProcessPoolExecutor 没有公开工作进程，关闭前取出以便超时后结束
+        processes = list((self.pool._processes or {}).values())
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.join(max(deadline - time.time(), 0))
+        stuck = [process for process in processes if process.is_alive()]
+        for process in stuck:
+            process.kill()
+        for process in stuck:
+            process.join()
+        self.executor.shutdown(wait=drained)
+        self.rejector.shutdown(wait=drained)
+        self.manager.shutdown()
+        return drained and not stuck
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='生成进程数')
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help='同时处理的连接数（默认为进程数的两倍）')
+    parser.add_argument('--queue', type=int, default=SERVER_QUEUE, help='等待处理的连接数上限')
+    parser.add_argument('--shutdown-timeout', type=float, default=SERVER_SHUTDOWN_TIMEOUT)
+    args = parser.parse_args()
+
+    server = GenerationServer((args.host, args.port), args.workers, args.threads, args.queue)
+    server.warm_up()
+
+    def stop(signum, frame):
+        # shutdown() 会等待 serve_forever 退出，不能在其所在线程中直接调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"listening on http://{args.host}:{args.port} "
+          f"({server.workers} workers, {server.threads} threads, capacity {server.capacity})", flush=True)
+    server.serve_forever()
+    server.server_close()
+    print(f"shutting down, waiting for {server.pending} requests", flush=True)
+    drained = server.drain(args.shutdown_timeout)
+    print("stopped" if drained else "stopped (timed out waiting for requests)", flush=True)
+
+
+if __name__ == '__main__':
+    main()
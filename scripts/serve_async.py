@@ -0,0 +1,285 @@
+"""基于 asyncio 的生成服务：客户端断开即取消生成，并限制每个客户端的并发数
+
+用法:
+    python scripts/serve_async.py [--host 0.0.0.0] [--port 8000] [--workers N] [--client-limit 2]
+
+提供 POST /api/generate（与 Vercel 函数相同的请求和响应格式）和 GET /healthz。
+生成在线程池中执行，事件循环同时监视连接：客户端断开（例如前端中止了过期的请求）时
+设置取消标志，生成在下一个行或页之间的检查点停止，不再占用当前请求需要的CPU。
+流式请求每输出一页检查一次连接。
+
+客户端以 X-Client-Id 头区分，没有时使用对端地址（--trust-forwarded 时使用 X-Forwarded-For）。
+同一客户端进行中的请求达到上限时，新请求最多等待 --client-wait 秒，仍无空位则返回429。
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# 字体按工作目录查找
+os.chdir(ROOT)
+# 生产环境默认关闭逐请求的调试输出
+os.environ.setdefault('HANDWRITE_DEBUG', '0')
+
+from api.python import generate, index  # noqa: E402
+
+# 服务配置（可通过环境变量或命令行参数调整）
+ASYNC_HOST = os.environ.get('HANDWRITE_ASYNC_HOST', '0.0.0.0')
+ASYNC_PORT = int(os.environ.get('HANDWRITE_ASYNC_PORT', '8000'))
+# 生成线程数
+ASYNC_WORKERS = int(os.environ.get('HANDWRITE_ASYNC_WORKERS', str(os.cpu_count() or 1)))
+# 每个客户端同时进行的请求数
+CLIENT_LIMIT = int(os.environ.get('HANDWRITE_CLIENT_LIMIT', '2'))
+# 客户端请求数达到上限时等待空位的时间（秒），覆盖前端中止旧请求到服务端察觉断开之间的间隔
+CLIENT_WAIT = float(os.environ.get('HANDWRITE_CLIENT_WAIT', '2'))
+# 请求体大小上限（字节）
+ASYNC_MAX_BODY = int(os.environ.get('HANDWRITE_ASYNC_MAX_BODY', str(8 << 20)))
+
+STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+               429: 'Too Many Requests', 500: 'Internal Server Error'}
+
+
+def call_handler(request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """在线程池中调用处理程序；生成被取消时返回None"""
+    try:
+        return generate.handler(request)
+    except generate.GenerationCancelled:
+        return None
+
+
+def next_chunk(stream) -> Optional[bytes]:
+    """在线程池中生成流式响应的下一块；结束或被取消时返回None"""
+    try:
+        return next(stream)
+    except (StopIteration, generate.GenerationCancelled):
+        return None
+
+
+class ClientLimiter:
+    """按客户端限制同时进行的请求数，空闲客户端的计数会被移除"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active: Dict[str, int] = {}
+        self.released = asyncio.Condition()
+
+    async def acquire(self, client: str, timeout: float) -> bool:
+        async with self.released:
+            try:
+                await asyncio.wait_for(
+                    self.released.wait_for(lambda: self.active.get(client, 0) < self.limit), timeout)
+            except asyncio.TimeoutError:
+                return False
+            self.active[client] = self.active.get(client, 0) + 1
+            return True
+
+    async def release(self, client: str) -> None:
+        async with self.released:
+            self.active[client] -= 1
+            if not self.active[client]:
+                del self.active[client]
+            self.released.notify_all()
+
+
+class GenerateService:
+    def __init__(self, workers: int = ASYNC_WORKERS, client_limit: int = CLIENT_LIMIT,
+                 client_wait: float = CLIENT_WAIT, trust_forwarded: bool = False):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='handwrite-generate')
+        self.workers = max(1, workers)
+        self.limiter = ClientLimiter(client_limit)
+        self.client_wait = client_wait
+        self.trust_forwarded = trust_forwarded
+        self.stats = {"completed": 0, "cancelled": 0, "rejected": 0, "inFlight": 0}
+        self.started = time.time()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                method, path, headers, body = await self.read_request(reader)
+            except ValueError as e:
+                await self.send_json(writer, 413 if str(e) == 'body_too_large' else 400,
+                                     {"status": "error", "error": str(e), "message": "无效的请求"})
+                return
+            if method == 'GET' and path == '/healthz':
+                await self.send_json(writer, 200, self.health())
+                return
+            if method != 'POST' or path != '/api/generate':
+                await self.send_json(writer, 404, {"status": "error", "error": "not_found", "message": "路径不存在"})
+                return
+
+            client = self.client_id(headers, writer)
+            if not await self.limiter.acquire(client, self.client_wait):
+                self.stats["rejected"] += 1
+                await self.send_json(writer, 429, {"status": "error", "error": "too_many_requests",
+                                                   "message": "该客户端进行中的请求过多"}, {"Retry-After": "1"})
+                return
+            self.stats["inFlight"] += 1
+            try:
+                await self.generate(reader, writer, headers, body)
+            finally:
+                self.stats["inFlight"] -= 1
+                await self.limiter.release(client)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def generate(self, reader, writer, headers: Dict[str, str], body: str) -> None:
+        cancel = threading.Event()
+        request = {
+            'body': body,
+            'headers': headers,
+            'method': 'POST',
+            'path': '/api/generate',
+            'responseFormat': index.negotiate_format(headers.get('accept', '')),
+            'cancelEvent': cancel
+        }
+        if 'application/json' in headers.get('content-type', ''):
+            try:
+                request['body'] = json.loads(body)
+            except ValueError:
+                pass
+
+        loop = asyncio.get_running_loop()
+        # 响应使用 Connection: close，请求之后读到EOF即表示客户端已断开
+        disconnected = asyncio.ensure_future(self.wait_disconnect(reader))
+        try:
+            work = loop.run_in_executor(self.executor, call_handler, request)
+            await asyncio.wait({work, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not work.done():
+                cancel.set()
+            response = await work
+            if response is None or cancel.is_set():
+                self.stats["cancelled"] += 1
+                return
+
+            if 'stream' not in response:
+                self.stats["completed"] += 1
+                body = response.get('body', b'')
+                await self.send(writer, response.get('statusCode', 200), response.get('headers', {}),
+                                body if isinstance(body, bytes) else body.encode('utf-8'))
+                return
+
+            stream = response['stream']
+            writer.write(self.head(response.get('statusCode', 200),
+                                   dict(response.get('headers', {}), **{"Transfer-Encoding": "chunked"})))
+            while True:
+                chunk = loop.run_in_executor(self.executor, next_chunk, stream)
+                await asyncio.wait({chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    cancel.set()
+                chunk = await chunk
+                if cancel.is_set():
+                    # 生成器停在检查点或已结束，在线程池中关闭以免与事件循环并发执行
+                    await loop.run_in_executor(self.executor, stream.close)
+                    self.stats["cancelled"] += 1
+                    return
+                if chunk is None:
+                    break
+                writer.write(f"{len(chunk):X}\r\n".encode('ascii') + chunk + b"\r\n")
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+            self.stats["completed"] += 1
+        except (asyncio.CancelledError, ConnectionError):
+            # 服务停止或写入时连接断开
+            cancel.set()
+            raise
+        finally:
+            disconnected.cancel()
+
+    @staticmethod
+    async def wait_disconnect(reader: asyncio.StreamReader) -> None:
+        while await reader.read(4096):
+            pass
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str], str]:
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise ValueError('headers_too_large')
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise ValueError('invalid_request_line')
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length') or 0)
+        if length > ASYNC_MAX_BODY:
+            raise ValueError('body_too_large')
+        body = await reader.readexactly(length) if length else b''
+        return method, target.split('?', 1)[0], headers, body.decode('utf-8')
+
+    def client_id(self, headers: Dict[str, str], writer: asyncio.StreamWriter) -> str:
+        if headers.get('x-client-id'):
+            return 'id:' + headers['x-client-id']
+        if self.trust_forwarded and headers.get('x-forwarded-for'):
+            return headers['x-forwarded-for'].split(',')[0].strip()
+        peer = writer.get_extra_info('peername')
+        return peer[0] if peer else 'unknown'
+
+    def health(self) -> Dict[str, Any]:
+        return dict(self.stats, status="ok", workers=self.workers, clients=len(self.limiter.active),
+                    uptime=round(time.time() - self.started, 1))
+
+    @staticmethod
+    def head(status_code: int, headers: Dict[str, str]) -> bytes:
+        lines = [f"HTTP/1.1 {status_code} {STATUS_TEXT.get(status_code, '')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines += ["Connection: close", "", ""]
+        return '\r\n'.join(lines).encode('utf-8')
+
+    async def send(self, writer: asyncio.StreamWriter, status_code: int, headers: Dict[str, str],
+                   body: bytes) -> None:
+        writer.write(self.head(status_code, dict(headers, **{"Content-Length": str(len(body))})) + body)
+        await writer.drain()
+
+    async def send_json(self, writer: asyncio.StreamWriter, status_code: int, payload: Dict[str, Any],
+                        headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        await self.send(writer, status_code, dict({"Content-Type": "application/json; charset=utf-8",
+                                                   "Access-Control-Allow-Origin": "*"}, **(headers or {})), body)
+
+
+async def serve(args) -> None:
+    service = GenerateService(args.workers, args.client_limit, args.client_wait, args.trust_forwarded)
+    # 预加载字体，使首个请求不再承担冷启动开销
+    await asyncio.get_running_loop().run_in_executor(service.executor, generate.get_runtime().preload)
+    server = await asyncio.start_server(service.handle, args.host, args.port)
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+    print(f"listening on http://{args.host}:{args.port} ({service.workers} workers, "
+          f"{service.limiter.limit} requests per client)", flush=True)
+    async with server:
+        await stop.wait()
+    print("stopped", flush=True)
+    service.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=ASYNC_HOST)
+    parser.add_argument('--port', type=int, default=ASYNC_PORT)
+    parser.add_argument('--workers', type=int, default=ASYNC_WORKERS, help='生成线程数')
+    parser.add_argument('--client-limit', type=int, default=CLIENT_LIMIT, help='每个客户端同时进行的请求数')
+    parser.add_argument('--client-wait', type=float, default=CLIENT_WAIT, help='等待客户端空位的时间（秒）')
+    parser.add_argument('--trust-forwarded', action='store_true', help='以 X-Forwarded-For 识别客户端')
+    args = parser.parse_args()
+    asyncio.run(serve(args))
+
+
+if __name__ == '__main__':
+    main()
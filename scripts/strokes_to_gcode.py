@@ -0,0 +1,51 @@
+"""将二进制笔画文件（.hws）展开为G代码
+
+用法:
+    python scripts/strokes_to_gcode.py [INPUT] [-o OUTPUT] [--chunk 65536]
+
+INPUT 省略或为 - 时从标准输入读取。数据按块流式解码，每收到完整的笔画即输出对应的G代码，
+适合绘图机代理边接收边下发。
+"""
+import argparse
+import io
+import os
+import sys
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'api', 'python'))
+
+with redirect_stdout(io.StringIO()):
+    import generate  # noqa: E402
+
+
+def read_chunks(stream, size):
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?', default='-', help='二进制笔画文件')
+    parser.add_argument('-o', '--output', default='-', help='G代码输出文件')
+    parser.add_argument('--chunk', type=int, default=65536, help='每次读取的字节数')
+    args = parser.parse_args()
+
+    source = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        for text in generate.iter_strokes_gcode(read_chunks(source, args.chunk)):
+            target.write(text)
+            target.flush()
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,6 @@
 "use client";
 
-import { useState } from 'react';
+import { useRef, useState } from 'react';
 import { useClientSettingsStore } from '@/lib/store/client-store';
 
 /**
@@ -31,9 +31,81 @@ const extractErrorFromHtml = (html: string): string => {
   }
 };
 
+/**
+ * 逐行读取NDJSON流式响应，每解析出一条记录就回调一次
+ */
+const readNdjsonStream = async (
+  response: Response,
+  onRecord: (record: any) => void
+): Promise<void> => {
+  if (!response.body) {
+    throw new Error('服务器返回了空响应');
+  }
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder('utf-8');
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let newlineIndex = buffer.indexOf('\n');
+    while (newlineIndex >= 0) {
+      const line = buffer.slice(0, newlineIndex).trim();
+      buffer = buffer.slice(newlineIndex + 1);
+      if (line) {
+        onRecord(JSON.parse(line));
+      }
+      newlineIndex = buffer.indexOf('\n');
+    }
+  }
+
+  buffer += decoder.decode();
+  if (buffer.trim()) {
+    onRecord(JSON.parse(buffer.trim()));
+  }
+};
+
+/**
+ * 超出单次请求页数上限的文档通过分页生成API逐页获取：
+ * 每次请求只生成一页，服务端不保存任务状态，各页请求可落在不同实例上。
+ * 从 startPage 开始请求，已收到的页面不会重新生成
+ */
+const fetchJobPages = async (
+  params: Record<string, unknown>,
+  startPage: number,
+  onPage: (record: any) => void,
+  signal?: AbortSignal
+): Promise<void> => {
+  for (let page = startPage; ; page += 1) {
+    const response = await fetch('/api/jobs', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ ...params, page }),
+      signal
+    });
+    const data = await response.json();
+    if (response.status === 404 && data.status === 'done') {
+      return;
+    }
+    if (!response.ok) {
+      throw new Error(`${data.message || '生成预览失败'}\n详细信息: ${data.trace || data.error || '无详细错误信息'}`);
+    }
+    onPage(data);
+    if (!data.hasMore) {
+      return;
+    }
+  }
+};
+
 export const usePreviewGenerator = () => {
   const [isGenerating, setIsGenerating] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  // 上一次生成使用的抖动种子，增量模式下回传以复用未变化的行和页面
+  const seedRef = useRef<number | null>(null);
+  // 进行中的请求；新的生成开始时中止旧请求，服务端随即停止生成过期的内容
+  const requestRef = useRef<AbortController | null>(null);
   const { 
     text, 
     fontSize, 
@@ -52,6 +124,10 @@ export const usePreviewGenerator = () => {
       return;
     }
 
+    requestRef.current?.abort();
+    const controller = new AbortController();
+    requestRef.current = controller;
+
     setIsGenerating(true);
     setError(null);
     setPreviewUrls([]);
@@ -69,7 +145,6 @@ export const usePreviewGenerator = () => {
       });
 
       // 增加超时时间到60秒
-      const controller = new AbortController();
       const timeoutId = setTimeout(() => controller.abort(), 60000);
 
       try {
@@ -85,13 +160,76 @@ export const usePreviewGenerator = () => {
             marginBottom,
             marginLeft,
             marginRight,
-            paperSize
+            paperSize,
+            stream: true,
+            incremental: true,
+            ...(seedRef.current !== null ? { seed: seedRef.current } : {})
           }),
           signal: controller.signal
         });
 
-        clearTimeout(timeoutId); // 清除超时
         console.log('API响应状态:', response.status);
+
+        // 流式响应：每页完成后立即显示
+        const contentType = response.headers.get('Content-Type') || '';
+        if (response.ok && contentType.includes('application/x-ndjson')) {
+          const previewUrls: string[] = [];
+          const gcodeUrls: string[] = [];
+          let finished = false;
+          let truncated = false;
+
+          await readNdjsonStream(response, (record) => {
+            if (record.type === 'page') {
+              previewUrls.push(`data:image/png;base64,${record.previewBase64}`);
+              gcodeUrls.push(record.gcodeContent);
+              setPreviewUrls([...previewUrls]);
+              setGcodeUrls([...gcodeUrls]);
+              console.log('收到预览页:', record.page);
+            } else if (record.type === 'error') {
+              throw new Error(`${record.message || '生成预览失败'}\n详细信息: ${record.trace || '无详细错误信息'}`);
+            } else if (record.type === 'done') {
+              finished = true;
+              truncated = Boolean(record.truncated);
+              if (typeof record.seed === 'number') {
+                seedRef.current = record.seed;
+              }
+            }
+          });
+
+          clearTimeout(timeoutId); // 清除超时
+          if (!finished) {
+            throw new Error('服务器响应在完成前中断');
+          }
+
+          // 剩余页面由任务API分块生成，种子相同保证与已收到的页面衔接
+          if (truncated) {
+            await fetchJobPages(
+              {
+                text,
+                fontSize,
+                marginTop,
+                marginBottom,
+                marginLeft,
+                marginRight,
+                paperSize,
+                seed: seedRef.current
+              },
+              previewUrls.length + 1,
+              (record) => {
+                previewUrls.push(`data:image/png;base64,${record.previewBase64}`);
+                gcodeUrls.push(record.gcodeContent);
+                setPreviewUrls([...previewUrls]);
+                setGcodeUrls([...gcodeUrls]);
+                console.log('收到预览页:', record.page);
+              },
+              controller.signal
+            );
+          }
+          console.log('预览生成成功，页数:', previewUrls.length);
+          return;
+        }
+
+        clearTimeout(timeoutId); // 清除超时
         
         // 检查响应是否为空
         let responseText = '';
@@ -140,6 +278,10 @@ export const usePreviewGenerator = () => {
           throw new Error('服务器返回了空数据');
         }
 
+        if (typeof data.seed === 'number') {
+          seedRef.current = data.seed;
+        }
+
         // 检查是否有预览数据
         if (data.previewBase64) {
           // 处理单页或多页预览
@@ -167,18 +309,29 @@ export const usePreviewGenerator = () => {
       } catch (error) {
         const fetchError = error as Error;
         if (fetchError && fetchError.name === 'AbortError') {
+          // 被更新的请求取代：不显示错误，由新请求更新状态
+          if (requestRef.current !== controller) {
+            console.log('已取消过期的预览请求');
+            return;
+          }
           throw new Error('请求超时，请稍后重试');
         }
         throw fetchError;
       }
     } catch (err) {
+      if (requestRef.current !== controller) {
+        return;
+      }
       console.error('预览生成错误:', err);
       // 显示完整的错误信息，包括堆栈跟踪
       const errorMessage = err instanceof Error ? err.message : '生成预览时发生未知错误';
       const errorStack = err instanceof Error && err.stack ? `\n堆栈: ${err.stack}` : '';
       setError(`${errorMessage}${errorStack}`);
     } finally {
-      setIsGenerating(false);
+      if (requestRef.current === controller) {
+        requestRef.current = null;
+        setIsGenerating(false);
+      }
     }
   };
 
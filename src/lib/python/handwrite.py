@@ -2,10 +2,17 @@ import numpy as np
 import cv2
 from svgwrite import Drawing
 import os
+import functools
 from PIL import Image, ImageDraw, ImageFont
 from skimage.morphology import skeletonize
 import random  # 追加
 
+
+@functools.lru_cache(maxsize=None)
+def load_font(font_path, size):
+    """フォントを (パス, サイズ) ごとに一度だけ読み込み、プロセス内で共有"""
+    return ImageFont.truetype(font_path, size)
+
 class StrokeWriter:
     def __init__(self):
         # A4レイアウト設定（mm単位）
@@ -66,7 +73,7 @@ class StrokeWriter:
         img_size = (self.char_size * 2, self.char_size * 2)
         image = Image.new('L', img_size, 255)
         draw = ImageDraw.Draw(image)
-        font = ImageFont.truetype(font_path, self.char_size)
+        font = load_font(font_path, self.char_size)
         
         bbox = draw.textbbox((0, 0), char, font=font)
         text_width = bbox[2] - bbox[0]
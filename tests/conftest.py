@@ -0,0 +1,11 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# 测试不输出调试信息，也不读写磁盘上的字形和响应缓存
+os.environ.setdefault('HANDWRITE_DEBUG', '0')
+os.environ['HANDWRITE_GLYPH_CACHE_DIR'] = ''
+os.environ['HANDWRITE_RESPONSE_CACHE_DIR'] = ''
+
+FONT_PATH = os.path.join(ROOT, 'public', 'fonts', 'しょかきさらり行体.ttf')
@@ -0,0 +1,155 @@
+"""fit_arcs 输出的圆弧与原折线的偏差测试"""
+import math
+import os
+
+import numpy as np
+import pytest
+
+from api.python import generate
+from conftest import FONT_PATH
+
+
+def point_segment_distance(px, py, ax, ay, bx, by):
+    """点集到线段集合的最短距离（逐点取最小）"""
+    abx, aby = bx - ax, by - ay
+    length = abx * abx + aby * aby
+    t = ((px[:, None] - ax) * abx + (py[:, None] - ay) * aby) / np.where(length > 0, length, 1)
+    t = np.clip(t, 0, 1)
+    return np.hypot(px[:, None] - (ax + t * abx), py[:, None] - (ay + t * aby)).min(axis=1)
+
+
+def arc_deviation(x, y, command, start, end, cx, cy):
+    """圆弧（按G代码的解释：半径取起点到圆心的距离）与对应折线之间的双向最大距离"""
+    r = math.hypot(x[start] - cx, y[start] - cy)
+    a0 = math.atan2(y[start] - cy, x[start] - cx)
+    a1 = math.atan2(y[end] - cy, x[end] - cx)
+    sweep = (a1 - a0) % (2 * math.pi)
+    if command == "G2":
+        sweep -= 2 * math.pi
+    angles = a0 + sweep * np.linspace(0, 1, 256)
+    ax, ay = cx + r * np.cos(angles), cy + r * np.sin(angles)
+    px, py = x[start:end + 1], y[start:end + 1]
+    arc_to_line = point_segment_distance(ax, ay, px[:-1], py[:-1], px[1:], py[1:]).max()
+    # 折线上密集采样的点到圆弧的距离
+    t = np.linspace(0, 1, 32)[:, None]
+    sx = (px[:-1] + t * (px[1:] - px[:-1])).ravel()
+    sy = (py[:-1] + t * (py[1:] - py[:-1])).ravel()
+    line_to_arc = point_segment_distance(sx, sy, ax[:-1], ay[:-1], ax[1:], ay[1:]).max()
+    return max(arc_to_line, line_to_arc)
+
+
+def max_arc_deviation(x, y, tolerance):
+    segments = generate.fit_arcs(x, y, tolerance)
+    worst = 0.0
+    start = 0
+    for command, end, cx, cy in segments:
+        if command != "G1":
+            worst = max(worst, arc_deviation(x, y, command, start, end, cx, cy))
+        start = end
+    assert start == len(x) - 1
+    return segments, worst
+
+
+def test_corner_is_not_an_arc():
+    x = np.array([0.0, 1.0, 2.0])
+    y = np.array([0.0, 10.0, 0.0])
+    segments = generate.fit_arcs(x, y, 0.1)
+    assert [command for command, *_ in segments] == ["G1", "G1"]
+
+
+def test_straight_run_is_not_an_arc():
+    x = np.linspace(0, 20, 21)
+    y = np.zeros_like(x)
+    y[10] = 0.3
+    segments, worst = max_arc_deviation(x, y, 0.1)
+    assert worst <= 0.1 + 1e-6
+
+
+@pytest.mark.parametrize('clockwise', [False, True])
+def test_circle_is_one_arc(clockwise):
+    angles = np.linspace(0, 1.5 * math.pi, 60)
+    if clockwise:
+        angles = -angles
+    x = 3 + 10 * np.cos(angles)
+    y = -2 + 10 * np.sin(angles)
+    segments = generate.fit_arcs(x, y, 0.05)
+    assert len(segments) == 1
+    command, end, cx, cy = segments[0]
+    assert command == ("G2" if clockwise else "G3")
+    assert end == len(x) - 1
+    assert cx == pytest.approx(3) and cy == pytest.approx(-2)
+
+
+def test_noisy_curves_stay_within_tolerance():
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        count = int(rng.integers(3, 80))
+        steps = rng.normal(0, 0.4, count).cumsum()
+        x = np.cumsum(np.cos(steps)) + rng.normal(0, 0.02, count)
+        y = np.cumsum(np.sin(steps)) + rng.normal(0, 0.02, count)
+        for tolerance in (0.05, 0.1, 0.5):
+            _, worst = max_arc_deviation(x, y, tolerance)
+            assert worst <= tolerance + 1e-6
+
+
+@pytest.mark.skipif(not os.path.exists(FONT_PATH), reason='内置字体不存在')
+@pytest.mark.parametrize('tolerance', [0.1, 0.5])
+def test_page_arcs_stay_within_tolerance(tolerance):
+    generator = generate.HandwritingGenerator(font_path=FONT_PATH, seed=7, arc_tolerance=tolerance)
+    generator.render_page(generator.layout_pages("永遠の手書き文字、あいうえお ABC abc", 1)[0])
+    arcs = 0
+    for stroke in generator.page.strokes():
+        x, y = generator.convert_to_center_coordinates(stroke[:, 0], stroke[:, 1])
+        segments, worst = max_arc_deviation(np.asarray(x, dtype=float), np.asarray(y, dtype=float), tolerance)
+        arcs += sum(command != "G1" for command, *_ in segments)
+        assert worst <= tolerance + 1e-6
+    if tolerance >= 0.5:
+        assert arcs > 0
+
+
+def parse_arcs(gcode):
+    """从G代码中取出每条圆弧的 (起点, 终点, 圆心, 指令)"""
+    arcs = []
+    position = None
+    for line in gcode.splitlines():
+        words = dict((word[0], word[1:]) for word in line.split()[1:] if word[0] in 'XYIJ')
+        if 'X' not in words:
+            continue
+        target = (float(words['X']), float(words['Y']))
+        if line.startswith(('G2 ', 'G3 ')):
+            center = (position[0] + float(words['I']), position[1] + float(words['J']))
+            arcs.append((position, target, center, line[:2]))
+        position = target
+    return arcs
+
+
+@pytest.mark.skipif(not os.path.exists(FONT_PATH), reason='内置字体不存在')
+def test_arcs_shrink_gcode_at_default_simplify_tolerance():
+    text = "\n".join("永遠の手書き文字、あいうえお ABC abc %d" % i for i in range(6))
+    sizes = {}
+    for tolerance in (0, 0.1):
+        generator = generate.HandwritingGenerator(font_path=FONT_PATH, seed=7, arc_tolerance=tolerance)
+        assert generator.simplify_tolerance == generate.SIMPLIFY_TOLERANCE
+        gcode = generator.render_page(generator.layout_pages(text, 1)[0])["gcodeContent"]
+        sizes[tolerance] = len(gcode)
+    arcs = parse_arcs(gcode)
+    assert len(arcs) > 100
+    assert sizes[0.1] < sizes[0] * 0.95
+
+    # 圆弧拟合在未简化的笔画上进行，圆弧与原始笔画的偏差不超过两个容差之和
+    strokes = []
+    for stroke in generator.page.strokes():
+        x, y = generator.convert_to_center_coordinates(stroke[:, 0], stroke[:, 1])
+        strokes.append((np.asarray(x, dtype=float), np.asarray(y, dtype=float)))
+    limit = generator.simplify_tolerance + generator.arc_tolerance + 0.002
+    for (x0, y0), (x1, y1), (cx, cy), command in arcs[::10]:
+        r = math.hypot(x0 - cx, y0 - cy)
+        a0, a1 = math.atan2(y0 - cy, x0 - cx), math.atan2(y1 - cy, x1 - cx)
+        sweep = (a1 - a0) % (2 * math.pi)
+        if command == "G2":
+            sweep -= 2 * math.pi
+        angles = a0 + sweep * np.linspace(0, 1, 64)
+        ax, ay = cx + r * np.cos(angles), cy + r * np.sin(angles)
+        nearest = min(point_segment_distance(ax, ay, x[:-1], y[:-1], x[1:], y[1:]).max() for x, y in strokes
+                      if np.hypot(x - x0, y - y0).min() < 0.01)
+        assert nearest <= limit
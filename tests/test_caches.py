@@ -0,0 +1,47 @@
+"""内存缓存按总大小淘汰的测试"""
+from api.python import generate
+
+
+def test_lru_cache_bounded_by_bytes():
+    cache = generate.LRUCache(100, max_bytes=10, sizeof=len)
+    cache.put('a', b'xxxx')
+    cache.put('b', b'yyyy')
+    assert cache.bytes == 8
+    cache.put('c', b'zzzz')
+    assert cache.get('a') is None
+    assert cache.get('b') == b'yyyy' and cache.get('c') == b'zzzz'
+    assert cache.bytes == 8
+    # 覆盖已有键时按新值计算大小
+    cache.put('c', b'z')
+    assert cache.bytes == 5
+    # 单个超过上限的值不缓存
+    cache.put('d', b'w' * 11)
+    assert cache.get('d') is None and cache.bytes == 5
+    cache.clear()
+    assert cache.bytes == 0 and len(cache) == 0
+
+
+def test_lru_cache_without_byte_limit():
+    cache = generate.LRUCache(2)
+    for key in 'abc':
+        cache.put(key, key * 1000)
+    assert len(cache) == 2 and cache.get('a') is None
+
+
+def test_response_cache_memory_tier_bounded_by_bytes():
+    cache = generate.ResponseCache(max_size=100, disk_dir=None, max_memory_bytes=5000)
+    result = {"seed": 1, "previewPng": [b'p' * 1000], "gcodeContent": ['g' * 1000]}
+    for key in range(5):
+        cache.put(str(key), result)
+    assert cache.memory.bytes <= 5000
+    assert len(cache.memory) == 2
+    assert cache.get('4') is not None and cache.get('0') is None
+
+
+def test_default_incremental_caches_are_bounded_by_bytes():
+    assert generate.default_page_cache.max_bytes == generate.PAGE_CACHE_MAX_BYTES > 0
+    assert generate.default_layout_cache.max_bytes == generate.LAYOUT_CACHE_MAX_BYTES > 0
+    page = {"page": 1, "previewPng": b'p' * 100, "gcodeContent": 'g' * 400}
+    assert generate.page_payload_bytes(page) == 500
+    layout = ((('あ', 1.0, 2.0), ('い', 3.0, 2.0)), ()), 10.0
+    assert generate.layout_payload_bytes(layout) == 64 + 2 * generate.LAYOUT_GLYPH_BYTES
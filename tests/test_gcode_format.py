@@ -0,0 +1,74 @@
+"""gcode_body_bytes 与逐点格式化 f"{v:.3f}" 的一致性测试"""
+import numpy as np
+import pytest
+
+from api.python import generate
+
+EDGE_VALUES = [
+    0.0, -0.0, 0.0004, -0.0004, 0.0005, -0.0005, 0.0015, -0.0015, 0.0025,
+    1.0005, -1.0005, 2.675, -2.675, 1.2345, 0.1235, 10.0625, -10.0625, 0.9995, -0.9995,
+    9.9995, 99.9995, -99.9995, 149.9995, 297.0, -210.0,
+    12345.6785, -98765.4325, 123456.789, 1e6 + 0.0005, -1e7 + 0.0015
+]
+
+
+def reference_body(x_pos, y_pos, offsets, move_speed, pen_down_z, pen_up_z, pen_speed, arcs=None):
+    lines = []
+    for stroke in range(len(offsets) - 1):
+        start, end = offsets[stroke], offsets[stroke + 1]
+        for index in range(start, end):
+            x, y = x_pos[index], y_pos[index]
+            if index == start:
+                lines.append(f"G0 X{x:.3f} Y{y:.3f} F{move_speed}")
+                lines.append(f"G1 G90 Z{pen_down_z} F{pen_speed}")
+            elif arcs is not None and arcs[0][index] > 1:
+                lines.append(f"G{arcs[0][index]} X{x:.3f} Y{y:.3f} "
+                             f"I{arcs[1][index]:.3f} J{arcs[2][index]:.3f} F{move_speed}")
+            else:
+                lines.append(f"G1 X{x:.3f} Y{y:.3f} F{move_speed}")
+        lines.append(f"G1 G90 Z{pen_up_z} F{pen_speed}")
+    return ''.join(line + '\n' for line in lines)
+
+
+def body(x_pos, y_pos, offsets, arcs=None):
+    return generate.gcode_body_bytes(np.asarray(x_pos), np.asarray(y_pos), np.asarray(offsets),
+                                     3000, -7.0, 5, 20000, arcs).tobytes().decode('ascii')
+
+
+@pytest.mark.parametrize('value', EDGE_VALUES)
+def test_edge_values_match_python_formatting(value):
+    x = [value, -value, value / 3, value * 7]
+    y = [-value, value, value * 1.5, 0.5]
+    offsets = [0, 2, 4]
+    assert body(x, y, offsets) == reference_body(x, y, offsets, 3000, -7.0, 5, 20000)
+
+
+def test_half_thousandths_match_python_formatting():
+    # v*1000 恰好或接近 .5 的值，浮点误差决定舍入方向
+    base = np.arange(-20000, 20000) / 1000
+    x = np.concatenate([base + 0.0005, base - 0.0005, np.nextafter(base + 0.0005, 0),
+                        np.nextafter(base + 0.0005, 1)])
+    y = x[::-1].copy()
+    offsets = np.arange(0, len(x) + 1, 4)
+    assert body(x, y, offsets) == reference_body(x, y, offsets, 3000, -7.0, 5, 20000)
+
+
+def test_random_and_large_coordinates_match_python_formatting():
+    rng = np.random.default_rng(3)
+    x = np.concatenate([rng.uniform(-300, 300, 2000), rng.uniform(-1e7, 1e7, 500),
+                        np.round(rng.uniform(-300, 300, 500), 4)])
+    y = rng.permutation(x)
+    offsets = np.concatenate([[0], np.sort(rng.choice(np.arange(2, len(x) - 1), 300, replace=False)), [len(x)]])
+    offsets = offsets[np.concatenate([[True], np.diff(offsets) >= 2])]
+    offsets[-1] = len(x)
+    assert body(x, y, offsets) == reference_body(x, y, offsets, 3000, -7.0, 5, 20000)
+
+
+def test_arc_rows_match_python_formatting():
+    values = np.array(EDGE_VALUES)
+    x, y = values, values[::-1].copy()
+    offsets = np.array([0, 10, len(values)])
+    command = np.tile([1, 2, 3], len(values))[:len(values)]
+    i, j = -values * 0.5, values + 0.0005
+    arcs = (command, i, j)
+    assert body(x, y, offsets, arcs) == reference_body(x, y, offsets, 3000, -7.0, 5, 20000, arcs)
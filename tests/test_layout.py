@@ -0,0 +1,42 @@
+"""排版分页与续排游标的测试"""
+import json
+
+from api.python import generate
+
+# 默认设置下每页19行
+LINES_PER_PAGE = 19
+
+
+def layout(lines, max_pages=3, trailing=''):
+    generator = generate.generator_from_request({})
+    text = "\n".join("あ" for _ in range(lines)) + trailing
+    return generator, text, generator.layout_pages(text, max_pages)
+
+
+def test_text_ending_at_page_boundary_has_no_cursor():
+    generator, text, pages = layout(3 * LINES_PER_PAGE)
+    assert [len(page["glyphs"]) for page in pages] == [LINES_PER_PAGE] * 3
+    assert generator.layout_cursor is None
+
+
+def test_text_ending_at_page_boundary_has_no_blank_page():
+    generator, _, pages = layout(LINES_PER_PAGE, trailing="\n\n")
+    assert [len(page["glyphs"]) for page in pages] == [LINES_PER_PAGE]
+    assert generator.layout_cursor is None
+
+
+def test_cursor_continues_after_page_boundary():
+    generator, text, pages = layout(3 * LINES_PER_PAGE + 1)
+    cursor = generator.layout_cursor
+    assert cursor is not None and cursor["page"] == 4 and cursor["offset"] < len(text)
+    rest = generator.layout_pages(text, 3, cursor)
+    assert [(page["page"], len(page["glyphs"])) for page in rest] == [(4, 1)]
+    assert generator.layout_cursor is None
+
+
+def test_stream_not_truncated_at_page_boundary():
+    text = "\n".join("あ" for _ in range(3 * LINES_PER_PAGE))
+    response = generate.handler({'body': {'text': text, 'stream': True, 'seed': 1}, 'headers': {}})
+    records = [json.loads(line) for line in b''.join(response['stream']).decode('utf-8').splitlines()]
+    assert [record["type"] for record in records] == ["page"] * 3 + ["done"]
+    assert records[-1]["truncated"] is False
@@ -0,0 +1,27 @@
+"""多进程渲染与串行渲染的输出一致性测试"""
+import os
+
+import pytest
+
+from api.python import generate
+from conftest import FONT_PATH
+
+TEXT = "\n".join(f"第{i}行 手書きの文章です。abc" for i in range(90))
+
+
+def render(workers):
+    generator = generate.HandwritingGenerator(font_path=FONT_PATH, seed=11, workers=workers)
+    return [(page["page"], page["previewPng"], page["gcodeContent"]) for page in generator.iter_pages(TEXT, 3)]
+
+
+@pytest.mark.skipif(not os.path.exists(FONT_PATH), reason='内置字体不存在')
+def test_workers_match_serial_output():
+    if generate.get_render_executor(2) is None:
+        pytest.skip('当前环境不支持多进程')
+    serial = render(1)
+    parallel = render(2)
+    assert len(serial) == 3
+    assert [page for page, _, _ in parallel] == [1, 2, 3]
+    for (_, png, gcode), (_, parallel_png, parallel_gcode) in zip(serial, parallel):
+        assert parallel_gcode == gcode
+        assert parallel_png == png
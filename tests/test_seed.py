@@ -0,0 +1,26 @@
+"""请求种子的校验测试"""
+import json
+
+import pytest
+
+from api.python import generate
+
+
+@pytest.mark.parametrize('seed', [None, 0, 1, generate.SEED_MASK])
+def test_valid_seeds(seed):
+    assert not generate.invalid_seed(seed)
+
+
+@pytest.mark.parametrize('seed', [-1, generate.SEED_MASK + 1, 2 ** 64, 1.5, '3', True])
+def test_invalid_seeds(seed):
+    assert generate.invalid_seed(seed)
+
+
+def test_handler_rejects_seed_beyond_js_precision():
+    response = generate.handler({'body': {'text': 'あ', 'seed': generate.SEED_MASK + 1}, 'headers': {}})
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['error'] == 'invalid_seed'
+
+
+def test_derived_seeds_fit_in_mask():
+    assert all(0 <= generate.derive_seed('text', i) <= generate.SEED_MASK for i in range(100))
@@ -0,0 +1,114 @@
+"""二进制笔画格式的编码/解码往返测试"""
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from api.python import generate, index
+from conftest import FONT_PATH, ROOT
+
+TEXT = "\n".join(f"第{i}行 手書きの文章です。abc XYZ" for i in range(30))
+
+pytestmark = pytest.mark.skipif(not os.path.exists(FONT_PATH), reason='内置字体不存在')
+
+
+def assert_gcode_close(actual, expected, tolerance=0.01):
+    """两段G代码的指令逐行相同，坐标之差不超过 tolerance 毫米"""
+    actual_lines, expected_lines = actual.split('\n'), expected.split('\n')
+    assert len(actual_lines) == len(expected_lines)
+    worst = 0.0
+    for line, reference in zip(actual_lines, expected_lines):
+        words, reference_words = line.split(), reference.split()
+        assert [word[0] for word in words] == [word[0] for word in reference_words]
+        for word, reference_word in zip(words, reference_words):
+            if word[0] in 'XY':
+                worst = max(worst, abs(float(word[1:]) - float(reference_word[1:])))
+            else:
+                assert word == reference_word
+    assert worst <= tolerance
+
+
+@pytest.fixture(scope='module')
+def pages():
+    generator = generate.HandwritingGenerator(font_path=FONT_PATH, seed=5)
+    return generator, list(generator.iter_pages(TEXT, 2))
+
+
+def test_round_trip_matches_gcode_body(pages):
+    generator, rendered = pages
+    for page in rendered:
+        decoded = generate.strokes_to_gcode(page["strokes"])
+        assert_gcode_close(decoded, page["gcodeContent"])
+        # 头部之后的部分即 gcode_body 的输出
+        header = '\n'.join(generator.gcode_header()) + '\n'
+        assert decoded.startswith(header)
+    assert_gcode_close(decoded[len(header):] + '\n', generator.gcode_body(generator.page))
+
+
+def test_chunked_decoding_matches_whole(pages):
+    _, rendered = pages
+    data = b''.join(page["strokes"] for page in rendered)
+    rng = np.random.default_rng(0)
+    cuts = np.sort(rng.choice(np.arange(1, len(data)), 40, replace=False))
+    chunks = [data[start:end] for start, end in zip([0, *cuts], [*cuts, len(data)])]
+    assert ''.join(generate.iter_strokes_gcode(chunks)) == generate.strokes_to_gcode(data)
+    # 多页数据的各页以换行分隔
+    expected = '\n'.join(generate.strokes_to_gcode(page["strokes"]) for page in rendered)
+    assert generate.strokes_to_gcode(data) == expected
+
+
+def test_truncated_data_is_rejected(pages):
+    _, rendered = pages
+    data = rendered[0]["strokes"]
+    with pytest.raises(ValueError):
+        generate.strokes_to_gcode(data[:-3])
+    with pytest.raises(ValueError):
+        generate.strokes_to_gcode(b'')
+
+
+def test_script_matches_gcode_body(pages, tmp_path):
+    _, rendered = pages
+    source = tmp_path / 'page.hws'
+    source.write_bytes(rendered[0]["strokes"])
+    output = subprocess.run([sys.executable, os.path.join(ROOT, 'scripts', 'strokes_to_gcode.py'),
+                             str(source), '--chunk', '97'],
+                            check=True, capture_output=True, env=dict(os.environ, HANDWRITE_DEBUG='0')).stdout
+    assert_gcode_close(output.decode('utf-8'), rendered[0]["gcodeContent"])
+
+
+def test_arc_mode_strokes_are_simplified_polylines():
+    # 圆弧模式下页面保留未简化的笔画，笔画格式只有直线段，编码前先简化
+    generator = generate.HandwritingGenerator(font_path=FONT_PATH, seed=5, arc_tolerance=0.1)
+    page = generator.render_page(generator.layout_pages("あいうえお", 1)[0])
+    simplified = generate.simplify_strokes(generator.page, generator.simplify_tolerance)
+    assert simplified.point_count < generator.page.point_count
+    assert page["strokes"] == generate.encode_strokes(generator, simplified)
+    assert 'G3 ' in page["gcodeContent"] or 'G2 ' in page["gcodeContent"]
+
+
+@pytest.mark.parametrize('accept, expected', [
+    ('', 'json'),
+    ('application/json', 'json'),
+    (generate.STROKES_MEDIA_TYPE, 'strokes'),
+    (f'{generate.STROKES_MEDIA_TYPE}, application/json;q=0.5', 'strokes'),
+    (f'{generate.STROKES_MEDIA_TYPE};q=0.5, application/json', 'json'),
+    (f'{generate.STROKES_MEDIA_TYPE}, {generate.BUNDLE_MEDIA_TYPE}', 'bundle'),
+    (f'{generate.STROKES_MEDIA_TYPE}, {generate.BUNDLE_MEDIA_TYPE};q=0.9', 'strokes'),
+])
+def test_negotiate_format(accept, expected):
+    assert index.negotiate_format(accept) == expected
+
+
+def test_handler_serves_strokes():
+    body = {"text": TEXT, "seed": 5}
+    json_response = generate.handler({"body": json.dumps(body)})
+    strokes_response = generate.handler({"body": json.dumps(body), "responseFormat": 'strokes'})
+    assert strokes_response["statusCode"] == 200
+    assert strokes_response["headers"]["Content-Type"] == generate.STROKES_MEDIA_TYPE
+    assert strokes_response["headers"]["ETag"] != json_response["headers"]["ETag"]
+    assert strokes_response["headers"]["X-Seed"] == "5"
+    gcode_content = json.loads(json_response["body"])["gcodeContent"]
+    assert_gcode_close(generate.strokes_to_gcode(strokes_response["body"]), '\n'.join(gcode_content))
@@ -0,0 +1,83 @@
+"""trace_contours 与原逐像素扫描追踪的输出一致性测试"""
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from api.python import generate
+from conftest import FONT_PATH
+
+
+def reference_trace_contours(binary):
+    """原实现：逐像素光栅扫描，对每个未访问的前景像素做8邻域贪心追踪"""
+    contours = []
+    visited = np.zeros_like(binary, dtype=bool)
+    for i in range(binary.shape[0]):
+        for j in range(binary.shape[1]):
+            if binary[i, j] and not visited[i, j]:
+                contour = _trace_contour(binary, visited, i, j)
+                if len(contour) > 2:
+                    contours.append(np.array(contour))
+    return contours
+
+
+def _trace_contour(binary, visited, start_i, start_j):
+    contour = []
+    i, j = start_i, start_j
+    directions = [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)]
+    dir_idx = 0
+    while True:
+        if visited[i, j]:
+            break
+        visited[i, j] = True
+        contour.append([j, i])
+        found = False
+        for _ in range(8):
+            di, dj = directions[dir_idx]
+            ni, nj = i + di, j + dj
+            if 0 <= ni < binary.shape[0] and 0 <= nj < binary.shape[1]:
+                if binary[ni, nj] and not visited[ni, nj]:
+                    i, j = ni, nj
+                    found = True
+                    break
+            dir_idx = (dir_idx + 1) % 8
+        if not found:
+            break
+    return contour
+
+
+def assert_same_contours(binary):
+    expected = reference_trace_contours(binary)
+    actual = generate.trace_contours(binary)
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        np.testing.assert_array_equal(a, e)
+
+
+@pytest.mark.parametrize('density', [0.05, 0.3, 0.5, 0.8])
+def test_random_bitmaps(density):
+    rng = np.random.default_rng(int(density * 100))
+    for _ in range(20):
+        shape = tuple(rng.integers(1, 40, size=2))
+        assert_same_contours(rng.random(shape) < density)
+
+
+def test_edge_cases():
+    assert_same_contours(np.zeros((0, 0), dtype=bool))
+    assert_same_contours(np.zeros((5, 5), dtype=bool))
+    assert_same_contours(np.ones((5, 5), dtype=bool))
+    assert_same_contours(np.eye(6, dtype=bool))
+    assert_same_contours(np.array([[1, 1, 0, 1]], dtype=bool))
+
+
+@pytest.mark.skipif(not os.path.exists(FONT_PATH), reason='内置字体不存在')
+def test_glyph_bitmaps():
+    font = ImageFont.truetype(FONT_PATH, 80)
+    chars = 'Aagk@#あいうえおカタ永書漢字、。'
+    for char in chars:
+        image = Image.new('L', (160, 160), 255)
+        draw = ImageDraw.Draw(image)
+        bbox = draw.textbbox((0, 0), char, font=font)
+        draw.text(((160 - bbox[2] + bbox[0]) // 2, (160 - bbox[3] + bbox[1]) // 2), char, font=font, fill=0)
+        assert_same_contours(np.array(image) < 128)